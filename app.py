@@ -1,13 +1,15 @@
 # gradio_app.py
+import os
+import asyncio
 import gradio as gr
-import nest_asyncio
-nest_asyncio.apply()
-from src.query import query
+from src.query import query_stream
+from src.kb_retrieval.page_image_store import get_page_image_store, load_image_urls
+from src.kb_construction.connection import get_connection_manager, close_connection_manager
 
-def qa_pipeline(user_input):
-    import asyncio
-    answer, _ = asyncio.run(query(user_input))
-    return answer
+async def qa_pipeline(user_input):
+    # async generator -> Gradio streams every yielded value into the output box
+    async for answer, _ in query_stream(user_input):
+        yield answer
 
 demo = gr.Interface(
     fn=qa_pipeline,
@@ -15,5 +17,20 @@ demo = gr.Interface(
     outputs=gr.Textbox(label="Answer"),
     title="Knowledge Base Q&A Chatbot"
 )
+demo.queue(default_concurrency_limit=int(os.getenv("APP_CONCURRENCY", "16")))
 
-demo.launch()
\ No newline at end of file
+# fail fast if Neo4j is unreachable; the async pool used by `query` fills on the first requests
+connection = get_connection_manager()
+if not connection.health_check():
+    raise SystemExit("Neo4j is unreachable, check NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD / NEO4J_DATABASE")
+connection.warmup(num_connections=int(os.getenv("NEO4J_WARMUP_CONNECTIONS", "4")))
+if os.getenv("PREFETCH_PAGE_IMAGES", "1") == "1":
+    # best effort: pages that cannot be warmed now are loaded on their first request
+    try:
+        asyncio.run(get_page_image_store().prefetch(load_image_urls(os.getenv("IMAGE_DICT_PATH", "data/image_dict.json"))))
+    except Exception as e:
+        print(f"Page image prefetch skipped: {type(e).__name__}: {e}")
+try:
+    demo.launch()
+finally:
+    close_connection_manager()
@@ -0,0 +1,70 @@
+"""
+Recall@k against exact search and QPS of IVFPQIndex on synthetic clustered corpora.
+
+    python -m benchmarks.ann_index --sizes 10000 100000 1000000 --dim 128 --nprobe 4 16 64
+
+Vectors are drawn around random cluster centres (like embeddings of many related textbooks) and
+normalised; ground truth comes from ExactVectorIndex on the same data.
+"""
+import time
+import argparse
+
+import numpy as np
+
+from src.kb_retrieval.ann_index import build_ivfpq_index
+from src.kb_retrieval.local_vector_index import ExactVectorIndex, _normalise
+
+
+def synthetic_corpus(size: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100_000):
+        end = min(size, start + 100_000)
+        labels = rng.integers(0, clusters, end - start)
+        data[start:end] = centres[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    return _normalise(data)
+
+
+def recall_at_k(expected: np.ndarray, got: np.ndarray) -> float:
+    return float(np.mean([len(set(e) & set(g)) / len(e) for e, g in zip(expected.tolist(), got.tolist())]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--refine-factor", type=int, default=10, help="0 disables exact re-scoring")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        corpus = synthetic_corpus(size, args.dim, clusters=max(10, size // 1000), rng=rng)
+        queries = _normalise(corpus[rng.choice(size, args.queries, replace=False)]
+                             + 0.1 * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+
+        exact = ExactVectorIndex(corpus)
+        start = time.perf_counter()
+        expected, _ = exact.search(queries, args.k)
+        exact_qps = args.queries / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index = build_ivfpq_index(corpus, m=args.m)
+        index.refine_factor = args.refine_factor
+        index.refine_vectors = corpus if args.refine_factor else None
+        build_seconds = time.perf_counter() - start
+        print(f"n={size:,} dim={args.dim} nlist={index.nlist} m={index.m}: "
+              f"build {build_seconds:.1f}s, exact {exact_qps:,.0f} QPS")
+
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            got, _ = index.search(queries, args.k, nprobe=nprobe)
+            qps = args.queries / (time.perf_counter() - start)
+            print(f"  nprobe={nprobe:<4} recall@{args.k} {recall_at_k(expected, got):.3f}  {qps:,.0f} QPS")
+
+
+if __name__ == "__main__":
+    main()
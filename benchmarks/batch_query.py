@@ -0,0 +1,117 @@
+"""
+One-question-at-a-time evaluation (the old `asyncio.run(query(q))` loop) vs. the BatchQueryRunner.
+
+Both run the same fake pipeline so the numbers do not depend on API quotas: an embedding
+endpoint with a fixed per-request latency, a retriever with a per-round-trip latency that
+searches a real in-memory matrix (one query vs. one matrix product per batch), and a generator
+with a per-answer latency and a cap on calls in flight (429 above it, like the LLM API).
+Latencies are multiplied by --time-scale, so large question sets finish quickly.
+
+    python -m benchmarks.batch_query --questions 21
+    python -m benchmarks.batch_query --questions 10000 --time-scale 0.001 --concurrency 32
+"""
+import time
+import random
+import asyncio
+import argparse
+
+import numpy as np
+
+from src.batch_query import BatchQueryRunner
+from src.kb_retrieval.local_vector_index import ExactVectorIndex
+
+
+class FakeBackend:
+    def __init__(self, args):
+        self.scale = args.time_scale
+        self.server_limit = args.server_limit
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((args.sections, args.dim)).astype(np.float32)
+        self.index = ExactVectorIndex(matrix / np.linalg.norm(matrix, axis=1, keepdims=True))
+        self.dim = args.dim
+        self.embed_requests = 0
+        self.round_trips = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def embed(self, texts):
+        self.embed_requests += 1
+        await asyncio.sleep(0.2 * self.scale)
+        return [np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(self.dim).astype(np.float32)
+                for text in texts]
+
+    async def retrieve(self, embeddings, top_k=10):
+        self.round_trips += 1
+        await asyncio.sleep(0.02 * self.scale)
+        indices, _ = self.index.search(np.asarray(embeddings), top_k)
+        return [f"context of sections {row.tolist()}" for row in indices]
+
+    async def generate(self, question, context):
+        if self.in_flight >= self.server_limit:
+            raise RuntimeError("429 Too Many Requests")
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.uniform(1.0, 2.0) * self.scale)
+        finally:
+            self.in_flight -= 1
+        return f"answer to {question}"
+
+
+async def sequential(backend: FakeBackend, questions):
+    # what the notebook loop did: embed, retrieve and generate each question in turn
+    answers = []
+    for question in questions:
+        embedding = (await backend.embed([question]))[0]
+        context = (await backend.retrieve([embedding]))[0]
+        answers.append(await backend.generate(question, context))
+    return answers
+
+
+async def batched(backend: FakeBackend, questions, concurrency: int):
+    async def prepare(batch, embeddings):
+        contexts = await backend.retrieve(embeddings)
+        return list(zip(batch, contexts))
+
+    async def answer(item):
+        question, context = item
+        return await backend.generate(question, context), context
+
+    runner = BatchQueryRunner(backend.embed, prepare, answer, concurrency=concurrency)
+    return [result async for result in runner.run(questions)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=21)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--server-limit", type=int, default=32)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--sections", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    questions = [f"question {i}" for i in range(args.questions)]
+
+    if not args.skip_sequential:
+        backend = FakeBackend(args)
+        start = time.perf_counter()
+        asyncio.run(sequential(backend, questions))
+        seconds = time.perf_counter() - start
+        print(f"sequential: {seconds:7.2f}s  {args.questions / seconds:8.1f} q/s  "
+              f"{backend.embed_requests} embedding requests, {backend.round_trips} retrieval round trips")
+
+    backend = FakeBackend(args)
+    start = time.perf_counter()
+    results = asyncio.run(batched(backend, questions, args.concurrency))
+    seconds = time.perf_counter() - start
+    failed = sum(not result.ok for result in results)
+    print(f"batched:    {seconds:7.2f}s  {args.questions / seconds:8.1f} q/s  "
+          f"{backend.embed_requests} embedding requests, {backend.round_trips} retrieval round trips, "
+          f"peak {backend.peak_in_flight} generations in flight, {failed} failed, "
+          f"{len({result.index for result in results})}/{args.questions} answered")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Per-row upserts vs. UNWIND bulk ingestion against a local Neo4j.
+
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+    NEO4J_URI=bolt://localhost:7687 NEO4J_USER=neo4j NEO4J_PASSWORD=password \
+        python -m benchmarks.bulk_ingestion --units 5 --sections 10 --mentions 20
+
+All synthetic nodes get a `bench_` id prefix and are deleted afterwards.
+"""
+import os
+import time
+import random
+import argparse
+from dotenv import load_dotenv
+
+from src.kb_construction.models import Unit, Section, Mention, FigureRef
+from src.kb_construction.kb_loader import Neo4jKBLoader
+from src.kb_construction.bulk_loader import Neo4jBulkLoader
+
+load_dotenv()
+
+
+def make_units(num_units: int, num_sections: int, num_mentions: int, num_figures: int, embedding_dim: int):
+    def emb():
+        return [random.random() for _ in range(embedding_dim)] if embedding_dim else None
+
+    units = []
+    for u in range(num_units):
+        sections = []
+        for s in range(num_sections):
+            sections.append(Section(
+                id=f"bench_section_{u}_{s}",
+                section_title=f"Section {u}.{s}",
+                summary="summary " * 30,
+                content="content " * 300,
+                mentions=[Mention(id=f"bench_mention_{random.randrange(num_mentions * 5)}", string=f"mention {m}",
+                                  embedding=emb()) for m in range(num_mentions)],
+                fig_refs=[FigureRef(id=f"bench_figure_{u}_{s}_{f}", label=f"Figure {u}.{s}{f}", caption="caption",
+                                    page_number=u * num_sections + s, embedding=emb()) for f in range(num_figures)],
+                embedding=emb(),
+            ))
+        units.append(Unit(id=f"bench_unit_{u}", unit_title=f"Unit {u}", summary="summary " * 30,
+                          sections=sections, embedding=emb()))
+    return units
+
+
+def per_row_load(loader: Neo4jKBLoader, units):
+    nodes = edges = 0
+    for unit in units:
+        loader.upsert_node("Unit", unit)
+        nodes += 1
+        for section in unit.sections:
+            loader.upsert_node("Section", section)
+            loader.upsert_relationship(unit.id, section.id, "HAS_SECTION")
+            nodes += 1
+            edges += 1
+            for mention in section.mentions:
+                loader.upsert_node("Mention", mention)
+                loader.upsert_relationship(section.id, mention.id, "HAS_MENTION")
+                nodes += 1
+                edges += 1
+            for fig in section.fig_refs:
+                loader.upsert_node("FigureRef", fig)
+                loader.upsert_relationship(section.id, fig.id, "HAS_FIGURE")
+                nodes += 1
+                edges += 1
+    return nodes, edges
+
+
+def cleanup(loader: Neo4jKBLoader):
+    with loader.session() as session:
+        session.run("MATCH (n:Node) WHERE n.id STARTS WITH 'bench_' DETACH DELETE n").consume()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--units", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument("--mentions", type=int, default=20)
+    parser.add_argument("--figures", type=int, default=2)
+    parser.add_argument("--embedding-dim", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    units = make_units(args.units, args.sections, args.mentions, args.figures, args.embedding_dim)
+    loader = Neo4jKBLoader(os.getenv("NEO4J_URI"), os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+
+    try:
+        loader.ensure_schema()
+        cleanup(loader)
+        start = time.perf_counter()
+        nodes, edges = per_row_load(loader, units)
+        elapsed = time.perf_counter() - start
+        print(f"per-row: {nodes} node upserts + {edges} edge upserts in {elapsed:.2f}s "
+              f"({(nodes + edges) / elapsed:.0f} statements/s)")
+
+        cleanup(loader)
+        bulk_loader = Neo4jBulkLoader(loader, batch_size=args.batch_size)
+        start = time.perf_counter()
+        bulk_loader.add_units(units)
+        stats = bulk_loader.flush()
+        bulk_elapsed = time.perf_counter() - start
+        print(f"bulk:    {stats}")
+        print(f"speedup: {elapsed / bulk_elapsed:.1f}x")
+    finally:
+        cleanup(loader)
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Prompt size of the old context concatenation vs. the token-budgeted ContextBuilder, on the
+contexts recorded in data/evaluation_data.csv.
+
+For every question the recorded sections are rebuilt both ways; "ref coverage" is the share of
+the question's reference_contexts 8-word shingles (found in the untrimmed context) that are still
+in the prompt, i.e. how much of the evidence survives deduplication and trimming.
+
+    python -m benchmarks.context_builder --budgets 0 2000 3000 4000
+"""
+import ast
+import csv
+import time
+import argparse
+import statistics
+
+from src.answer_generation.context_builder import ContextBuilder, SECTION_SEPARATOR
+from benchmarks.hybrid_retrieval import parse_contexts, shingles
+
+
+def legacy_context(sections):
+    context = ""
+    for node in sections:
+        context += f"Unit Title: {node['unit_title']}\n"
+        if node["section_title"]:
+            context += f"Section Title: {node['section_title']}\n"
+        context += f"Content: {node['content']}\n"
+        context += SECTION_SEPARATOR
+    return context
+
+
+def to_nodes(sections):
+    nodes = []
+    for section in sections:
+        node = {"unit_title": section["unit_title"]}
+        if section["section_title"]:
+            node["section_title"] = section["section_title"]
+            node["content"] = section["content"]
+        else:
+            node["summary"] = section["content"]
+        nodes.append(node)
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="data/evaluation_data.csv")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 2000, 3000, 4000])
+    parser.add_argument("--section-tokens", type=int, default=1500)
+    args = parser.parse_args()
+
+    with open(args.csv, newline="") as f:
+        rows = list(csv.DictReader(f))
+    questions = []
+    for row in rows:
+        sections = parse_contexts(row["contexts"])
+        reference = set().union(*(shingles(text) for text in ast.literal_eval(row["reference_contexts"])))
+        questions.append((row["user_input"], sections, reference))
+
+    counter = ContextBuilder()
+    legacy = [counter.count_tokens(legacy_context(sections)) for _, sections, _ in questions]
+    print(f"{len(questions)} questions, legacy context: mean {statistics.mean(legacy):.0f} tokens, "
+          f"max {max(legacy)}")
+
+    print(f"{'budget':>8} {'mean tok':>9} {'max tok':>8} {'saved':>7} {'dup lines':>10} {'trimmed':>8} "
+          f"{'ref coverage':>13} {'ms/query':>9}")
+    for budget in args.budgets:
+        builder = ContextBuilder(token_budget=budget, max_section_tokens=args.section_tokens if budget else 0)
+        tokens, duplicates, trimmed, coverage = [], 0, 0, []
+        start = time.perf_counter()
+        for query, sections, reference in questions:
+            context, stats = builder.build(query, to_nodes(sections))
+            tokens.append(counter.count_tokens(context))
+            duplicates += stats.duplicate_lines
+            trimmed += stats.trimmed
+            available = reference & shingles(legacy_context(sections))
+            if available:
+                coverage.append(len(available & shingles(context)) / len(available))
+        ms = (time.perf_counter() - start) / len(questions) * 1e3
+        saved = 1 - sum(tokens) / sum(legacy)
+        print(f"{budget or 'none':>8} {statistics.mean(tokens):>9.0f} {max(tokens):>8} {saved:>7.1%} "
+              f"{duplicates:>10} {trimmed:>8} {statistics.mean(coverage):>13.1%} {ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
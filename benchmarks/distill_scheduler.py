@@ -0,0 +1,118 @@
+"""
+Unbounded gather (the old distillation path) vs. the ExtractionScheduler, both driven by a fake
+agent whose latency grows with unit length and which answers 429 whenever more than
+`--server-limit` calls are in flight. Also checks that every unit comes back and that a
+non-retryable error is reported as a failure instead of vanishing. Finally runs the same units
+as a generator with different `sort_window`s (longest-first ordering within each window).
+
+    python -m benchmarks.distill_scheduler --units 60 --server-limit 8
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from src.kb_construction.scheduler import ExtractionScheduler
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeUsage:
+    def __init__(self, request_tokens, response_tokens):
+        self.request_tokens = request_tokens
+        self.response_tokens = response_tokens
+
+
+class FakeRunResult:
+    def __init__(self, output, usage):
+        self.output = output
+        self._usage = usage
+
+    def usage(self):
+        return self._usage
+
+
+class FakeAgent:
+    def __init__(self, server_limit: int, seconds_per_kchar: float, poison: str = None):
+        self.server_limit = server_limit
+        self.seconds_per_kchar = seconds_per_kchar
+        self.poison = poison
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+
+    async def run(self, text: str):
+        self.calls += 1
+        if text == self.poison:
+            raise ValueError("model returned an invalid Unit")
+        if self.in_flight >= self.server_limit:
+            self.rate_limited += 1
+            await asyncio.sleep(0.01)
+            raise RateLimitError("429 Too Many Requests")
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.seconds_per_kchar * len(text) / 1000)
+        finally:
+            self.in_flight -= 1
+        tokens = len(text) // 4
+        return FakeRunResult(text.upper(), FakeUsage(tokens, tokens))
+
+
+async def gather_with_drops(agent: FakeAgent, texts):
+    # the old behaviour: everything at once, anything but a timeout becomes None
+    async def run(text):
+        try:
+            return await agent.run(text)
+        except Exception:
+            return None
+    return await asyncio.gather(*[run(text) for text in texts])
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--units", type=int, default=60)
+    parser.add_argument("--server-limit", type=int, default=8)
+    parser.add_argument("--seconds-per-kchar", type=float, default=0.02)
+    args = parser.parse_args()
+
+    random.seed(0)
+    # unit lengths in a textbook are skewed: a few very long chapters, many short ones
+    texts = [f"unit {i} " + "x" * int(random.paretovariate(1.2) * 2000) for i in range(args.units)]
+    poison = texts[args.units // 2]
+
+    agent = FakeAgent(args.server_limit, args.seconds_per_kchar, poison=poison)
+    start = time.perf_counter()
+    outputs = await gather_with_drops(agent, texts)
+    print(f"gather:    {time.perf_counter() - start:.2f}s, {agent.rate_limited} rate-limited calls, "
+          f"{sum(output is None for output in outputs)}/{len(texts)} units silently dropped")
+
+    agent = FakeAgent(args.server_limit, args.seconds_per_kchar, poison=poison)
+    scheduler = ExtractionScheduler(max_concurrency=args.server_limit, tokens_per_minute=10_000_000,
+                                    base_backoff_seconds=0.05, max_backoff_seconds=1.0)
+    summary = await scheduler.run(texts, agent.run)
+    print(f"scheduler: {summary.wall_seconds:.2f}s, {agent.rate_limited} rate-limited calls, "
+          f"{len(summary.failures)} reported failure(s)")
+
+    for text, result in zip(texts, summary.results):
+        if text == poison:
+            assert not result.ok and result.attempts == 1, "non-retryable error should fail once"
+        else:
+            assert result.ok and result.output.output == text.upper(), f"unit {result.index} lost"
+    print("\n".join(str(summary).splitlines()[:3]))
+
+    # a generator input (how build/ingest feed the scheduler) is only sorted within each window
+    texts = [text for text in texts if text != poison]
+    for sort_window in (1, 8, 32, len(texts)):
+        agent = FakeAgent(args.server_limit, args.seconds_per_kchar)
+        scheduler = ExtractionScheduler(max_concurrency=args.server_limit, tokens_per_minute=10_000_000,
+                                        base_backoff_seconds=0.05, max_backoff_seconds=1.0,
+                                        sort_window=sort_window)
+        summary = await scheduler.run(iter(texts), agent.run)
+        assert all(result.ok for result in summary.results)
+        print(f"generator, sort_window={sort_window}: {summary.wall_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""
+Serial one-request-per-node embedding vs. the batched, concurrent EmbeddingPipeline,
+both driven by the offline FakeEmbeddingBackend with a simulated per-request latency.
+
+    python -m benchmarks.embedding_pipeline --nodes 5000 --latency 0.05
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from src.kb_construction.embedding_pipeline import EmbeddingPipeline, FakeEmbeddingBackend
+
+
+def make_texts(num_nodes: int, num_distinct_mentions: int):
+    # roughly the build mix: mostly mentions, which repeat across sections
+    texts = []
+    for i in range(num_nodes):
+        if i % 10 == 0:
+            texts.append(f"Section {i} " + "summary text " * 40)
+        else:
+            texts.append(f"mention {random.randrange(num_distinct_mentions)}")
+    return texts
+
+
+async def serial(backend: FakeEmbeddingBackend, texts):
+    return [(await backend.embed_batch([text]))[0] for text in texts]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--distinct-mentions", type=int, default=800)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    random.seed(0)
+    texts = make_texts(args.nodes, args.distinct_mentions)
+
+    backend = FakeEmbeddingBackend(dim=args.dim, latency_seconds=args.latency)
+    start = time.perf_counter()
+    expected = await serial(backend, texts)
+    serial_seconds = time.perf_counter() - start
+    print(f"serial:   {backend.calls} requests, {serial_seconds:.2f}s")
+
+    backend = FakeEmbeddingBackend(dim=args.dim, latency_seconds=args.latency)
+    pipeline = EmbeddingPipeline(backend, max_batch_size=args.batch_size, max_concurrency=args.concurrency)
+    start = time.perf_counter()
+    vectors = await pipeline.embed(texts)
+    pipeline_seconds = time.perf_counter() - start
+    assert vectors == expected, "pipeline output differs from serial output"
+    print(f"pipeline: {pipeline.stats.requests} requests for {pipeline.stats.unique_texts} unique of "
+          f"{pipeline.stats.texts} texts, {pipeline_seconds:.2f}s ({serial_seconds / pipeline_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
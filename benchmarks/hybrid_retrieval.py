@@ -0,0 +1,110 @@
+"""
+Vector-only vs. BM25 vs. hybrid (reciprocal rank fusion) retrieval on data/evaluation_data.csv.
+
+Runs offline: the corpus is every distinct section that appears in the `contexts` column, and
+the vector ranking of each question is the order the current dense retriever put them in (what
+the CSV recorded). A section counts as relevant when it shares an 8-word shingle with one of the
+question's `reference_contexts`. Reports precision / recall / MRR at k and the context size.
+
+    python -m benchmarks.hybrid_retrieval
+"""
+import ast
+import csv
+import re
+import time
+import argparse
+import tempfile
+
+from src.kb_retrieval.lexical_index import LexicalIndex, write_lexical_index, tokenize, reciprocal_rank_fusion
+
+SEPARATOR = "================"
+
+
+def parse_contexts(contexts: str):
+    sections = []
+    for block in contexts.split(SEPARATOR):
+        block = block.strip()
+        if not block:
+            continue
+        unit = re.search(r"^Unit Title: (.*)$", block, re.MULTILINE)
+        title = re.search(r"^Section Title: (.*)$", block, re.MULTILINE)
+        body = re.search(r"^(?:Content|Summary): (.*)", block, re.MULTILINE | re.DOTALL)
+        sections.append({
+            "id": f"{unit.group(1) if unit else ''} / {title.group(1) if title else '(unit summary)'}",
+            "unit_title": unit.group(1) if unit else "",
+            "section_title": title.group(1) if title else "",
+            "content": body.group(1) if body else block,
+        })
+    return sections
+
+
+def shingles(text: str, n: int = 8):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+
+
+def evaluate(rankings, relevant, k):
+    precision = recall = mrr = 0.0
+    for ranking, wanted in zip(rankings, relevant):
+        top = ranking[:k]
+        hits = [doc for doc in top if doc in wanted]
+        precision += len(hits) / k
+        recall += len(set(hits)) / len(wanted)
+        mrr += next((1.0 / rank for rank, doc in enumerate(top, start=1) if doc in wanted), 0.0)
+    n = len(rankings)
+    return precision / n, recall / n, mrr / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="data/evaluation_data.csv")
+    parser.add_argument("--rrf-k", type=int, default=60)
+    args = parser.parse_args()
+
+    with open(args.csv, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    corpus, vector_rankings = {}, []
+    for row in rows:
+        sections = parse_contexts(row["contexts"])
+        for section in sections:
+            corpus.setdefault(section["id"], section)
+        vector_rankings.append(list(dict.fromkeys(section["id"] for section in sections)))
+
+    relevant, kept = [], []
+    for i, row in enumerate(rows):
+        reference = set().union(*(shingles(text) for text in ast.literal_eval(row["reference_contexts"])))
+        wanted = {doc_id for doc_id, section in corpus.items() if shingles(section["content"]) & reference}
+        if wanted:
+            relevant.append(wanted)
+            kept.append(i)
+    print(f"{len(corpus)} distinct sections, {len(kept)}/{len(rows)} questions with a relevant section in the corpus")
+
+    docs = list(corpus.values())
+    with tempfile.TemporaryDirectory() as directory:
+        write_lexical_index(docs, [tokenize(doc["section_title"]) * 2 + tokenize(doc["content"]) for doc in docs],
+                            directory)
+        index = LexicalIndex.load(directory)
+
+        start = time.perf_counter()
+        lexical_rankings = [[docs[doc]["id"] for doc, _ in index.search(rows[i]["user_input"], k=20)] for i in kept]
+        lexical_ms = (time.perf_counter() - start) / len(kept) * 1e3
+
+    vector_rankings = [vector_rankings[i] for i in kept]
+    hybrid_rankings = [[doc for doc, _ in reciprocal_rank_fusion([vector, lexical], k=args.rrf_k)]
+                       for vector, lexical in zip(vector_rankings, lexical_rankings)]
+    print(f"BM25 query latency: {lexical_ms:.2f} ms")
+
+    tokens_per_section = sum(len(doc["content"]) for doc in docs) / len(docs) / 4
+    print(f"{'k':>3} {'~ctx tokens':>12}  " + "  ".join(f"{name:^22}" for name in ("vector", "bm25", "hybrid (rrf)")))
+    print(f"{'':>3} {'':>12}  " + "  ".join(f"{'P@k   R@k   MRR':^22}" for _ in range(3)))
+    for k in (1, 2, 3, 4, 5, 10):
+        cells = []
+        for rankings in (vector_rankings, lexical_rankings, hybrid_rankings):
+            p, r, m = evaluate(rankings, relevant, k)
+            cells.append(f"{p:.2f}  {r:.2f}  {m:.2f}".center(22))
+        print(f"{k:>3} {k * tokens_per_section:>12.0f}  " + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
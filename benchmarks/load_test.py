@@ -0,0 +1,50 @@
+"""
+Throughput of `src.query.query` under increasing concurrency.
+
+    python -m benchmarks.load_test --concurrency 1 2 4 8 16 --requests 32
+
+Questions are taken round-robin from data/evaluation_data.csv. With the async pipeline, throughput
+should grow with concurrency until the LLM / Neo4j side saturates.
+"""
+import csv
+import time
+import asyncio
+import argparse
+import statistics
+
+from src.query import query
+
+
+async def run_level(questions, concurrency: int, num_requests: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(question):
+        async with semaphore:
+            start = time.perf_counter()
+            await query(question)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(questions[i % len(questions)]) for i in range(num_requests)])
+    elapsed = time.perf_counter() - start
+    print(f"concurrency {concurrency:>3}: {num_requests / elapsed:.2f} req/s, "
+          f"p50 {statistics.median(latencies):.2f}s, max {max(latencies):.2f}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", default="data/evaluation_data.csv")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32)
+    args = parser.parse_args()
+
+    with open(args.questions, newline="") as f:
+        questions = [row["user_input"] for row in csv.DictReader(f)]
+
+    for concurrency in args.concurrency:
+        await run_level(questions, concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
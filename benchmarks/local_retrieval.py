@@ -0,0 +1,76 @@
+"""
+Latency and recall of the in-process retriever against the Neo4j vector index.
+
+    python -m src.kb_retrieval.local_vector_index          # export the KB to KB_INDEX_DIR
+    python -m benchmarks.local_retrieval --top-k 15
+
+Queries are the questions of data/evaluation_data.csv (embedded through the embedding cache).
+Recall@k is the share of Neo4j's returned section ids that the local retriever also returns.
+"""
+import os
+import csv
+import time
+import asyncio
+import argparse
+import statistics
+
+from src.kb_construction.kb_loader import Neo4jKBLoader
+from src.kb_construction.embedding_cache import get_embedding_cache
+from src.kb_construction.embedding_pipeline import EmbeddingPipeline
+from src.kb_retrieval.embedding_based_retriever import KBRetrieval
+from src.kb_retrieval.local_vector_index import LocalKBRetrieval
+
+
+def load_questions(path: str):
+    with open(path, newline="") as f:
+        return [row["user_input"] for row in csv.DictReader(f)]
+
+
+def timed(retriever, embeddings, top_k: int):
+    latencies, results = [], []
+    for embedding in embeddings:
+        start = time.perf_counter()
+        results.append(retriever.query_sections_by_embedding(query_embedding=embedding, top_k=top_k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def describe(name: str, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:>6}: p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", default="data/evaluation_data.csv")
+    parser.add_argument("--index-dir", default=os.getenv("KB_INDEX_DIR", "kb_index"))
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    embeddings = asyncio.run(EmbeddingPipeline(cache=get_embedding_cache()).embed(questions)) * args.repeat
+
+    loader = Neo4jKBLoader.shared()
+    neo4j_retriever = KBRetrieval(loader)
+    local_retriever = LocalKBRetrieval(loader, args.index_dir)
+
+    neo4j_latencies, neo4j_results = timed(neo4j_retriever, embeddings, args.top_k)
+    local_latencies, local_results = timed(local_retriever, embeddings, args.top_k)
+    loader.close()
+
+    recalls = []
+    for expected, got in zip(neo4j_results, local_results):
+        expected_ids = {node["id"] for node in expected}
+        if expected_ids:
+            recalls.append(len(expected_ids & {node["id"] for node in got}) / len(expected_ids))
+
+    print(f"{len(embeddings)} queries, top_k={args.top_k}, {len(local_retriever.ids)} indexed nodes")
+    describe("neo4j", neo4j_latencies)
+    describe("local", local_latencies)
+    print(f"recall@{args.top_k} vs neo4j: {statistics.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    main()
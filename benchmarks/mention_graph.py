@@ -0,0 +1,75 @@
+"""
+Latency of Mention-graph expansion on a synthetic KB.
+
+Builds a graph of --sections sections spread over --units units; each section draws ~--mentions
+mentions from a Zipf-distributed vocabulary, so a few concepts are everywhere and most are
+shared by a handful of sections, as in the distilled books. Reports the export / load time and
+the expansion latency of 10 seed sections for several hop depths and fan-outs.
+
+    python -m benchmarks.mention_graph --sections 50000
+"""
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+from src.kb_retrieval.mention_graph import MentionGraph, write_mention_graph
+
+
+def synthetic_graph(num_sections: int, num_units: int, mentions_per_section: int, vocabulary: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    sections = [{"id": f"section_{i}", "unit_title": f"Unit {i * num_units // num_sections}",
+                 "section_title": f"Section {i}", "content": ""} for i in range(num_sections)]
+    counts = rng.poisson(mentions_per_section, size=num_sections)
+    draws = np.minimum(rng.zipf(1.3, size=int(counts.sum())), vocabulary) - 1
+    section_mentions, start = [], 0
+    for count in counts.tolist():
+        section_mentions.append([f"mention_{m}" for m in draws[start:start + count].tolist()])
+        start += count
+    mention_strings = {f"mention_{m}": f"concept {m}" for m in np.unique(draws).tolist()}
+    return sections, section_mentions, mention_strings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=50_000)
+    parser.add_argument("--units", type=int, default=500)
+    parser.add_argument("--mentions", type=int, default=12)
+    parser.add_argument("--vocabulary", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    sections, section_mentions, mention_strings = synthetic_graph(args.sections, args.units, args.mentions,
+                                                                  args.vocabulary)
+    edges = sum(len(mentions) for mentions in section_mentions)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_mention_graph(sections, section_mentions, mention_strings, directory)
+        export_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        graph = MentionGraph.load(directory)
+        load_seconds = time.perf_counter() - start
+        print(f"{len(graph)} sections, {len(mention_strings)} mentions, {edges} HAS_MENTION edges: "
+              f"export {export_seconds:.2f}s, load {load_seconds:.2f}s")
+
+        rng = np.random.default_rng(1)
+        seeds = [[f"section_{i}" for i in rng.choice(args.sections, size=10, replace=False)]
+                 for _ in range(args.queries)]
+        print(f"{'hops':>4} {'fanout':>6} {'p50 ms':>8} {'p95 ms':>8} {'found':>6}")
+        for max_hops in (1, 2):
+            for fanout in (5, 10):
+                latencies, found = [], []
+                for seed_ids in seeds:
+                    start = time.perf_counter()
+                    neighbours = graph.expand(seed_ids, max_hops=max_hops, fanout=fanout)
+                    latencies.append((time.perf_counter() - start) * 1e3)
+                    found.append(len(neighbours))
+                latencies.sort()
+                print(f"{max_hops:>4} {fanout:>6} {statistics.median(latencies):>8.2f} "
+                      f"{latencies[int(0.95 * (len(latencies) - 1))]:>8.2f} {statistics.mean(found):>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
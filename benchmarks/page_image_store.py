@@ -0,0 +1,72 @@
+"""
+Shared page downloads in PageImageStore under cancellation.
+
+Several requests ask for the same page while it is being downloaded; one of them (like a
+speculative figure prefetch the agent turned out not to need) is cancelled halfway. The others
+must still get the page, the page must be downloaded only once, and it must end up in the LRU.
+The download is faked with a fixed latency so no network or image files are needed.
+
+    python -m benchmarks.page_image_store --waiters 8
+"""
+import time
+import asyncio
+import argparse
+import tempfile
+
+from src.kb_retrieval.page_image_store import PageImageStore
+
+
+class FakeDownloadStore(PageImageStore):
+    def __init__(self, latency_seconds: float, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_seconds = latency_seconds
+        self.downloads = 0
+
+    async def _load(self, url: str) -> str:
+        self.downloads += 1
+        await asyncio.sleep(self.latency_seconds)
+        return f"data:image/jpeg;base64,{url}"
+
+
+async def run(waiters: int, latency_seconds: float, cache_dir: str):
+    store = FakeDownloadStore(latency_seconds, cache_dir=cache_dir)
+    url = "https://example.com/page_12.jpg"
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(store.get_data_uri(url)) for _ in range(waiters)]
+    await asyncio.sleep(latency_seconds / 2)
+    tasks[0].cancel()  # the speculative prefetch is dropped
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    seconds = time.perf_counter() - start
+
+    cancelled = sum(isinstance(result, asyncio.CancelledError) for result in results)
+    served = sum(result == f"data:image/jpeg;base64,{url}" for result in results)
+    print(f"{waiters} waiters, 1 cancelled: {served} served, {cancelled} cancelled, "
+          f"{store.downloads} download(s), {seconds * 1e3:.0f} ms, cached: {url in store._memory}")
+    ok = cancelled == 1 and served == waiters - 1 and store.downloads == 1
+
+    # every waiter cancelled: the download still finishes and lands in the LRU for the next request
+    url = "https://example.com/page_13.jpg"
+    task = asyncio.create_task(store.get_data_uri(url))
+    await asyncio.sleep(latency_seconds / 2)
+    task.cancel()
+    await asyncio.sleep(latency_seconds)
+    print(f"all waiters cancelled: cached afterwards: {url in store._memory}, downloads {store.downloads}")
+    ok = ok and url in store._memory and store.downloads == 2
+
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--waiters", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if not asyncio.run(run(args.waiters, args.latency_ms / 1e3, cache_dir)):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Whole-document page ingestion (json.load -> rewrite every page -> join -> split with +=) vs. the
+streaming page_stream parser, on a synthetic LlamaParse-style document_pages.json that carries
+the bulky `items` / `structuredData` / `text` fields of the real export.
+
+    python -m benchmarks.page_ingestion --pages 5000
+"""
+import os
+import re
+import gc
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from src.kb_construction.page_stream import iter_unit_strings
+
+
+def make_document(path: str, num_pages: int, pages_per_unit: int):
+    random.seed(0)
+    with open(path, "w") as f:
+        f.write("[")
+        for page in range(1, num_pages + 1):
+            lines = ["# Chapter 1 Cells and the Chemistry of Life", "## Cell Structure and Organisation"]
+            if page % pages_per_unit == 1:
+                lines.append(f"### {page // pages_per_unit + 1}.{page % 7 + 1} Unit starting on page {page}")
+            for s in range(3):
+                lines.append(f"#### Section {s} of page {page}")
+                lines.extend(" ".join(random.choice("abcdefgh") * random.randint(2, 9) for _ in range(60))
+                             for _ in range(4))
+            lines.append(f"Figure {page}.{s}: caption")
+            lines.append(str(page))
+            md = "\n".join(lines)
+            item = {
+                "page": page, "text": md, "md": md, "images": [], "charts": [],
+                "items": [{"type": "text", "value": line, "md": line,
+                           "bBox": {"x": 10.0, "y": 20.0 * i, "w": 500.0, "h": 18.0}}
+                          for i, line in enumerate(lines)],
+                "status": "OK", "links": [], "width": 612, "height": 792,
+                "structuredData": None, "noStructuredContent": False, "noTextContent": False,
+                "confidence": 0.98,
+            }
+            f.write(("," if page > 1 else "") + json.dumps(item))
+        f.write("]")
+
+
+def legacy_split_into_units(content) -> list[str]:
+    """split_into_units as it was before the streaming parser, for comparison."""
+    unit_pattern = r'^(#{1,6})\s+(\d+\.\d+)\s+(.+)$'
+    lines = content.split('\n')
+    units = []
+    current_unit = None
+    for line in lines:
+        match = re.match(unit_pattern, line, re.MULTILINE)
+        if match:
+            if current_unit:
+                units.append(current_unit)
+            line = line.replace("#", "")
+            current_unit = f"Unit Title: {line} + '\n'"
+        else:
+            if current_unit:
+                current_unit += line + '\n'
+            elif line.strip():
+                if units:
+                    units[-1] += line + '\n'
+    if current_unit:
+        units.append(current_unit)
+    return units
+
+
+def legacy(path: str):
+    with open(path, "r") as f:
+        json_list = json.load(f)
+    for idx, item in enumerate(json_list):
+        md_lines = [line for line in item['md'].split("\n")[:-1]
+                    if line.strip() != "" and line.count("#") not in [1, 2]]
+        json_list[idx]['md'] = (f"\npage_number: {str(item['page'])}\n" + "\n".join(md_lines)
+                                + f"\npage_number: {str(item['page'])}")
+    markdown_text = "\n[BREAK_PAGE]\n".join([item['md'] for item in json_list if item['md'] != ""])
+    return legacy_split_into_units(markdown_text)
+
+
+def measure(name: str, run):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, units = run()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {seconds:6.2f}s total, first unit after {first:5.2f}s, "
+          f"peak {peak / 2 ** 20:7.1f} MiB, {len(units)} units")
+    return units
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--pages-per-unit", type=int, default=12)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "document_pages.json")
+        make_document(path, args.pages, args.pages_per_unit)
+        print(f"{args.pages} pages, {os.path.getsize(path) / 2 ** 20:.1f} MiB of JSON")
+
+        def run_legacy():
+            start = time.perf_counter()
+            units = legacy(path)
+            # nothing can be distilled before the whole split is done
+            return time.perf_counter() - start, units
+
+        def run_streaming():
+            # a consumer (the distiller) only keeps a fingerprint-sized record per unit
+            start, first, units = time.perf_counter(), None, []
+            for unit_string in iter_unit_strings(path):
+                if first is None:
+                    first = time.perf_counter() - start
+                units.append(hash(unit_string))
+            return first, units
+
+        legacy_units = measure("legacy", run_legacy)
+        streamed = measure("streaming", run_streaming)
+        assert [hash(unit) for unit in legacy_units] == streamed, "streaming units differ from legacy units"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Context precision vs. top_k with and without the feature-based reranker, on data/evaluation_data.csv.
+
+Runs offline like benchmarks.hybrid_retrieval: each question's candidates are the sections its
+recorded context holds, in the order the dense retriever returned them, and a section is relevant
+when it shares an 8-word shingle with the question's reference_contexts. The CSV has no Mention
+nodes, so every section gets proxy mentions: its title and the word bigrams / trigrams (no
+stopwords) that occur at least twice in it. Reports P@k / R@k / MRR and the rerank latency.
+
+    python -m benchmarks.reranker
+"""
+import ast
+import csv
+import time
+import argparse
+import tempfile
+import statistics
+from collections import Counter
+
+from src.kb_retrieval.lexical_index import tokenize
+from src.kb_retrieval.reranker import Reranker, section_features, write_rerank_features
+from benchmarks.hybrid_retrieval import parse_contexts, shingles, evaluate
+
+
+def proxy_mentions(section):
+    tokens = tokenize(section["content"])
+    grams = Counter(" ".join(tokens[i:i + n]) for n in (2, 3) for i in range(len(tokens) - n + 1))
+    return [section["section_title"] or section["unit_title"]] + [gram for gram, count in grams.items() if count >= 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default="data/evaluation_data.csv")
+    parser.add_argument("--budget-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    with open(args.csv, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    corpus, candidates = {}, []
+    for row in rows:
+        sections = parse_contexts(row["contexts"])
+        hits = {}
+        for section in sections:
+            corpus.setdefault(section["id"], section)
+            hit = {"id": section["id"], "unit_title": section["unit_title"]}
+            if section["section_title"]:
+                hit.update(section_title=section["section_title"], content=section["content"])
+            else:
+                hit["summary"] = section["content"]
+            hits.setdefault(section["id"], hit)
+        candidates.append(list(hits.values()))
+
+    relevant, kept = [], []
+    for i, row in enumerate(rows):
+        reference = set().union(*(shingles(text) for text in ast.literal_eval(row["reference_contexts"])))
+        wanted = {doc_id for doc_id, section in corpus.items() if shingles(section["content"]) & reference}
+        if wanted & {hit["id"] for hit in candidates[i]}:
+            relevant.append(wanted)
+            kept.append(i)
+    print(f"{len(corpus)} distinct sections, {len(kept)}/{len(rows)} questions with a relevant candidate")
+
+    start = time.perf_counter()
+    features = {doc_id: section_features(section["section_title"], section["content"], proxy_mentions(section), [])
+                for doc_id, section in corpus.items() if section["section_title"]}
+    with tempfile.TemporaryDirectory() as directory:
+        write_rerank_features(features, directory)
+        reranker = Reranker.load(directory, budget_ms=args.budget_ms)
+    print(f"Feature cache for {len(features)} sections built in {time.perf_counter() - start:.2f}s")
+
+    baseline = [[hit["id"] for hit in candidates[i]] for i in kept]
+    latencies, reranked = [], []
+    for i in kept:
+        start = time.perf_counter()
+        hits = reranker.rerank(rows[i]["user_input"], candidates[i])
+        latencies.append((time.perf_counter() - start) * 1e3)
+        reranked.append([hit["id"] for hit in hits])
+    latencies.sort()
+    print(f"Rerank latency: median {statistics.median(latencies):.2f} ms, "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f} ms, "
+          f"{reranker.over_budget} calls over the {args.budget_ms:g} ms budget")
+
+    tokens_per_section = sum(len(section["content"]) for section in corpus.values()) / len(corpus) / 4
+    print(f"{'k':>3} {'~ctx tokens':>12}  " + "  ".join(f"{name:^22}" for name in ("retrieval order", "reranked")))
+    print(f"{'':>3} {'':>12}  " + "  ".join(f"{'P@k   R@k   MRR':^22}" for _ in range(2)))
+    for k in (1, 2, 3, 4, 5, 10):
+        cells = []
+        for rankings in (baseline, reranked):
+            p, r, m = evaluate(rankings, relevant, k)
+            cells.append(f"{p:.2f}  {r:.2f}  {m:.2f}".center(22))
+        print(f"{k:>3} {k * tokens_per_section:>12.0f}  " + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import time
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    embedding: np.ndarray
+    answer: str
+    context: str
+    kb_version: Optional[str]
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """
+    Answers to previous questions, looked up by cosine similarity of the question embedding.
+    A hit needs similarity >= `threshold`, an entry younger than `ttl_seconds` and the same KB
+    build version; anything from an older build is dropped as soon as a new version is seen.
+    """
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 24 * 3600, max_entries: int = 5000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._entries: List[CachedAnswer] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._kb_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding: List[float], kb_version: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Returns (answer, context) of the most similar fresh entry, or None."""
+        with self._lock:
+            self._check_version(kb_version)
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix = np.stack([entry.embedding for entry in self._entries])
+            scores = self._matrix @ _normalise(embedding)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            return entry.answer, entry.context
+
+    def store(self, question: str, embedding: List[float], answer: str, context: str, kb_version: Optional[str]):
+        with self._lock:
+            self._check_version(kb_version)
+            self._entries.append(CachedAnswer(question, _normalise(embedding), answer, context, kb_version, time.time()))
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+            self._matrix = None
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _check_version(self, kb_version: Optional[str]):
+        if kb_version != self._kb_version:
+            self._entries = []
+            self._matrix = None
+            self._kb_version = kb_version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        if self._entries and self._entries[0].created_at < cutoff:
+            # entries are appended in time order, so the expired ones are a prefix
+            self._entries = [entry for entry in self._entries if entry.created_at >= cutoff]
+            self._matrix = None
+
+
+def _normalise(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
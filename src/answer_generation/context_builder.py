@@ -0,0 +1,175 @@
+import os
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.kb_retrieval.lexical_index import tokenize
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a chars/4 estimate
+    tiktoken = None
+
+SECTION_SEPARATOR = "\n================\n"
+# lines shorter than this ("- Yes", "Figure 1.2") are too generic to treat as duplicates
+MIN_DEDUP_CHARS = 24
+
+
+@dataclass
+class ContextStats:
+    sections: int = 0
+    tokens: int = 0
+    budget: int = 0
+    duplicate_lines: int = 0
+    trimmed: int = 0
+    skipped: int = 0
+
+    def __str__(self):
+        return (f"{self.sections} sections, {self.tokens} tokens (budget {self.budget or 'unlimited'}), "
+                f"{self.duplicate_lines} duplicate lines removed, {self.trimmed} trimmed, {self.skipped} skipped")
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt context from retrieved sections, best first, within `token_budget`:
+    - a Unit hit (summary only) is dropped when one of its sections is also retrieved
+    - lines already in the context (figure captions that `Section.to_dict` appends to `content`,
+      text shared by overlapping sections) are removed
+    - a section longer than `max_section_tokens`, or than what is left of the budget, is cut down
+      to the passages that share the most terms with the question
+    `token_budget=0` means no budget (deduplication still applies).
+    """
+    def __init__(self, token_budget: int = 3000, max_section_tokens: int = 1500, min_section_tokens: int = 120,
+                 neighbour_weight: float = 0.75, encoding_name: str = "cl100k_base"):
+        self.token_budget = token_budget
+        self.max_section_tokens = max_section_tokens
+        self.min_section_tokens = min_section_tokens
+        self.neighbour_weight = neighbour_weight
+        self._encoding = tiktoken.get_encoding(encoding_name) if tiktoken is not None else None
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def build(self, query: str, sections: List[Dict[str, Any]]) -> Tuple[str, ContextStats]:
+        stats = ContextStats(budget=self.token_budget)
+        query_terms = set(tokenize(query))
+        section_units = {node.get("unit_title") for node in sections if "section_title" in node}
+        seen_lines = set()
+        blocks = []
+        remaining = self.token_budget or None
+
+        for node in sections:
+            if "section_title" not in node and node.get("unit_title") in section_units:
+                stats.skipped += 1
+                continue
+
+            header = ""
+            if 'unit_title' in node:
+                header += f"Unit Title: {node['unit_title']}\n"
+            if 'section_title' in node:
+                header += f"Section Title: {node['section_title']}\n"
+            if "content" in node:
+                label, body = "Content", node["content"] or ""
+            else:
+                label, body = "Summary", node.get("summary") or ""
+
+            body, duplicates = _dedupe(body, seen_lines)
+            stats.duplicate_lines += duplicates
+            if not body.strip():
+                stats.skipped += 1
+                continue
+
+            limit = self.max_section_tokens or None
+            if remaining is not None:
+                limit = min(limit, remaining) if limit else remaining
+            block = f"{header}{label}: {body}\n"
+            tokens = self.count_tokens(block + SECTION_SEPARATOR)
+            if limit is not None and tokens > limit:
+                if limit < self.min_section_tokens:
+                    stats.skipped += 1
+                    continue
+                body = self._trim(body, query_terms, limit - self.count_tokens(header + SECTION_SEPARATOR) - 4)
+                block = f"{header}{label}: {body}\n"
+                tokens = self.count_tokens(block + SECTION_SEPARATOR)
+                stats.trimmed += 1
+
+            blocks.append(block)
+            stats.sections += 1
+            stats.tokens += tokens
+            if remaining is not None:
+                remaining -= tokens
+
+        # same layout as before: every block is followed by the separator
+        context = "".join(block + SECTION_SEPARATOR for block in blocks)
+        return context, stats
+
+    def _trim(self, body: str, query_terms: set, max_tokens: int) -> str:
+        """Keeps the passages that best match the question (in document order) within max_tokens."""
+        passages = [p for p in re.split(r"\n\s*\n|\n(?=[-*#]|\d+\.\s|Figure\s)", body) if p.strip()]
+        if not passages:
+            return body
+        costs = [self.count_tokens(p) + 1 for p in passages]
+        matched = [query_terms & set(tokenize(p)) for p in passages]
+
+        # a query term that occurs in few passages of the section says more about where the
+        # answer is than one that occurs everywhere ("cell" in a section about cells)
+        df = Counter(term for terms in matched for term in terms)
+        weights = [sum(math.log(1.0 + len(passages) / df[term]) for term in terms) for terms in matched]
+        # the passages around a match (the table after "Table 2.1 shows", the rest of a list)
+        # usually carry the answer too
+        scores = [weights[i] + self.neighbour_weight * max(weights[i - 1] if i else 0.0,
+                                                           weights[i + 1] if i + 1 < len(passages) else 0.0)
+                  for i in range(len(passages))]
+
+        # best first; ties go to the earlier passage, so the opening of the section is the
+        # fallback when nothing matches
+        order = sorted(range(len(passages)), key=lambda i: (-scores[i], i))
+        keep, used = set(), 0
+        for i in order:
+            if used + costs[i] <= max_tokens:
+                keep.add(i)
+                used += costs[i]
+
+        parts, previous = [], -1
+        for i in sorted(keep):
+            if i != previous + 1:
+                parts.append("...")
+            parts.append(passages[i].strip("\n"))
+            previous = i
+        if previous != len(passages) - 1:
+            parts.append("...")
+        return "\n".join(parts)
+
+
+def _dedupe(body: str, seen_lines: set) -> Tuple[str, int]:
+    kept, duplicates = [], 0
+    for line in body.split("\n"):
+        key = " ".join(re.findall(r"\d+(?:\.\d+)+|[^\W_]+", line.lower()))
+        if len(key) >= MIN_DEDUP_CHARS:
+            if key in seen_lines:
+                duplicates += 1
+                continue
+            seen_lines.add(key)
+        kept.append(line)
+    # drop the "Figures:" heading Section.to_dict adds when all of its captions were duplicates
+    while kept and (not kept[-1].strip() or kept[-1].strip() == "Figures:"):
+        kept.pop()
+    return "\n".join(kept), duplicates
+
+
+_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """Shared builder configured from CONTEXT_TOKEN_BUDGET (0 = unlimited) and CONTEXT_SECTION_TOKENS."""
+    global _builder
+    if _builder is None:
+        _builder = ContextBuilder(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+            max_section_tokens=int(os.getenv("CONTEXT_SECTION_TOKENS", "1500")),
+        )
+    return _builder
@@ -127,4 +127,19 @@ async def generate_response(context: str, question: str) -> str:
         model_settings={"temperature":0.2}
     )
 
-    return result.output
\ No newline at end of file
+    return result.output
+
+
+async def stream_response(context: str, question: str):
+    """
+    Same as `generate_response`, but yields (partial output, is_final) while the model is still
+    writing. Partial outputs are already routed to one of the three output types, so callers can
+    show `FinalAnswer.answer` as it grows; the last item is the validated final output.
+    """
+    async with agent.run_stream(
+        user_prompt=f"Context: {context}\n\nQuestion: {question}",
+        model_settings={"temperature":0.2}
+    ) as result:
+        async for partial in result.stream_output(debounce_by=None):
+            yield partial, False
+        yield await result.get_output(), True
\ No newline at end of file
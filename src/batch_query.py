@@ -0,0 +1,178 @@
+"""
+Answers many questions at once and streams the results into a CSV in the
+data/evaluation_data.csv layout (the input columns plus `answer` and `contexts`).
+
+    python -m src.batch_query data/evaluation_data.csv --output data/evaluation_answers.csv
+    python -m src.batch_query questions.csv --output answers.csv --concurrency 16
+
+Rows are written as their answers finish, so the output is in completion order; the input's
+index column (or the row position) identifies each row. Rerunning with the same --output skips
+the rows it already holds.
+"""
+import os
+import csv
+import time
+import asyncio
+import argparse
+import statistics
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+
+@dataclass
+class BatchAnswer:
+    index: int
+    question: str
+    answer: Optional[str] = None
+    context: str = ""
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchQueryRunner:
+    """
+    Runs the query pipeline for many questions with few round trips:
+    - questions are embedded `embed_batch_size` at a time (one embedding request per chunk)
+    - each chunk is retrieved `retrieval_batch_size` questions per `prepare` call (one UNWIND
+      query / one matrix product)
+    - answers are generated with at most `concurrency` calls in flight
+
+    Retrieval only runs ahead of generation by one chunk, so contexts for a 10k-question set
+    are never all held in memory. `run` yields a `BatchAnswer` as each question finishes; a
+    failed question is reported in its `error` instead of stopping the batch.
+    """
+    def __init__(self, embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 prepare: Callable[[List[str], List[List[float]]], Awaitable[List[Any]]],
+                 answer: Callable[[Any], Awaitable[Tuple[str, str]]],
+                 concurrency: int = 8, embed_batch_size: int = 512, retrieval_batch_size: int = 64):
+        self.embed = embed
+        self.prepare = prepare
+        self.answer = answer
+        self.concurrency = concurrency
+        self.embed_batch_size = embed_batch_size
+        self.retrieval_batch_size = retrieval_batch_size
+
+    async def run(self, questions: List[str], indices: Optional[List[int]] = None) -> AsyncIterator[BatchAnswer]:
+        indices = indices if indices is not None else list(range(len(questions)))
+        results: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def answer_one(position: int, prepared):
+            start = time.perf_counter()
+            try:
+                answer, context = await self.answer(prepared)
+                result = BatchAnswer(indices[position], questions[position], answer, context)
+            except Exception as e:
+                result = BatchAnswer(indices[position], questions[position], error=f"{type(e).__name__}: {e}")
+            finally:
+                slots.release()
+            result.seconds = time.perf_counter() - start
+            await results.put(result)
+
+        async def fail(positions, e: Exception):
+            for position in positions:
+                await results.put(BatchAnswer(indices[position], questions[position], error=f"{type(e).__name__}: {e}"))
+
+        async def produce():
+            tasks = []
+            for embed_start in range(0, len(questions), self.embed_batch_size):
+                chunk = range(embed_start, min(embed_start + self.embed_batch_size, len(questions)))
+                try:
+                    embeddings = await self.embed([questions[position] for position in chunk])
+                except Exception as e:
+                    await fail(chunk, e)
+                    continue
+                for offset in range(0, len(chunk), self.retrieval_batch_size):
+                    batch = chunk[offset:offset + self.retrieval_batch_size]
+                    try:
+                        prepared = await self.prepare([questions[position] for position in batch],
+                                                      embeddings[offset:offset + len(batch)])
+                    except Exception as e:
+                        await fail(batch, e)
+                        continue
+                    for position, item in zip(batch, prepared):
+                        # wait for a free generation slot before taking on more work
+                        await slots.acquire()
+                        tasks.append(asyncio.create_task(answer_one(position, item)))
+            await asyncio.gather(*tasks)
+
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(len(questions)):
+                yield await results.get()
+            await producer
+        finally:
+            # the caller stopped early: drop the questions still in flight
+            if not producer.done():
+                producer.cancel()
+
+
+def _done_indices(path: str, index_column: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {int(row[index_column]) for row in csv.DictReader(f) if row.get("answer")}
+
+
+async def main(input_path: str, output_path: str, concurrency: int, limit: Optional[int] = None):
+    from src.query import query_batch
+
+    with open(input_path, newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames)
+        rows = list(reader)[:limit]
+    # evaluation_data.csv carries a pandas index column with an empty name
+    index_column = "" if "" in fieldnames else "index"
+    if index_column not in fieldnames:
+        fieldnames.insert(0, index_column)
+    for column in ("answer", "contexts"):
+        if column not in fieldnames:
+            fieldnames.append(column)
+
+    done = _done_indices(output_path, index_column)
+    indices, questions, by_index = [], [], {}
+    for position, row in enumerate(rows):
+        index = int(row[index_column]) if row.get(index_column) else position
+        by_index[index] = dict(row, **{index_column: index})
+        if index not in done:
+            indices.append(index)
+            questions.append(row["user_input"])
+    print(f"{len(questions)} questions to answer ({len(done)} already in {output_path})")
+
+    start = time.perf_counter()
+    latencies, failed = [], 0
+    with open(output_path, "a" if done else "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if not done:
+            writer.writeheader()
+        async for result in query_batch(questions, indices=indices, concurrency=concurrency):
+            if not result.ok:
+                failed += 1
+                print(f"[{result.index}] failed: {result.error}")
+                continue
+            latencies.append(result.seconds)
+            writer.writerow(dict(by_index[result.index], answer=result.answer, contexts=result.context))
+            f.flush()
+            if len(latencies) % 50 == 0:
+                print(f"{len(latencies)}/{len(questions)} answered in {time.perf_counter() - start:.1f}s")
+
+    wall = time.perf_counter() - start
+    print(f"Answered {len(latencies)}/{len(questions)} questions in {wall:.1f}s "
+          f"({len(latencies) / wall if wall else 0:.2f}/s), {failed} failed")
+    if latencies:
+        print(f"Per-question latency: p50 {statistics.median(latencies):.2f}s, max {max(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer every user_input of a CSV with bounded concurrency")
+    parser.add_argument("input", nargs="?", default="data/evaluation_data.csv")
+    parser.add_argument("--output", default="data/evaluation_answers.csv")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_QUERY_CONCURRENCY", "8")),
+                        help="answers generated at the same time")
+    parser.add_argument("--limit", type=int, help="only the first N rows")
+    args = parser.parse_args()
+    asyncio.run(main(args.input, args.output, args.concurrency, args.limit))
@@ -2,9 +2,7 @@ from llama_parse import LlamaParse
 import nest_asyncio
 import os
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
-from io import BytesIO
-import base64
+from src.document_parser.rasterizer import rasterize_pdf, page_image_paths
 
 load_dotenv()
 nest_asyncio.apply()
@@ -38,29 +36,19 @@ class PDFParser(object):
             premium_mode=True
         )
 
-    def get_image_nodes(self,file_path: str, image_format='png'):
-        """Extract out text from images using a multimodal model."""
-         # self.parser.get_images(json_objs, download_path=download_path)
-        # img_text_nodes = []
-        # for image_dict in image_dicts:
-        #     image_doc = ImageDocument(image_path=image_dict["path"])
-        #     img_text_nodes.append(image_doc)
-
-        pages = convert_from_path(file_path, dpi=300)
-        image_dicts = {}
-
-        for idx, page in enumerate(pages, start=1):
-            buffered = BytesIO()
-            page.save(buffered, format=image_format)
-            img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            ext = image_format.lower()
-            image_dicts[idx] = {
-                "base64": img_str,
-                "ext": ext,
-                "data_uri": f"data:image/{ext};base64,{img_str}"
-            }
-
-        return image_dicts
+    def get_image_nodes(self, file_path: str, image_format: str = None, output_dir: str = None, dpi: int = None):
+        """
+        Render every page to a compressed image on disk (in parallel worker processes) and return
+        {page_number: image path}. The full manifest is kept in `<output_dir>/page_manifest.json`.
+        """
+        output_dir = output_dir or os.getenv("PAGE_RENDER_DIR", "page_images")
+        rasterize_pdf(
+            file_path,
+            output_dir,
+            dpi=dpi or int(os.getenv("PAGE_RENDER_DPI", "300")),
+            image_format=image_format or os.getenv("PAGE_RENDER_FORMAT", "JPEG"),
+        )
+        return page_image_paths(output_dir)
 
     def document_processing_llamaparse(self, file_path: str):
         """Parse document in using llamaparse and return extracted elements in json format"""
@@ -71,8 +59,14 @@ class PDFParser(object):
 
         return json_list, image_dicts
 
+    async def aparse_pages(self, file_path: str):
+        """Async LlamaParse call; returns the parsed pages only (see `get_image_nodes` for images)."""
+        json_objs = await self.parser.aget_json_result(file_path)
+        return json_objs[0]["pages"]
+
 
-llama_parser = PDFParser(parsing_ins=ins)
-# llamaparse to extract documents
-json_list, image_dicts = llama_parser.document_processing_llamaparse(
-    file_path="Cells and Chemistry of Life.pdf")
+if __name__ == "__main__":
+    llama_parser = PDFParser(parsing_ins=ins)
+    # llamaparse to extract documents
+    json_list, image_dicts = llama_parser.document_processing_llamaparse(
+        file_path="Cells and Chemistry of Life.pdf")
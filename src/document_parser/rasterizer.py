@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+MANIFEST_FILE = "page_manifest.json"
+
+# formats pdftoppm writes itself; anything else is rendered to PPM and re-encoded with PIL
+_NATIVE_FORMATS = {"JPEG": "jpeg", "PNG": "png"}
+_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+
+def rasterize_pdf(file_path: str, output_dir: str,
+                  dpi: int = 300,
+                  image_format: str = "JPEG",
+                  quality: int = 85,
+                  pages_per_task: int = 8,
+                  max_workers: Optional[int] = None) -> Dict:
+    """
+    Renders every page of `file_path` to a compressed image in the content-addressed store
+    `<output_dir>/<sha[:2]>/<sha>.<ext>` and writes `<output_dir>/page_manifest.json`
+    ({"pages": {page_number: {"path", "sha256", "width", "height", "bytes"}}, ...}).
+
+    Page ranges of `pages_per_task` are rendered in worker processes straight to disk, so memory
+    is bounded by one range per worker instead of the whole book. Pages already in the manifest
+    (same source, dpi and format) are skipped, which makes an interrupted run resumable.
+    """
+    image_format = image_format.upper()
+    if image_format not in _EXTENSIONS:
+        raise ValueError(f"Unsupported page image format: {image_format!r}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    settings = {"source": os.path.abspath(file_path), "dpi": dpi, "format": image_format, "quality": quality}
+    manifest = load_page_manifest(output_dir)
+    if manifest is None or any(manifest.get(key) != value for key, value in settings.items()):
+        manifest = dict(settings, pages={})
+
+    num_pages = pdfinfo_from_path(file_path)["Pages"]
+    missing = [page for page in range(1, num_pages + 1)
+               if str(page) not in manifest["pages"]
+               or not os.path.exists(os.path.join(output_dir, manifest["pages"][str(page)]["path"]))]
+    ranges = _page_ranges(missing, pages_per_task)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_render_range, file_path, output_dir, first, last, dpi, image_format, quality)
+                   for first, last in ranges]
+        for future in as_completed(futures):
+            manifest["pages"].update({str(page): entry for page, entry in future.result().items()})
+            # checkpoint after every range
+            _write_manifest(output_dir, manifest)
+
+    manifest["num_pages"] = num_pages
+    _write_manifest(output_dir, manifest)
+    return manifest
+
+
+def load_page_manifest(output_dir: str) -> Optional[Dict]:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def page_image_paths(output_dir: str) -> Dict[int, str]:
+    """page number -> absolute image path, from a manifest written by `rasterize_pdf`."""
+    manifest = load_page_manifest(output_dir) or {"pages": {}}
+    return {int(page): os.path.abspath(os.path.join(output_dir, entry["path"]))
+            for page, entry in sorted(manifest["pages"].items(), key=lambda item: int(item[0]))}
+
+
+def _page_ranges(pages: List[int], size: int) -> List[Tuple[int, int]]:
+    """Groups sorted page numbers into contiguous (first, last) ranges of at most `size` pages."""
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < size:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def _render_range(file_path: str, output_dir: str, first: int, last: int,
+                  dpi: int, image_format: str, quality: int) -> Dict[int, Dict]:
+    entries = {}
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        native = _NATIVE_FORMATS.get(image_format)
+        paths = convert_from_path(
+            file_path, dpi=dpi, first_page=first, last_page=last,
+            output_folder=tmp_dir, fmt=native or "ppm", paths_only=True,
+            jpegopt={"quality": quality, "optimize": True} if native == "jpeg" else None,
+        )
+        # pdftoppm names files <prefix>-<page>.<ext>, sorted by page
+        for page, path in zip(range(first, last + 1), sorted(paths)):
+            with Image.open(path) as image:
+                width, height = image.size
+                if native is None:
+                    converted = f"{path}.{_EXTENSIONS[image_format]}"
+                    image.save(converted, format=image_format, quality=quality)
+                    os.remove(path)
+                    path = converted
+            entries[page] = dict(_store(path, output_dir, _EXTENSIONS[image_format]), width=width, height=height)
+    return entries
+
+
+def _store(path: str, output_dir: str, ext: str) -> Dict:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    sha = digest.hexdigest()
+    relative = os.path.join(sha[:2], f"{sha}.{ext}")
+    target = os.path.join(output_dir, relative)
+    size = os.path.getsize(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.replace(path, target)
+    return {"path": relative, "sha256": sha, "bytes": size}
+
+
+def _write_manifest(output_dir: str, manifest: Dict):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render PDF pages to a content-addressed image store")
+    parser.add_argument("pdf")
+    parser.add_argument("output_dir")
+    parser.add_argument("--dpi", type=int, default=int(os.getenv("PAGE_RENDER_DPI", "300")))
+    parser.add_argument("--format", default=os.getenv("PAGE_RENDER_FORMAT", "JPEG"))
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    result = rasterize_pdf(args.pdf, args.output_dir, dpi=args.dpi, image_format=args.format,
+                           quality=args.quality, max_workers=args.workers)
+    total = sum(entry["bytes"] for entry in result["pages"].values())
+    print(f"Rendered {len(result['pages'])} pages ({total / 2 ** 20:.1f} MiB) into {args.output_dir}")
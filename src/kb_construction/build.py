@@ -1,79 +1,105 @@
 import os
 import json
+import time
 import asyncio
+import argparse
 from dotenv import load_dotenv
 from doc_distiller import Distiller
 from models import Unit
 from kb_loader import Neo4jKBLoader
-from utils import get_embedding
+from bulk_loader import Neo4jBulkLoader
+from embedding_pipeline import EmbeddingPipeline
+from embedding_cache import get_embedding_cache
+from manifest import BuildManifest
+from mention_registry import get_mention_registry
+from build_version import write_build_version
+from page_stream import iter_unit_strings
 from src.kb_construction.models import PageImage
+from src.kb_retrieval.local_vector_index import export_kb
+from src.kb_retrieval.ann_index import build_ann_for_export, update_ann_for_export
+from src.kb_retrieval.page_image_store import get_page_image_store
+from src.kb_retrieval.figure_index import write_figure_index
+from src.kb_retrieval.lexical_index import build_lexical_index
+from src.kb_retrieval.reranker import build_rerank_features
+from src.kb_retrieval.mention_graph import build_mention_graph
 
 load_dotenv()
 
 DOCUMENT_PATH = "document_pages.json"
+MANIFEST_PATH = os.getenv("KB_MANIFEST_PATH", "kb_manifest.json")
 
 
 # ----------------------------------------
 
-def enrich_embeddings(units):
+async def enrich_embeddings(units, pipeline: EmbeddingPipeline = None):
+    pipeline = pipeline or EmbeddingPipeline(
+        cache=get_embedding_cache(),
+        max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "8")),
+    )
+
+    entities = []
     for unit in units:
-        unit.embedding = get_embedding(repr(unit))
+        entities.append(unit)
         for section in getattr(unit, "sections", []):
-            section.embedding = get_embedding(repr(section))
-            for mention in getattr(section, "mentions", []):
-                mention.embedding = get_embedding(repr(mention))
-            for fig in getattr(section, "fig_refs", []):
-                fig.embedding = get_embedding(repr(fig))
-    return units
-
-
-def clean_markdown(json_list):
-    """Pre-process markdown as in Distiller.main"""
-    for idx, item in enumerate(json_list):
-        md_lines = [
-            line for line in item['md'].split("\n")[:-1]
-            if line.strip() != "" and line.count("#") not in [1, 2]
-        ]
-        json_list[idx]['md'] = (
-                f"\npage_number: {str(item['page'])}\n"
-                + "\n".join(md_lines)
-                + f"\npage_number: {str(item['page'])}"
-        )
+            entities.append(section)
+            entities.extend(getattr(section, "mentions", []))
+            entities.extend(getattr(section, "fig_refs", []))
 
-    return json_list
+    embeddings = await pipeline.embed([repr(entity) for entity in entities])
+    for entity, embedding in zip(entities, embeddings):
+        entity.embedding = embedding
 
+    print(f"Embedded {pipeline.stats.unique_texts} unique texts "
+          f"(of {pipeline.stats.texts}, {pipeline.stats.cached_texts} from cache) in {pipeline.stats.requests} requests")
+    return units
 
-async def main():
-    # 1. Load and clean the document
-    with open(DOCUMENT_PATH, "r") as f:
-        json_list = json.load(f)
-    json_list = clean_markdown(json_list)
-
-    markdown_text = "\n[BREAK_PAGE]\n".join([item['md'] for item in json_list if item['md'] != ""])
 
-    # 2. Distill into units, sections, figures,..
-    distiller = Distiller(output_type=Unit)
-    units = await distiller.distill(markdown_text)
+async def main(incremental: bool = False):
+    # 1. Stream the document page by page into unit strings
+    # only units whose text changed since the last build are distilled / embedded / written
+    manifest = BuildManifest.load(MANIFEST_PATH) if incremental else BuildManifest(MANIFEST_PATH)
+    unit_strings, fingerprints, todo = [], [], []
+    start = time.perf_counter()
+
+    def pending_units():
+        for unit_string in iter_unit_strings(DOCUMENT_PATH):
+            fp = BuildManifest.fingerprint(unit_string)
+            unit_strings.append(unit_string)
+            fingerprints.append(fp)
+            if fp not in manifest.entries:
+                todo.append(len(fingerprints) - 1)
+                yield unit_string
+
+    # 2. Distill into units, sections, figures,.. (starts on the first unit while the rest is read)
+    # mention ids come from the persistent registry; ids of earlier manifest-based builds are kept
+    registry = get_mention_registry()
+    if manifest.mention_ids:
+        registry.import_mapping(manifest.mention_ids, manifest.mention_counter)
+    distiller = Distiller(output_type=Unit, entity_manager=registry)
+    distilled = await distiller.distill_units(pending_units())
+    built = [(fingerprints[i], unit) for i, unit in zip(todo, distilled) if unit is not None]
+    units = [unit for _, unit in built]
+    current = set(fingerprints)
+    removed = [fp for fp in manifest.entries if fp not in current]
+    if removed and len(built) < len(todo):
+        # a changed unit that failed to distill would lose its old nodes with nothing to replace
+        # them; keep the old entries until a build distills everything
+        print(f"{len(todo) - len(built)} units failed to distill, keeping the {len(removed)} removed units until the next build")
+        removed = []
 
     # 3. Generate embeddings
-    _ = enrich_embeddings(units)
+    _ = await enrich_embeddings(units)
 
     # 4. Load into Neo4j
     loader = Neo4jKBLoader(os.getenv("NEO4J_URI"), os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+    loader.ensure_schema()
 
-    for unit in units:
-        loader.upsert_node("Unit", unit)
-        for section in getattr(unit, "sections", []):
-            loader.upsert_node("Section", section)
-            loader.upsert_relationship(unit.id, section.id, "HAS_SECTION")
-            for mention in getattr(section, "mentions", []):
-                loader.upsert_node("Mention", mention)
-                loader.upsert_relationship(section.id, mention.id, "HAS_MENTION")
-            for fig in getattr(section, "fig_refs", []):
-                loader.upsert_node("FigureRef", fig)
-                loader.upsert_relationship(section.id, fig.id, "HAS_FIGURE")
+    for fp in removed:
+        loader.delete_nodes(manifest.remove(fp)["node_ids"])
+
+    bulk_loader = Neo4jBulkLoader(loader, batch_size=int(os.getenv("NEO4J_BATCH_SIZE", "500")))
 
-    loader.create_vector_index(embedding_dim=1536, similarity_metric="cosine")
+    bulk_loader.add_units(units)
 
     # load images
     with open("image_dict.json", "r") as f:
@@ -81,11 +107,65 @@ async def main():
 
     for page_number, url in image_dicts.items():
         page_image = PageImage(
+            id=f"page_image_{page_number}",
             page_number=page_number,
             url=url,
         )
-        loader.upsert_node("PageImage", page_image)
+        bulk_loader.add_node("PageImage", page_image)
+
+    stats = bulk_loader.flush()
+    print(f"Loaded KB: {stats}")
+
+    loader.create_vector_index(embedding_dim=1536, similarity_metric="cosine", recreate=not incremental)
+
+    # snapshot for the in-process retriever (RETRIEVER_BACKEND=local)
+    exported = export_kb(loader, os.getenv("KB_INDEX_DIR", "kb_index"))
+    print(f"Exported {exported} node embeddings for the local retriever")
+    # kept up to date whenever one exists, so switching to RETRIEVER_BACKEND=ann never serves a stale index
+    index_dir = os.getenv("KB_INDEX_DIR", "kb_index")
+    if os.getenv("RETRIEVER_BACKEND", "neo4j").lower() == "ann" or os.path.isdir(os.path.join(index_dir, "ann")):
+        if incremental:
+            # reuses the trained quantiser and the codes of unchanged rows, encodes only the new ones
+            ann_index, encoded = update_ann_for_export(index_dir)
+        else:
+            ann_index = build_ann_for_export(index_dir)
+            encoded = len(ann_index)
+        print(f"IVF-PQ index over {len(ann_index)} vectors ({ann_index.nlist} lists), {encoded} encoded this build")
+    loader.close()
+
+    # 5. Remember what was built for the next incremental run
+    elapsed = time.perf_counter() - start
+    for fp, unit in built:
+        manifest.record(fp, unit, build_seconds=elapsed / len(built))
+    manifest.save()
+
+    # static figure label -> page image table for the query service, over every unit in the KB
+    all_units = [manifest.get_unit(fp) for fp in manifest.entries]
+    # a single document: no doc_id
+    page_image_urls = {(None, int(page_number)): url for page_number, url in image_dicts.items()}
+    print(f"Indexed {write_figure_index(all_units, page_image_urls)} figure labels")
+    print(f"Indexed {build_lexical_index(all_units, os.getenv('KB_INDEX_DIR', 'kb_index'))} sections for lexical search")
+    print(f"Cached reranking features for {build_rerank_features(all_units, os.getenv('KB_INDEX_DIR', 'kb_index'))} sections")
+    print(f"Exported the mention graph of {build_mention_graph(all_units, os.getenv('KB_INDEX_DIR', 'kb_index'))} sections")
+    print(f"KB build version: {write_build_version()}")
+
+    todo_fps = {fingerprints[i] for i in todo}
+    skipped = [fp for fp in fingerprints if fp not in todo_fps]
+    saved_seconds = sum(manifest.entries[fp]["build_seconds"] for fp in skipped if fp in manifest.entries)
+    print(f"Mentions: {len(registry)} in the registry, {registry.merged} merged into near-duplicates this build")
+    print(f"Units: {len(unit_strings)} total, {len(skipped)} skipped, {len(built)} rebuilt, "
+          f"{len(todo) - len(built)} failed, {len(removed)} removed. "
+          f"Took {elapsed:.1f}s, saved ~{saved_seconds:.1f}s")
+
+    # last, so an unreachable page cannot stop the build: download / downscale / encode every
+    # page once so queries only read the local store (failed pages are fetched on first use)
+    ready = await get_page_image_store().prefetch(list(image_dicts.values()))
+    print(f"Prefetched {ready} page images")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Build the KB from document_pages.json")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rebuild units whose text changed since the last build (see KB_MANIFEST_PATH)")
+    args = parser.parse_args()
+    asyncio.run(main(incremental=args.incremental))
@@ -0,0 +1,38 @@
+import os
+import json
+import time
+import uuid
+from typing import Optional
+
+
+def build_version_path() -> str:
+    return os.path.join(os.getenv("KB_INDEX_DIR", "kb_index"), "build_version.json")
+
+
+def write_build_version() -> str:
+    """Stamps a new KB build; query-side caches compare against it to drop stale entries."""
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = build_version_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": version, "built_at": time.time()}, f)
+    os.replace(tmp_path, path)
+    return version
+
+
+_cached = (None, None)
+
+
+def read_build_version() -> Optional[str]:
+    """Current build version, or None before the first build. Only re-reads the file when it changes."""
+    global _cached
+    path = build_version_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _cached[0] != mtime:
+        with open(path, "r") as f:
+            _cached = (mtime, json.load(f)["version"])
+    return _cached[1]
@@ -0,0 +1,174 @@
+import os
+import atexit
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from neo4j import GraphDatabase, AsyncGraphDatabase, Driver, AsyncDriver
+
+load_dotenv()
+
+
+class Neo4jConnectionManager:
+    """
+    Owns a single long-lived Neo4j driver (and its connection pool) for the whole process.
+    Everything that talks to the KB should borrow sessions from here instead of creating drivers.
+    The async driver (`async_driver` / `async_session`) serves the query path, the sync one the
+    build scripts; both share the same pool settings.
+    """
+    def __init__(self, uri: str, user: str, password: str,
+                 max_connection_pool_size: int = 50,
+                 connection_acquisition_timeout: float = 30.0,
+                 max_connection_lifetime: float = 3600.0,
+                 database: Optional[str] = None):
+        self.uri = uri
+        self.database = database
+        self._driver: Optional[Driver] = None
+        # async drivers are bound to the event loop that created them, so there is one per loop
+        self._async_drivers: Dict[asyncio.AbstractEventLoop, AsyncDriver] = {}
+        self._lock = threading.Lock()
+        self._driver_kwargs = dict(
+            auth=(user, password),
+            max_connection_pool_size=max_connection_pool_size,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+            max_connection_lifetime=max_connection_lifetime,
+        )
+
+    @property
+    def driver(self) -> Driver:
+        # created lazily so importing modules never opens sockets
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = GraphDatabase.driver(self.uri, **self._driver_kwargs)
+        return self._driver
+
+    @property
+    def async_driver(self) -> AsyncDriver:
+        # async drivers are bound to an event loop; callers that use `asyncio.run` per call
+        # (scripts, notebooks) get a fresh driver per loop instead of a broken one, and the
+        # drivers of loops that have since been closed are closed instead of leaking their pools
+        loop = asyncio.get_running_loop()
+        driver = self._async_drivers.get(loop)
+        if driver is None:
+            stale = []
+            with self._lock:
+                driver = self._async_drivers.get(loop)
+                if driver is None:
+                    stale = [self._async_drivers.pop(old) for old in list(self._async_drivers) if old.is_closed()]
+                    driver = self._async_drivers[loop] = AsyncGraphDatabase.driver(self.uri, **self._driver_kwargs)
+            for old_driver in stale:
+                loop.create_task(_close_async_driver(old_driver))
+        return driver
+
+    @asynccontextmanager
+    async def async_session(self, **kwargs):
+        if self.database and "database" not in kwargs:
+            kwargs["database"] = self.database
+        async with self.async_driver.session(**kwargs) as session:
+            yield session
+
+    @contextmanager
+    def session(self, **kwargs):
+        if self.database and "database" not in kwargs:
+            kwargs["database"] = self.database
+        with self.driver.session(**kwargs) as session:
+            yield session
+
+    def warmup(self, num_connections: int = 1) -> None:
+        """
+        Verify connectivity (TLS handshake + routing table) and open `num_connections` pooled
+        connections up front so the first user request does not pay for them.
+        """
+        self.driver.verify_connectivity()
+        sessions = [self.driver.session(database=self.database) for _ in range(max(num_connections, 0))]
+        try:
+            for session in sessions:
+                session.run("RETURN 1").consume()
+        finally:
+            for session in sessions:
+                session.close()
+
+    async def async_warmup(self, num_connections: int = 1) -> None:
+        """Same as `warmup`, for the async driver (must run on the event loop that serves queries)."""
+        await self.async_driver.verify_connectivity()
+
+        async def ping():
+            async with self.async_session() as session:
+                await (await session.run("RETURN 1")).consume()
+
+        await asyncio.gather(*[ping() for _ in range(max(num_connections, 0))])
+
+    def health_check(self) -> bool:
+        """Returns True if the server answers a trivial query."""
+        try:
+            with self.session() as session:
+                return session.run("RETURN 1 AS ok").single()["ok"] == 1
+        except Exception as e:
+            print(f"Neo4j health check failed: {e}")
+            return False
+
+    async def aclose(self) -> None:
+        with self._lock:
+            async_drivers, self._async_drivers = list(self._async_drivers.values()), {}
+        for async_driver in async_drivers:
+            await _close_async_driver(async_driver)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._driver is not None:
+                self._driver.close()
+                self._driver = None
+            async_drivers, self._async_drivers = self._async_drivers, {}
+        for loop, async_driver in async_drivers.items():
+            # each async driver is tied to the loop that used it; at this point that loop is usually gone
+            try:
+                if loop.is_closed() or loop.is_running():
+                    asyncio.run(_close_async_driver(async_driver))
+                else:
+                    loop.run_until_complete(_close_async_driver(async_driver))
+            except Exception as e:
+                print(f"Could not close async Neo4j driver cleanly: {e}")
+
+
+async def _close_async_driver(driver: AsyncDriver) -> None:
+    try:
+        await driver.close()
+    except Exception as e:
+        print(f"Could not close async Neo4j driver cleanly: {e}")
+
+
+_manager: Optional[Neo4jConnectionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager() -> Neo4jConnectionManager:
+    """
+    Returns the process-wide connection manager, configured from the environment:
+    NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE, NEO4J_MAX_POOL_SIZE,
+    NEO4J_ACQUISITION_TIMEOUT.
+    """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = Neo4jConnectionManager(
+                    os.getenv("NEO4J_URI"),
+                    os.getenv("NEO4J_USER"),
+                    os.getenv("NEO4J_PASSWORD"),
+                    max_connection_pool_size=int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")),
+                    connection_acquisition_timeout=float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30")),
+                    database=os.getenv("NEO4J_DATABASE"),
+                )
+                atexit.register(close_connection_manager)
+    return _manager
+
+
+def close_connection_manager() -> None:
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
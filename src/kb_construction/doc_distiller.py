@@ -1,48 +1,142 @@
+import os
 from pydantic import BaseModel
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.models.openai import ModelSettings
-from models import Unit, Mention
-from utils import split_into_units
-from typing import Type, List
+from models import Unit, Section
+from utils import split_into_units, split_unit_into_chunks
+from typing import Type, Iterable, List, Optional, Sequence
 from entity_manager import EntityManager
-from src.kb_construction.utils import task_group_gather
+from page_stream import iter_unit_strings
+from src.kb_construction.scheduler import ExtractionScheduler
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-class Distiller:
-    def __init__(self, output_type: Type[BaseModel]):
-        self.agent = create_distiller_agent(output_type)
-        self.entity_manager = EntityManager()
+class SectionBatch(BaseModel):
+    sections: list[Section]
 
-    async def distill(self, markdown_text:str) -> List[Unit]:
-        unit_strings: list[str] = split_into_units(markdown_text)
 
-        async def distill_unit(unit_string):
-            result = await self.agent.run(unit_string)
-            unit_obj: Unit = result.output
+class UnitSummary(BaseModel):
+    summary: str
 
-            for section in unit_obj.sections:
-                mentions = section.mentions
-                for mention in mentions:
-                    mention.id =  self.entity_manager.get_id(mention.string)
-
-            return unit_obj
 
+class Distiller:
+    """
+    Units longer than `chunk_chars` (DISTILL_CHUNK_CHARS, 0 disables) are not distilled in one call:
+    they are split on their section headings, the chunks are distilled into Sections in parallel
+    and merged back into a Unit, with a short extra call for the unit summary. This bounds the
+    output tokens of every call, so the largest unit no longer sets the build time.
+    """
+    def __init__(self, output_type: Type[BaseModel], chunk_chars: Optional[int] = None, entity_manager=None):
+        self.agent = create_distiller_agent(output_type)
+        self.section_agent = create_section_agent()
+        self.summary_agent = create_unit_summary_agent()
+        # an EntityManager or a persistent MentionRegistry
+        self.entity_manager = entity_manager or EntityManager()
+        self.chunk_chars = chunk_chars if chunk_chars is not None else int(os.getenv("DISTILL_CHUNK_CHARS", "16000"))
 
-        unit_objs = await task_group_gather(
-            [
-                lambda i=i: distill_unit(
-                    unit_string=unit_strings[i]
-                )
-                for i in range(len(unit_strings))
-            ],
-            timeout_seconds=180
+    async def distill(self, markdown_text:str) -> List[Unit]:
+        unit_strings: list[str] = split_into_units(markdown_text)
+        return await self.distill_units(unit_strings)
+
+    async def distill_units(self, unit_strings: Iterable[str]) -> List[Optional[Unit]]:
+        """
+        Distills each unit string; the result is aligned with the input (None for failed units).
+        `unit_strings` may be a generator (see page_stream.iter_unit_strings): distillation of a
+        unit starts once its window of DISTILL_SORT_WINDOW jobs is read (each window runs
+        longest-first). Concurrency and the tokens-per-minute budget come from DISTILL_CONCURRENCY
+        and DISTILL_TOKENS_PER_MINUTE.
+        """
+        scheduler = ExtractionScheduler(
+            max_concurrency=int(os.getenv("DISTILL_CONCURRENCY", "8")),
+            tokens_per_minute=int(os.getenv("DISTILL_TOKENS_PER_MINUTE", "200000")),
+            max_retries=int(os.getenv("DISTILL_MAX_RETRIES", "5")),
+            timeout_seconds=float(os.getenv("DISTILL_TIMEOUT_SECONDS", "180")),
+            sort_window=int(os.getenv("DISTILL_SORT_WINDOW", "32")),
+        )
+        num_units = 0
+        jobs = []
+
+        # one job per small unit, one per section chunk of an oversized unit
+        def iter_jobs():
+            nonlocal num_units
+            for index, unit_string in enumerate(unit_strings):
+                num_units += 1
+                if self.chunk_chars and len(unit_string) > self.chunk_chars:
+                    unit_title, chunks = split_unit_into_chunks(unit_string, self.chunk_chars)
+                    new_jobs = [(index, unit_title, self.section_agent, chunk) for chunk in chunks]
+                else:
+                    new_jobs = [(index, None, self.agent, unit_string)]
+                jobs.extend(new_jobs)
+                yield from new_jobs
+
+        summary = await scheduler.run(
+            list(iter_jobs()) if isinstance(unit_strings, Sequence) else iter_jobs(),
+            lambda job: job[2].run(job[3]),
+            text=lambda job: job[3],
         )
+        print(summary)
+
+        units: List[Optional[Unit]] = [None] * num_units
+        chunked = {}
+        failed = set()
+        for (index, unit_title, _, _), result in zip(jobs, summary.results):
+            if not result.ok:
+                failed.add(index)
+            elif unit_title is None:
+                units[index] = result.output.output
+            else:
+                chunked.setdefault(index, (unit_title, []))[1].append(result.output.output.sections)
+
+        # a chunked unit is only usable if every chunk came back
+        merged = [(index, unit_title, _merge_sections(section_lists))
+                  for index, (unit_title, section_lists) in chunked.items() if index not in failed]
+        prompts = [_unit_summary_prompt(unit_title, sections) for _, unit_title, sections in merged]
+        summaries = await scheduler.run(prompts, self.summary_agent.run)
+        for (index, unit_title, sections), result in zip(merged, summaries.results):
+            if result.ok:
+                units[index] = Unit(unit_title=unit_title, summary=result.output.output.summary, sections=sections)
+
+        # mention ids are assigned in document order, so they do not depend on completion order
+        mentions = [mention for unit_obj in units if unit_obj is not None
+                    for section in unit_obj.sections for mention in section.mentions]
+        mention_ids = await self.entity_manager.resolve_many([mention.string for mention in mentions])
+        for mention, mention_id in zip(mentions, mention_ids):
+            mention.id = mention_id
+        # variants merged into an existing id take its surface form, so every node written for
+        # that id carries the same string (and therefore the same embedding)
+        surfaces = getattr(self.entity_manager, "surfaces", None)
+        if surfaces is not None:
+            for mention, surface in zip(mentions, surfaces(mention_ids)):
+                if surface is not None:
+                    mention.string = surface
+
+        return units
+
+
+def _merge_sections(section_lists: List[List[Section]]) -> List[Section]:
+    """Concatenates chunk results; a section cut by a chunk boundary is stitched back together."""
+    merged: List[Section] = []
+    for sections in section_lists:
+        for i, section in enumerate(sections):
+            previous = merged[-1] if merged else None
+            if i == 0 and previous is not None and previous.section_title.strip().lower() == section.section_title.strip().lower():
+                previous.content = f"{previous.content}\n{section.content}"
+                previous.fig_refs.extend(section.fig_refs)
+                known = {mention.string.lower() for mention in previous.mentions}
+                previous.mentions.extend(m for m in section.mentions if m.string.lower() not in known)
+            else:
+                merged.append(section)
+    return merged
+
+
+def _unit_summary_prompt(unit_title: str, sections: List[Section]) -> str:
+    return f"Unit Title: {unit_title}\n\n" + "\n\n".join(
+        f"### {section.section_title}\n{section.summary}" for section in sections
+    )
 
-        return unit_objs
 
 def create_distiller_agent(output_type: Type[BaseModel]) -> Agent:
     agent = Agent(
@@ -90,18 +184,41 @@ Note: there are section where continue between pagges ([BREAK_PAGE] tag), notice
 
     return agent
 
-async def main():
+def create_section_agent() -> Agent:
+    """Distills one chunk of a unit (a run of consecutive sections) into Section objects."""
+    return Agent(
+        model=OpenAIModel(model_name="gpt-4.1-mini"),
+        output_type=SectionBatch,
+        system_prompt="""
+You are a helpful assistant tasked with converting one part of a parsed textbook unit into a list of `Section` objects. The input may originate from OCR or PDF parsing and may include inconsistent formatting, out-of-order blocks, or duplicated content. The unit title is given on the first line; other parts of the same unit are processed separately.
+
+Note: there are section where continue between pagges ([BREAK_PAGE] tag), notice this and do not lost any content in the section. The part may start or end in the middle of a section: keep the section title you see (or the nearest heading above) and return the content that is present.
+
+## Core Guidelines
+- Use 3- or 4-level Markdown headers to detect sections, in their natural reading order.
+- Reposition misplaced figures and callout boxes (e.g., *Word Alert*, *Helpful Note*) into the correct section using best judgment.
+- Do **not** fabricate or omit any information, and never invent or alter section titles.
+- Use the **page number marker** (usually found below the figure) to assign figure page numbers.
+""",
+        retries=3,
+    )
 
-    distiller = Distiller(output_type=Unit)
-    import json
-    json_list = json.load(open("document_pages.json", "r"))
 
-    for idx, item in enumerate(json_list):
-        json_list[idx]['md'] =  f"\npage_number: {str(item['page'])}\n" + f"\n".join([line for line in item['md'].split("\n")[:-1] if
-                                          line.strip() != "" and line.count("#") not in [1,2]]) + f"\npage_number: {str(item['page'])}"
+def create_unit_summary_agent() -> Agent:
+    """Writes the unit summary from the summaries of its (separately distilled) sections."""
+    return Agent(
+        model=OpenAIModel(model_name="gpt-4.1-mini"),
+        output_type=UnitSummary,
+        system_prompt="""
+You are given the title of a textbook unit and the summaries of all its sections. Write the summary of the unit, 150-200 words, using only the information given.
+""",
+        retries=3,
+    )
 
-    markdown_text = "\n[BREAK_PAGE]\n".join([item['md'] for item in json_list if item['md'] != ""])
-    units = await distiller.distill(markdown_text)
+async def main():
+
+    distiller = Distiller(output_type=Unit)
+    units = await distiller.distill_units(iter_unit_strings("document_pages.json"))
     print(units)
 
 # import asyncio
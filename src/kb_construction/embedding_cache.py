@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: key = sha256(model name + normalised text).
+    A small in-memory LRU sits in front of a SQLite file that stores vectors as float32 blobs
+    and is trimmed to `max_disk_items` by least-recent access.
+    """
+    def __init__(self, path: str = ".cache/embeddings.sqlite",
+                 max_memory_items: int = 10_000,
+                 max_disk_items: int = 1_000_000):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        (self._disk_count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        normalised = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model_name}\x00{normalised}".encode("utf-8")).hexdigest()
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model_name, [text]).get(text)
+
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[str, List[float]]:
+        """Returns {text: vector} for the texts that are cached; the rest count as misses."""
+        with self._lock:
+            found, disk_lookups = self._lookup_memory(model_name, texts)
+            if disk_lookups:
+                self._lookup_disk(disk_lookups, found)
+            self._count(texts, found)
+        return found
+
+    async def aget(self, model_name: str, text: str) -> Optional[List[float]]:
+        return (await self.aget_many(model_name, [text])).get(text)
+
+    async def aget_many(self, model_name: str, texts: List[str]) -> Dict[str, List[float]]:
+        """`get_many` for the event loop: memory hits are served inline, SQLite runs in a thread."""
+        with self._lock:
+            found, disk_lookups = self._lookup_memory(model_name, texts)
+            if not disk_lookups:
+                self._count(texts, found)
+                return found
+
+        def lookup_disk():
+            with self._lock:
+                self._lookup_disk(disk_lookups, found)
+                self._count(texts, found)
+
+        await asyncio.to_thread(lookup_disk)
+        return found
+
+    def put(self, model_name: str, text: str, vector: List[float]):
+        self.put_many(model_name, {text: vector})
+
+    def put_many(self, model_name: str, vectors: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in vectors.items():
+                key = self.make_key(model_name, text)
+                self._remember(key, list(vector))
+                rows.append((key, _encode(vector), now))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            # upper bound (replaced rows are counted too); only recounted once it passes the limit
+            self._disk_count += len(rows)
+            self._evict_disk()
+            self._conn.commit()
+
+    async def aput(self, model_name: str, text: str, vector: List[float]):
+        await self.aput_many(model_name, {text: vector})
+
+    async def aput_many(self, model_name: str, vectors: Dict[str, List[float]]):
+        await asyncio.to_thread(self.put_many, model_name, vectors)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup_memory(self, model_name: str, texts: List[str]):
+        found: Dict[str, List[float]] = {}
+        disk_lookups: Dict[str, List[str]] = {}
+        for text in texts:
+            key = self.make_key(model_name, text)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[text] = self._memory[key]
+                self.memory_hits += 1
+            else:
+                disk_lookups.setdefault(key, []).append(text)
+        return found, disk_lookups
+
+    def _lookup_disk(self, disk_lookups: Dict[str, List[str]], found: Dict[str, List[float]]):
+        keys = list(disk_lookups)
+        now = time.time()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = _decode(blob)
+                self._remember(key, vector)
+                for text in disk_lookups[key]:
+                    found[text] = vector
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key, _ in rows]
+            )
+        self._conn.commit()
+
+    def _count(self, texts: List[str], found: Dict[str, List[float]]):
+        hits = sum(1 for text in texts if text in found)
+        self.hits += hits
+        self.misses += len(texts) - hits
+
+    def _evict_disk(self):
+        # the running count is an upper bound, so the table is only scanned near the limit
+        if self._disk_count <= self.max_disk_items:
+            return
+        (self._disk_count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if self._disk_count > self.max_disk_items:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (self._disk_count - self.max_disk_items,),
+            )
+            self._disk_count = self.max_disk_items
+
+
+def _encode(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _decode(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache configured from EMBEDDING_CACHE_PATH / EMBEDDING_CACHE_MEMORY_ITEMS / EMBEDDING_CACHE_DISK_ITEMS."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite"),
+                    max_memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000")),
+                    max_disk_items=int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "1000000")),
+                )
+    return _cache
@@ -0,0 +1,158 @@
+import math
+import random
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Optional
+
+from src.kb_construction.embedding_cache import EmbeddingCache
+from src.kb_construction.retry import is_retryable_error, retry_after_seconds, backoff_delay
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a chars/4 estimate
+    tiktoken = None
+
+
+class EmbeddingBackend(ABC):
+    """Something that turns a batch of texts into vectors, in input order."""
+    model_name: str
+
+    @abstractmethod
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model_name: str = "text-embedding-3-small", client=None):
+        from openai import AsyncOpenAI
+        self.model_name = model_name
+        self.client = client or AsyncOpenAI()
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(input=texts, model=self.model_name)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic offline embedder: the vector is seeded from a hash of the text, so equal texts
+    always get equal unit vectors. `latency_seconds` simulates the network round trip.
+    """
+    def __init__(self, dim: int = 1536, latency_seconds: float = 0.0, model_name: str = "fake-embedding"):
+        self.dim = dim
+        self.latency_seconds = latency_seconds
+        self.model_name = model_name
+        self.calls = 0
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return [self.embed_one(text) for text in texts]
+
+    def embed_one(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dim)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+@dataclass
+class EmbeddingPipelineStats:
+    texts: int = 0
+    unique_texts: int = 0
+    cached_texts: int = 0
+    requests: int = 0
+    retries: int = 0
+
+
+class EmbeddingPipeline:
+    """
+    Embeds many texts with few requests: identical texts are sent once, texts are packed into
+    token-bounded batches, and at most `max_concurrency` batches are in flight. Rate-limit errors
+    are retried with exponential backoff (honouring Retry-After when the backend provides it).
+    Texts already in `cache` are not sent at all, new vectors are written back to it.
+    """
+    def __init__(self, backend: Optional[EmbeddingBackend] = None,
+                 cache: Optional[EmbeddingCache] = None,
+                 max_batch_tokens: int = 100_000,
+                 max_batch_size: int = 512,
+                 max_concurrency: int = 8,
+                 max_retries: int = 6,
+                 base_backoff_seconds: float = 1.0):
+        self.backend = backend or OpenAIEmbeddingBackend()
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.stats = EmbeddingPipelineStats()
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.backend.model_name)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def make_batches(self, texts: List[str]) -> List[List[str]]:
+        batches, current, current_tokens = [], [], 0
+        for text in texts:
+            tokens = self.count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        unique_texts = list(dict.fromkeys(texts))
+        self.stats.texts += len(texts)
+        self.stats.unique_texts += len(unique_texts)
+
+        vectors = {}
+        if self.cache is not None:
+            vectors = await self.cache.aget_many(self.backend.model_name, unique_texts)
+            self.stats.cached_texts += len(vectors)
+            unique_texts = [text for text in unique_texts if text not in vectors]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_with_retry(batch)
+
+        batches = self.make_batches(unique_texts)
+        results = await asyncio.gather(*[run_batch(batch) for batch in batches])
+
+        new_vectors = {}
+        for batch, batch_vectors in zip(batches, results):
+            new_vectors.update(zip(batch, batch_vectors))
+        if self.cache is not None and new_vectors:
+            await self.cache.aput_many(self.backend.model_name, new_vectors)
+        vectors.update(new_vectors)
+        return [vectors[text] for text in texts]
+
+    async def _embed_with_retry(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats.requests += 1
+                return await self.backend.embed_batch(batch)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                self.stats.retries += 1
+                delay = retry_after_seconds(e) or backoff_delay(attempt, self.base_backoff_seconds)
+                print(f"Embedding batch of {len(batch)} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
@@ -17,6 +17,10 @@ class EntityManager:
             self._map[key] = self._id_format.format(self._counter)
         return self._map[key]
 
+    async def resolve_many(self, mention_strs: list) -> list:
+        """Same interface as `MentionRegistry.resolve_many`."""
+        return [self.get_id(mention_str) for mention_str in mention_strs]
+
     def reset(self):
         """Resets the mapping and counter (useful for new documents or tests)."""
         self._map.clear()
@@ -26,3 +30,12 @@ class EntityManager:
         """Returns a copy of the mapping."""
         return dict(self._map)
 
+    def restore(self, mapping: dict, counter: int):
+        """Continues from a previous mapping so ids stay stable across (incremental) builds."""
+        self._map = dict(mapping)
+        self._counter = counter
+
+    @property
+    def counter(self) -> int:
+        return self._counter
+
@@ -0,0 +1,277 @@
+"""
+Multi-document KB ingestion: parse -> render -> distill -> embed -> load for every PDF, with a
+checkpoint after each stage so a crashed or interrupted run resumes where it stopped.
+
+    python ingest.py books/                       # every *.pdf in the directory
+    python ingest.py a.pdf b.pdf --concurrency 2
+
+Each document gets its own directory `<workdir>/<doc_id>/` (doc_id = slug of the file name plus
+a content hash) holding state.json, the parsed pages, the rendered page images and a build
+manifest. Page image ids are prefixed with the doc_id so books never collide; mention ids come
+from the global mention registry, so a concept shared by several books is one Mention node.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from doc_distiller import Distiller
+from models import Unit
+from mention_registry import get_mention_registry
+from kb_loader import Neo4jKBLoader
+from bulk_loader import Neo4jBulkLoader
+from manifest import BuildManifest
+from build_version import write_build_version
+from page_stream import iter_unit_strings
+from build import enrich_embeddings
+from src.kb_construction.models import PageImage
+from src.document_parser.pdf_parser import PDFParser, ins
+from src.document_parser.rasterizer import rasterize_pdf, page_image_paths
+from src.kb_retrieval.local_vector_index import export_kb
+from src.kb_retrieval.ann_index import update_ann_for_export
+from src.kb_retrieval.figure_index import write_figure_index
+from src.kb_retrieval.lexical_index import build_lexical_index
+from src.kb_retrieval.reranker import build_rerank_features
+from src.kb_retrieval.mention_graph import build_mention_graph
+
+load_dotenv()
+
+STAGES = ["parse", "render", "distill", "embed", "load"]
+PAGES_FILE = "document_pages.json"
+PAGE_IMAGES_DIR = "page_images"
+MANIFEST_FILE = "kb_manifest.json"
+
+
+def make_doc_id(pdf_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    slug = re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "doc"
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"{slug}-{digest.hexdigest()[:8]}"
+
+
+class IngestJob:
+    """One document's progress through the stages, persisted in `<workdir>/<doc_id>/state.json`."""
+    def __init__(self, pdf_path: str, workdir: str):
+        self.pdf_path = os.path.abspath(pdf_path)
+        self.doc_id = make_doc_id(pdf_path)
+        self.directory = os.path.join(workdir, self.doc_id)
+        os.makedirs(self.directory, exist_ok=True)
+        self.state_path = os.path.join(self.directory, "state.json")
+        self.state = {"doc_id": self.doc_id, "pdf_path": self.pdf_path, "stages": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.state = json.load(f)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.state["stages"]
+
+    def finish(self, stage: str, seconds: float, **info):
+        self.state["stages"][stage] = dict(info, seconds=round(seconds, 2), finished_at=time.time())
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def invalidate_from(self, stage: str):
+        """Forgets `stage` and every later one (e.g. after --redo)."""
+        for later in STAGES[STAGES.index(stage):]:
+            self.state["stages"].pop(later, None)
+
+    def units(self) -> List[Unit]:
+        manifest = BuildManifest.load(self.path(MANIFEST_FILE))
+        # page numbers and figure labels repeat across books, so every node carries its doc_id
+        return [manifest.get_unit(fp).assign_doc_id(self.doc_id) for fp in manifest.entries]
+
+
+async def run_parse(job: IngestJob, parser: PDFParser) -> Dict:
+    pages = await parser.aparse_pages(job.pdf_path)
+    with open(job.path(PAGES_FILE), "w") as f:
+        # only the fields the build reads; the LlamaParse layout data is not needed again
+        json.dump([{"page": page["page"], "md": page["md"]} for page in pages], f)
+    return {"pages": len(pages)}
+
+
+async def run_render(job: IngestJob) -> Dict:
+    manifest = await asyncio.to_thread(rasterize_pdf, job.pdf_path, job.path(PAGE_IMAGES_DIR),
+                                       dpi=int(os.getenv("PAGE_RENDER_DPI", "300")),
+                                       image_format=os.getenv("PAGE_RENDER_FORMAT", "JPEG"))
+    return {"pages": len(manifest["pages"])}
+
+
+async def run_distill(job: IngestJob, loader: Neo4jKBLoader) -> Dict:
+    # units already distilled by an interrupted run are kept; only the missing ones are sent
+    manifest = BuildManifest.load(job.path(MANIFEST_FILE))
+    fingerprints, todo = [], []
+
+    def pending_units():
+        for unit_string in iter_unit_strings(job.path(PAGES_FILE)):
+            fp = BuildManifest.fingerprint(unit_string)
+            fingerprints.append(fp)
+            if fp not in manifest.entries:
+                todo.append(fp)
+                yield unit_string
+
+    # one registry for every book, so the same concept links units across documents
+    distiller = Distiller(output_type=Unit, entity_manager=get_mention_registry())
+    start = time.perf_counter()
+    distilled = await distiller.distill_units(pending_units())
+    built = [(fp, unit.assign_doc_id(job.doc_id)) for fp, unit in zip(todo, distilled) if unit is not None]
+    for fp, unit in built:
+        manifest.record(fp, unit, build_seconds=(time.perf_counter() - start) / len(built))
+    failed = len(todo) - len(built)
+    current = set(fingerprints)
+    removed = [fp for fp in manifest.entries if fp not in current]
+    if not failed and removed:
+        # units dropped by a --redo (or changed text) take their old nodes with them; kept while
+        # anything failed, so a unit that did not redistill is not left without nodes
+        node_ids = [manifest.remove(fp)["node_ids"] for fp in removed]
+
+        def delete():
+            for ids in node_ids:
+                loader.delete_nodes(ids)
+
+        await asyncio.to_thread(delete)
+    manifest.save()
+
+    if failed:
+        raise RuntimeError(f"{failed} of {len(fingerprints)} units failed to distill; rerun to retry them")
+    return {"units": len(fingerprints)}
+
+
+def reset_distillation(job: IngestJob, loader: Neo4jKBLoader) -> int:
+    """
+    For --redo distill (or an earlier stage): forgets the distilled units and deletes their nodes,
+    since `run_distill` otherwise skips every unit already in the manifest. Returns the number of
+    units dropped.
+    """
+    manifest = BuildManifest.load(job.path(MANIFEST_FILE))
+    fingerprints = list(manifest.entries)
+    for fp in fingerprints:
+        loader.delete_nodes(manifest.remove(fp)["node_ids"])
+    manifest.save()
+    return len(fingerprints)
+
+
+async def run_embed(job: IngestJob) -> Dict:
+    # vectors land in the persistent embedding cache; `load` re-reads them from there for free
+    units = job.units()
+    await enrich_embeddings(units)
+    return {"units": len(units)}
+
+
+async def run_load(job: IngestJob, loader: Neo4jKBLoader) -> Dict:
+    units = await enrich_embeddings(job.units())
+
+    def load():
+        bulk_loader = Neo4jBulkLoader(loader, batch_size=int(os.getenv("NEO4J_BATCH_SIZE", "500")))
+        bulk_loader.add_units(units)
+        for page_number, path in page_image_paths(job.path(PAGE_IMAGES_DIR)).items():
+            bulk_loader.add_node("PageImage", PageImage(id=f"{job.doc_id}/page_image_{page_number}",
+                                                        page_number=page_number, url=path, doc_id=job.doc_id))
+        return bulk_loader.flush()
+
+    stats = await asyncio.to_thread(load)
+    return {"nodes": stats.nodes, "edges": stats.edges}
+
+
+async def ingest_document(job: IngestJob, parser: PDFParser, loader: Neo4jKBLoader,
+                          semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        for stage in STAGES:
+            if job.is_done(stage):
+                continue
+            print(f"[{job.doc_id}] {stage} ...")
+            start = time.perf_counter()
+            try:
+                if stage == "parse":
+                    info = await run_parse(job, parser)
+                elif stage == "render":
+                    info = await run_render(job)
+                elif stage == "distill":
+                    info = await run_distill(job, loader)
+                elif stage == "embed":
+                    info = await run_embed(job)
+                else:
+                    info = await run_load(job, loader)
+            except Exception as e:
+                print(f"[{job.doc_id}] {stage} failed: {type(e).__name__}: {e}")
+                return False
+            job.finish(stage, time.perf_counter() - start, **info)
+            print(f"[{job.doc_id}] {stage} done in {time.perf_counter() - start:.1f}s {info}")
+        return True
+
+
+def finalize(jobs: List[IngestJob], loader: Neo4jKBLoader):
+    """Index + snapshot work that covers every document, done once after the loads."""
+    loader.create_vector_index(embedding_dim=1536, similarity_metric="cosine", recreate=False)
+    index_dir = os.getenv("KB_INDEX_DIR", "kb_index")
+    print(f"Exported {export_kb(loader, index_dir)} node embeddings for the local retriever")
+    if os.getenv("RETRIEVER_BACKEND", "neo4j").lower() == "ann" or os.path.isdir(os.path.join(index_dir, "ann")):
+        ann_index, encoded = update_ann_for_export(index_dir)
+        print(f"IVF-PQ index over {len(ann_index)} vectors, {encoded} encoded this run")
+
+    units, page_image_urls = [], {}
+    for job in jobs:
+        if job.is_done("load"):
+            units.extend(job.units())
+            for page_number, path in page_image_paths(job.path(PAGE_IMAGES_DIR)).items():
+                page_image_urls[(job.doc_id, page_number)] = path
+    print(f"Indexed {write_figure_index(units, page_image_urls)} figure labels")
+    print(f"Indexed {build_lexical_index(units, index_dir)} sections for lexical search")
+    print(f"Cached reranking features for {build_rerank_features(units, index_dir)} sections")
+    print(f"Exported the mention graph of {build_mention_graph(units, index_dir)} sections")
+    print(f"KB build version: {write_build_version()}")
+
+
+def collect_pdfs(paths: List[str]) -> List[str]:
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".pdf")))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+async def main(paths: List[str], workdir: str, concurrency: int, redo: Optional[str] = None):
+    jobs = [IngestJob(pdf, workdir) for pdf in collect_pdfs(paths)]
+    parser = PDFParser(parsing_ins=ins)
+    loader = Neo4jKBLoader.shared()
+    loader.ensure_schema()
+
+    if redo:
+        for job in jobs:
+            job.invalidate_from(redo)
+            if STAGES.index(redo) <= STAGES.index("distill"):
+                print(f"[{job.doc_id}] dropped {reset_distillation(job, loader)} distilled units")
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*[ingest_document(job, parser, loader, semaphore) for job in jobs])
+
+    if any(results):
+        finalize(jobs, loader)
+    for job, ok in zip(jobs, results):
+        done = [stage for stage in STAGES if job.is_done(stage)]
+        print(f"{job.doc_id}: {'complete' if ok else 'incomplete'} ({', '.join(done) or 'no stages'} done)")
+    loader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the KB with resumable per-stage checkpoints")
+    parser.add_argument("paths", nargs="+", help="PDF files and/or directories containing PDFs")
+    parser.add_argument("--workdir", default=os.getenv("INGEST_WORKDIR", "ingest"))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("INGEST_CONCURRENCY", "2")),
+                        help="documents processed at the same time")
+    parser.add_argument("--redo", choices=STAGES, help="rerun this stage and every later one")
+    args = parser.parse_args()
+    asyncio.run(main(args.paths, args.workdir, args.concurrency, args.redo))
@@ -1,9 +1,47 @@
-from neo4j import GraphDatabase
-from src.kb_construction.models import OntologyEntity
+import os
+from typing import Optional, List, Tuple
+from src.kb_construction.connection import Neo4jConnectionManager, get_connection_manager
+
+# (kind, name, label, property, create statement)
+SCHEMA: List[Tuple[str, str, str, str, str]] = [
+    ("constraint", "node_id_unique", "Node", "id",
+     "CREATE CONSTRAINT node_id_unique IF NOT EXISTS FOR (n:Node) REQUIRE n.id IS UNIQUE"),
+    ("index", "figure_ref_label", "FigureRef", "label",
+     "CREATE INDEX figure_ref_label IF NOT EXISTS FOR (n:FigureRef) ON (n.label)"),
+    ("index", "page_image_page_number", "PageImage", "page_number",
+     "CREATE INDEX page_image_page_number IF NOT EXISTS FOR (n:PageImage) ON (n.page_number)"),
+]
+
 
 class Neo4jKBLoader:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri=None, user=None, password=None, connection: Optional[Neo4jConnectionManager] = None):
+        if connection is None:
+            connection = Neo4jConnectionManager(uri, user, password, database=os.getenv("NEO4J_DATABASE"))
+        self.connection = connection
+
+    @classmethod
+    def shared(cls) -> "Neo4jKBLoader":
+        """Loader backed by the process-wide pooled driver (see `get_connection_manager`)."""
+        return cls(connection=get_connection_manager())
+
+    @property
+    def driver(self):
+        return self.connection.driver
+
+    @property
+    def async_driver(self):
+        return self.connection.async_driver
+
+    def session(self, **kwargs):
+        """Sync session on the configured database (NEO4J_DATABASE)."""
+        return self.connection.session(**kwargs)
+
+    def async_session(self, **kwargs):
+        """Async session on the configured database (NEO4J_DATABASE)."""
+        return self.connection.async_session(**kwargs)
+
+    def close(self):
+        self.connection.close()
 
     def upsert_node(self, label: str, node):
 
@@ -11,25 +49,81 @@ class Neo4jKBLoader:
 
         props = node.to_dict()
         cypher = f"MERGE (n:Node:{label} {{id: $id}}) SET n += $props"
-        with self.driver.session() as session:
+        with self.session() as session:
             session.run(cypher, id=props["id"], props=props)
 
 
     def upsert_relationship(self, from_id: str, to_id: str, rel_type: str):
         cypher = (
-            f"MATCH (a {{id: $from_id}}), (b {{id: $to_id}}) "
+            f"MATCH (a:Node {{id: $from_id}}), (b:Node {{id: $to_id}}) "
             f"MERGE (a)-[r:{rel_type}]->(b)"
         )
-        with self.driver.session() as session:
+        with self.session() as session:
             session.run(cypher, from_id=from_id, to_id=to_id)
 
-    def create_vector_index(self, embedding_dim: int, similarity_metric: str):
+    def ensure_schema(self, timeout_seconds: int = 300):
+        """
+        Creates the uniqueness constraint / lookup indexes the loader and the query path rely on,
+        waits for them to come online and raises if any is still missing.
+        """
+        with self.session() as session:
+            for _, _, _, _, statement in SCHEMA:
+                session.run(statement).consume()
+            session.run(f"CALL db.awaitIndexes({int(timeout_seconds)})").consume()
+
+        missing = self.check_schema()
+        if missing:
+            raise RuntimeError(f"Neo4j schema incomplete, missing: {', '.join(missing)}")
 
-        with self.driver.session() as session:
-            session.run("DROP INDEX node_embedding_index IF EXISTS")
+    def check_schema(self) -> List[str]:
+        """Returns the names of the schema items from `SCHEMA` that are absent or not ONLINE."""
+        with self.session() as session:
+            constraints = {
+                (record["labelsOrTypes"][0], record["properties"][0])
+                for record in session.run("SHOW CONSTRAINTS YIELD type, labelsOrTypes, properties "
+                                          "WHERE type = 'UNIQUENESS' RETURN labelsOrTypes, properties")
+                if record["labelsOrTypes"] and len(record["properties"]) == 1
+            }
+            indexes = {
+                (record["labelsOrTypes"][0], record["properties"][0])
+                for record in session.run("SHOW INDEXES YIELD type, state, labelsOrTypes, properties "
+                                          "WHERE type = 'RANGE' AND state = 'ONLINE' "
+                                          "RETURN labelsOrTypes, properties")
+                if record["labelsOrTypes"] and len(record["properties"]) == 1
+            }
+
+        missing = []
+        for kind, name, label, prop, _ in SCHEMA:
+            # a uniqueness constraint is backed by an index, so it also satisfies an index requirement
+            present = constraints if kind == "constraint" else constraints | indexes
+            if (label, prop) not in present:
+                missing.append(f"{kind} {name} on :{label}({prop})")
+        return missing
+
+    def delete_nodes(self, node_ids: dict):
+        """
+        Deletes the nodes of removed units ({label: [ids]}). Mentions are shared between units,
+        so they are only deleted once no Section references them any more.
+        """
+        owned_ids = [node_id for label, ids in node_ids.items() if label != "Mention" for node_id in ids]
+        with self.session() as session:
+            session.run(
+                "UNWIND $ids AS id MATCH (n:Node {id: id}) DETACH DELETE n", ids=owned_ids
+            ).consume()
+            session.run(
+                "UNWIND $ids AS id MATCH (m:Node:Mention {id: id}) "
+                "WHERE NOT (m)<-[:HAS_MENTION]-() DETACH DELETE m",
+                ids=node_ids.get("Mention", []),
+            ).consume()
+
+    def create_vector_index(self, embedding_dim: int, similarity_metric: str, recreate: bool = True):
+
+        if recreate:
+            with self.session() as session:
+                session.run("DROP INDEX node_embedding_index IF EXISTS")
 
         create_vector_index_query = f"""
-                CREATE VECTOR INDEX node_embedding_index
+                CREATE VECTOR INDEX node_embedding_index IF NOT EXISTS
                 FOR (n:Node) ON (n.embedding)
                 OPTIONS {{
                     indexConfig: {{
@@ -39,5 +133,29 @@ class Neo4jKBLoader:
                 }}
                 """
 
-        with self.driver.session() as session:
-            session.run(create_vector_index_query)
\ No newline at end of file
+        with self.session() as session:
+            session.run(create_vector_index_query)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Neo4j KB schema tools")
+    parser.add_argument("command", choices=["check-schema", "ensure-schema"])
+    args = parser.parse_args()
+
+    loader = Neo4jKBLoader.shared()
+    try:
+        if args.command == "ensure-schema":
+            loader.ensure_schema()
+        missing = loader.check_schema()
+    finally:
+        loader.close()
+
+    if missing:
+        print("Missing schema items:")
+        for item in missing:
+            print(f"  - {item}")
+        sys.exit(1)
+    print("Schema OK")
@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Any, Optional
+
+from src.kb_construction.models import Unit
+
+
+class BuildManifest:
+    """
+    Remembers, per unit string fingerprint, what the last build produced: the distilled `Unit`
+    (without embeddings), the ids of the nodes written for it and what it cost to build.
+    Used by the incremental build to skip unchanged units and delete removed ones.
+
+    Mention ids live in the mention registry; `mention_ids` / `mention_counter` are only read
+    from manifests written before it existed, so the build can import them, and are not saved.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.mention_ids: Dict[str, str] = {}
+        self.mention_counter: int = 0
+
+    @staticmethod
+    def fingerprint(unit_string: str) -> str:
+        return hashlib.sha256(unit_string.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def load(cls, path: str) -> "BuildManifest":
+        manifest = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            manifest.entries = data.get("units", {})
+            manifest.mention_ids = data.get("mention_ids", {})
+            manifest.mention_counter = data.get("mention_counter", 0)
+        return manifest
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"units": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def record(self, fingerprint: str, unit: Unit, build_seconds: float):
+        self.entries[fingerprint] = {
+            "unit": unit.model_dump(exclude={"embedding": True, "sections": {"__all__": {
+                "embedding": True,
+                "mentions": {"__all__": {"embedding"}},
+                "fig_refs": {"__all__": {"embedding"}},
+            }}}),
+            "node_ids": unit_node_ids(unit),
+            "build_seconds": build_seconds,
+        }
+
+    def remove(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        return self.entries.pop(fingerprint, None)
+
+    def get_unit(self, fingerprint: str) -> Unit:
+        return Unit.model_validate(self.entries[fingerprint]["unit"])
+
+
+def unit_node_ids(unit: Unit) -> Dict[str, List[str]]:
+    """Ids of every node written for `unit`, by label. Mentions can be shared with other units."""
+    ids = {"Unit": [unit.id], "Section": [], "FigureRef": [], "Mention": []}
+    for section in unit.sections:
+        ids["Section"].append(section.id)
+        ids["FigureRef"].extend(fig.id for fig in section.fig_refs)
+        ids["Mention"].extend(mention.id for mention in section.mentions)
+    ids["Mention"] = list(dict.fromkeys(ids["Mention"]))
+    return ids
@@ -0,0 +1,314 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+_ARTICLES = {"a", "an", "the"}
+# words whose trailing s is not a plural
+_KEEP_S = {"species", "series", "gas", "bus", "lens", "news", "mathematics", "physics", "genetics"}
+
+
+def singularize(token: str) -> str:
+    if len(token) <= 3 or token in _KEEP_S:
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is", "ous")):
+        return token[:-1]
+    return token
+
+
+def normalise_mention(text: str) -> str:
+    """
+    Canonical lookup key of a mention surface form: NFKC, lower case, punctuation and leading
+    articles dropped, every word folded to its singular ("The Cell Membranes" -> "cell membrane").
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = re.findall(r"[^\W_]+", text)
+    while len(tokens) > 1 and tokens[0] in _ARTICLES:
+        tokens = tokens[1:]
+    return " ".join(singularize(token) for token in tokens)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def lexical_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of character trigrams, used to veto merges of look-alike embeddings."""
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta or tb else 1.0
+
+
+class MentionRegistry:
+    """
+    Persistent, global mention -> id registry (drop-in for `EntityManager`).
+
+    Surface forms are normalised (`normalise_mention`) and looked up in a SQLite B-tree, behind an
+    in-memory LRU, so ids stay stable across builds and documents and a lookup is O(log n) even
+    with millions of mentions. `resolve_many` additionally embeds the keys it has never seen and
+    merges each into the nearest existing mention when the cosine similarity is at least
+    `merge_threshold` and the strings are lexically close; the vector search is exact up to
+    `ann_threshold` mentions and IVF-PQ above that.
+    """
+    def __init__(self, path: str = ".cache/mentions.sqlite",
+                 id_format: str = "mention_{:03d}",
+                 embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+                 merge_threshold: float = 0.93,
+                 min_lexical_similarity: float = 0.6,
+                 max_memory_items: int = 100_000,
+                 ann_threshold: int = 50_000):
+        self.path = path
+        self.id_format = id_format
+        self.embed = embed
+        self.merge_threshold = merge_threshold
+        self.min_lexical_similarity = min_lexical_similarity
+        self.max_memory_items = max_memory_items
+        self.ann_threshold = ann_threshold
+        self.merged = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # canonical mention vectors, loaded on the first fuzzy lookup
+        self._vectors: Optional[np.ndarray] = None
+        self._vector_ids: List[str] = []
+        self._vector_keys: List[str] = []
+        self._ann = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS aliases (key TEXT PRIMARY KEY, mention_id TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mentions (mention_id TEXT PRIMARY KEY, key TEXT NOT NULL, "
+            "surface TEXT NOT NULL, embedding BLOB)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('counter', 0)")
+        self._conn.commit()
+
+    @property
+    def counter(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'counter'").fetchone()[0]
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM mentions").fetchone()[0]
+
+    def get_id(self, mention_str: str) -> str:
+        """Exact (normalised) lookup; unseen mentions get a new id."""
+        key = normalise_mention(mention_str)
+        with self._lock:
+            mention_id = self._lookup(key)
+            if mention_id is None:
+                mention_id = self._create(key, mention_str, None)
+                self._conn.commit()
+        return mention_id
+
+    async def resolve_many(self, mention_strs: List[str]) -> List[str]:
+        """Ids for a batch of surface forms, merging unseen ones into near-duplicates by embedding."""
+        keys = [normalise_mention(text) for text in mention_strs]
+        ids: Dict[str, str] = {}
+        unseen: Dict[str, str] = {}
+        with self._lock:
+            for key, text in zip(keys, mention_strs):
+                if key in ids or key in unseen:
+                    continue
+                mention_id = self._lookup(key)
+                if mention_id is None:
+                    unseen[key] = text
+                else:
+                    ids[key] = mention_id
+
+        vectors = None
+        if unseen and self.embed is not None and self.merge_threshold:
+            vectors = await self.embed(list(unseen.values()))
+
+        with self._lock:
+            if vectors is not None:
+                self._load_vectors()
+            for i, (key, text) in enumerate(unseen.items()):
+                # another caller may have added it meanwhile
+                mention_id = self._lookup(key)
+                if mention_id is None and vectors is not None:
+                    mention_id = self._nearest(key, vectors[i])
+                    if mention_id is not None:
+                        self._alias(key, mention_id)
+                        self.merged += 1
+                if mention_id is None:
+                    mention_id = self._create(key, text, vectors[i] if vectors is not None else None)
+                ids[key] = mention_id
+            self._conn.commit()
+        return [ids[key] for key in keys]
+
+    def surfaces(self, mention_ids: List[str]) -> List[Optional[str]]:
+        """
+        Canonical surface form of each id (the one it was created with). A mention merged into an
+        existing id must take this string, or its node would overwrite the canonical one.
+        """
+        unique = list(dict.fromkeys(mention_ids))
+        found: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT mention_id, surface FROM mentions WHERE mention_id IN ({','.join('?' * len(batch))})", batch)
+                found.update(rows.fetchall())
+        return [found.get(mention_id) for mention_id in mention_ids]
+
+    def import_mapping(self, mapping: Dict[str, str], counter: int = 0):
+        """
+        Seeds the registry with an `EntityManager.as_dict()` mapping from an earlier build, so
+        mention ids already in the KB keep their value.
+        """
+        with self._lock:
+            for surface, mention_id in mapping.items():
+                key = normalise_mention(surface)
+                self._conn.execute("INSERT OR IGNORE INTO mentions (mention_id, key, surface) VALUES (?, ?, ?)",
+                                   (mention_id, key, surface))
+                self._conn.execute("INSERT OR IGNORE INTO aliases (key, mention_id) VALUES (?, ?)", (key, mention_id))
+            self._conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE name = 'counter'", (counter,))
+            self._conn.commit()
+            self._vectors = None
+
+    def as_dict(self) -> Dict[str, str]:
+        """Normalised key -> id for every known mention (for inspection; can be large)."""
+        return dict(self._conn.execute("SELECT key, mention_id FROM aliases").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        mention_id = self._memory.get(key)
+        if mention_id is not None:
+            self._memory.move_to_end(key)
+            return mention_id
+        row = self._conn.execute("SELECT mention_id FROM aliases WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def _create(self, key: str, surface: str, vector) -> str:
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'counter'")
+        mention_id = self.id_format.format(self.counter)
+        blob = None
+        if vector is not None:
+            vector = _unit(np.asarray(vector, dtype=np.float32))
+            blob = vector.tobytes()
+            if self._vectors is not None:
+                self._append_vector(mention_id, key, vector)
+        self._conn.execute("INSERT INTO mentions (mention_id, key, surface, embedding) VALUES (?, ?, ?, ?)",
+                           (mention_id, key, surface, blob))
+        self._alias(key, mention_id)
+        return mention_id
+
+    def _alias(self, key: str, mention_id: str):
+        self._conn.execute("INSERT OR REPLACE INTO aliases (key, mention_id) VALUES (?, ?)", (key, mention_id))
+        self._remember(key, mention_id)
+
+    def _remember(self, key: str, mention_id: str):
+        self._memory[key] = mention_id
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _load_vectors(self):
+        if self._vectors is not None:
+            return
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._vector_ids, self._vector_keys, self._ann = [], [], None
+        count = 0
+        for mention_id, key, blob in self._conn.execute(
+                "SELECT mention_id, key, embedding FROM mentions WHERE embedding IS NOT NULL"):
+            self._append_vector(mention_id, key, np.frombuffer(blob, dtype=np.float32), build_ann=False)
+            count += 1
+        if count >= self.ann_threshold:
+            self._build_ann()
+
+    def _append_vector(self, mention_id: str, key: str, vector: np.ndarray, build_ann: bool = True):
+        count = len(self._vector_ids)
+        if count == 0 and self._vectors.shape[1] != len(vector):
+            self._vectors = np.empty((1024, len(vector)), dtype=np.float32)
+        elif count == len(self._vectors):
+            # amortised growth instead of one concatenate per mention
+            grown = np.empty((2 * count, self._vectors.shape[1]), dtype=np.float32)
+            grown[:count] = self._vectors
+            self._vectors = grown
+        self._vectors[count] = vector
+        self._vector_ids.append(mention_id)
+        self._vector_keys.append(key)
+        if self._ann is not None:
+            self._ann.add(vector[None, :])
+        elif build_ann and count + 1 >= self.ann_threshold:
+            self._build_ann()
+
+    def _build_ann(self):
+        from src.kb_retrieval.ann_index import build_ivfpq_index
+
+        count = len(self._vector_ids)
+        m = 16 if self._vectors.shape[1] % 16 == 0 else 0
+        self._ann = build_ivfpq_index(self._vectors[:count], m=m)
+
+    def _nearest(self, key: str, vector) -> Optional[str]:
+        count = len(self._vector_ids)
+        if not count:
+            return None
+        query = _unit(np.asarray(vector, dtype=np.float32))
+        if self._ann is not None:
+            self._ann.refine_vectors = self._vectors[:count]
+            candidates, scores = self._ann.search(query, k=5)
+            candidates, scores = candidates[0], scores[0]
+        else:
+            similarities = self._vectors[:count] @ query
+            top = min(5, count)
+            candidates = np.argpartition(-similarities, top - 1)[:top]
+            candidates = candidates[np.argsort(-similarities[candidates])]
+            scores = similarities[candidates]
+        for candidate, score in zip(candidates.tolist(), scores.tolist()):
+            if candidate < 0 or score < self.merge_threshold:
+                break
+            if lexical_similarity(key, self._vector_keys[candidate]) >= self.min_lexical_similarity:
+                return self._vector_ids[candidate]
+        return None
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_registry: Optional[MentionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_mention_registry() -> MentionRegistry:
+    """
+    Process-wide registry configured from MENTION_REGISTRY_PATH and MENTION_MERGE_THRESHOLD
+    (0 disables embedding-based merging); near-duplicates are found with the build's embedding
+    pipeline, so their vectors are already cached when the mentions are embedded later.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from src.kb_construction.embedding_cache import get_embedding_cache
+                from src.kb_construction.embedding_pipeline import EmbeddingPipeline
+
+                pipeline = EmbeddingPipeline(cache=get_embedding_cache(),
+                                             max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "8")))
+                _registry = MentionRegistry(
+                    os.getenv("MENTION_REGISTRY_PATH", ".cache/mentions.sqlite"),
+                    embed=pipeline.embed,
+                    merge_threshold=float(os.getenv("MENTION_MERGE_THRESHOLD", "0.93")),
+                )
+    return _registry
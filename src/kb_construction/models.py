@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from typing import Optional
 import uuid
 from typing import ClassVar, List, Dict, Any, Iterator, Optional
@@ -36,6 +37,8 @@ class FigureRef(OntologyEntity):
     label: str = Field(..., description="The label of the figure. E.g, Figure 1, etc.")
     caption: Optional[str] = Field(None, description="The caption of the figure")
     page_number: int = Field(..., description="The page number where the figure located. Use the page number information below the figues not above!")
+    # set by the ingestion, not the model: the book the figure belongs to (page numbers are per book)
+    doc_id: SkipJsonSchema[Optional[str]] = None
 
     def __repr__(self):
         return f"{self.label} {self.caption}" if self.caption else self.label
@@ -46,6 +49,7 @@ class FigureRef(OntologyEntity):
             "label": self.label,
             "caption": self.caption if self.caption else "",
             "page_number": self.page_number,
+            "doc_id": self.doc_id,
             "embedding": self.embedding,
         }
 
@@ -58,6 +62,7 @@ class Section(OntologyEntity):
     fig_refs: list[FigureRef] = Field(..., description="The list of all the figures are mentioned in the section.")
     mentions: list[Mention] = Field(..., description="The list of all entities appear in the section.")
     unit_title: Optional[str] = Field(None, description="The unit title of the section.")
+    doc_id: SkipJsonSchema[Optional[str]] = None
 
 
     def __repr__(self):
@@ -70,6 +75,7 @@ class Section(OntologyEntity):
             "summary": self.summary,
             "content": self.content + "\nFigures: \n" + "\n".join([repr(item) for item in self.fig_refs]),
             "unit_title": self.unit_title,
+            "doc_id": self.doc_id,
             "embedding": self.embedding,
         }
 
@@ -78,11 +84,21 @@ class Unit(OntologyEntity):
     summary: str = Field(..., description="The summary of the unit. 150-200 words")
 
     sections: list[Section] = Field(..., description="All the sections of the unit")
+    doc_id: SkipJsonSchema[Optional[str]] = None
 
     def model_post_init(self, context: Any, /) -> None:
         for section in self.sections:
             section.unit_title = self.unit_title
 
+    def assign_doc_id(self, doc_id: str) -> "Unit":
+        """Tags the unit, its sections and figures with the document they come from."""
+        self.doc_id = doc_id
+        for section in self.sections:
+            section.doc_id = doc_id
+            for fig in section.fig_refs:
+                fig.doc_id = doc_id
+        return self
+
     def __repr__(self):
         return f"{self.unit_title} {self.summary}"
 
@@ -91,6 +107,7 @@ class Unit(OntologyEntity):
             "id": self.id,
             "unit_title": self.unit_title,
             "summary": self.summary,
+            "doc_id": self.doc_id,
             "embedding": self.embedding,
         }
 
@@ -100,10 +117,12 @@ class PageImage(BaseModel):
 
     page_number: int = Field(..., description="The page number of the page image")
     url: str = Field(..., description="The url of the page image")
+    doc_id: Optional[str] = Field(None, description="The document the page belongs to")
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
             "page_number": self.page_number,
             "url": self.url,
+            "doc_id": self.doc_id,
         }
\ No newline at end of file
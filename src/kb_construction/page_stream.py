@@ -0,0 +1,119 @@
+import re
+import json
+from typing import Any, Dict, Iterable, Iterator, Sequence
+
+# Pattern to match headings with unit numbers (e.g., ### 1.1, ## 2.3, # 1.1)
+UNIT_PATTERN = re.compile(r'^(#{1,6})\s+(\d+\.\d+)\s+(.+)$')
+
+PAGE_FIELDS = ("page", "md")
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yields the elements of a top-level JSON array one at a time, reading the file in chunks, so
+    only one element is held in memory (instead of `json.load` materialising the whole document).
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        pos = _skip(buffer, 0, " \t\r\n")
+        if buffer[pos:pos + 1] != "[":
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos += 1
+        read_size = chunk_size
+        eof = False
+        while True:
+            pos = _skip(buffer, pos, " \t\r\n,")
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                if pos == len(buffer):
+                    raise ValueError("need more data")
+                element, end = decoder.raw_decode(buffer, pos)
+                # a number cut by the chunk boundary would decode "successfully"
+                if end == len(buffer) and not eof:
+                    raise ValueError("need more data")
+            except ValueError:
+                if eof:
+                    raise ValueError(f"{path} ends in the middle of the JSON array")
+                # drop what was consumed, read more; grow the read so huge elements stay linear
+                buffer = buffer[pos:]
+                pos = 0
+                more = f.read(read_size)
+                read_size *= 2
+                eof = not more
+                buffer += more
+                continue
+            read_size = chunk_size
+            yield element
+            pos = end
+
+
+def _skip(buffer: str, pos: int, chars: str) -> int:
+    while pos < len(buffer) and buffer[pos] in chars:
+        pos += 1
+    return pos
+
+
+def iter_pages(path: str, fields: Sequence[str] = PAGE_FIELDS) -> Iterator[Dict[str, Any]]:
+    """Streams the pages of a LlamaParse `document_pages.json`, keeping only `fields` of each page."""
+    for page in iter_json_array(path):
+        yield {field: page.get(field) for field in fields}
+
+
+def clean_page_markdown(page: Dict[str, Any]) -> str:
+    """Drops blank lines, level 1/2 headings and the last line (page footer), and frames the page with its number."""
+    md_lines = [
+        line for line in (page["md"] or "").split("\n")[:-1]
+        if line.strip() != "" and line.count("#") not in [1, 2]
+    ]
+    return (
+        f"\npage_number: {str(page['page'])}\n"
+        + "\n".join(md_lines)
+        + f"\npage_number: {str(page['page'])}"
+    )
+
+
+def iter_page_lines(pages: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """The lines of the cleaned pages joined by [BREAK_PAGE], without building the joined string."""
+    first = True
+    for page in pages:
+        md = clean_page_markdown(page)
+        if not md:
+            continue
+        if not first:
+            yield "[BREAK_PAGE]"
+        first = False
+        yield from md.split("\n")
+
+
+def iter_units(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Groups lines into unit strings at headings with unit numbers (e.g., 1.1, 1.2, 2.1), yielding
+    each unit as soon as the next one starts. Lines before the first unit are dropped.
+    """
+    current_unit = None
+    for line in lines:
+        if UNIT_PATTERN.match(line):
+            # save previous unit if exists
+            if current_unit is not None:
+                yield "".join(current_unit)
+            line = line.replace("#", "")
+            current_unit = [f"Unit Title: {line} + '\n'"]
+        elif current_unit is not None:
+            current_unit.append(line + '\n')
+
+    if current_unit is not None:
+        yield "".join(current_unit)
+
+
+def iter_unit_strings(path: str) -> Iterator[str]:
+    """document_pages.json -> unit strings, streamed: the first unit is available after its pages are read."""
+    return iter_units(iter_page_lines(iter_pages(path)))
+
+
+if __name__ == "__main__":
+    import sys
+
+    for unit_string in iter_unit_strings(sys.argv[1] if len(sys.argv) > 1 else "document_pages.json"):
+        print(f"{len(unit_string):>8} chars  {unit_string.splitlines()[0]}")
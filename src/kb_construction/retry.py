@@ -0,0 +1,33 @@
+import random
+from typing import Optional
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, server errors and transport errors are worth retrying; anything else is not."""
+    status_code = getattr(error, "status_code", None)
+    return (
+        status_code == 429
+        or (status_code is not None and status_code >= 500)
+        or type(error).__name__ in ("RateLimitError", "APITimeoutError", "APIConnectionError")
+    )
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The server's Retry-After hint, if the error carries an HTTP response with one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_seconds: float, max_seconds: float = 60.0) -> float:
+    """Exponential backoff with jitter: base * 2^attempt, scaled by a random factor in [0.5, 1.5)."""
+    return min(max_seconds, base_seconds * (2 ** attempt)) * (0.5 + random.random())
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Sequence
+
+from src.kb_construction.retry import is_retryable_error, is_rate_limit_error, retry_after_seconds, backoff_delay
+
+
+@dataclass
+class JobResult:
+    index: int
+    output: Any = None
+    error: Optional[str] = None
+    attempts: int = 0
+    latency_seconds: float = 0.0
+    estimated_tokens: int = 0
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class SchedulerSummary:
+    results: List[JobResult] = field(default_factory=list)
+    wall_seconds: float = 0.0
+    rate_limited: int = 0
+
+    @property
+    def failures(self) -> List[JobResult]:
+        return [result for result in self.results if not result.ok]
+
+    def __str__(self):
+        done = [result for result in self.results if result.ok]
+        latencies = sorted(result.latency_seconds for result in done)
+        lines = [
+            f"{len(done)}/{len(self.results)} jobs succeeded in {self.wall_seconds:.1f}s "
+            f"({self.rate_limited} rate-limit retries)",
+        ]
+        if latencies:
+            lines.append(f"latency p50 {latencies[len(latencies) // 2]:.1f}s, max {latencies[-1]:.1f}s")
+        input_tokens = sum(result.input_tokens or 0 for result in done)
+        output_tokens = sum(result.output_tokens or 0 for result in done)
+        if input_tokens or output_tokens:
+            lines.append(f"tokens: {input_tokens} in, {output_tokens} out")
+        for result in self.results:
+            lines.append(
+                f"  job {result.index}: {'ok' if result.ok else 'FAILED'} after {result.attempts} attempt(s), "
+                f"{result.latency_seconds:.1f}s, ~{result.estimated_tokens} tokens"
+                + (f", {result.input_tokens} in / {result.output_tokens} out" if result.input_tokens is not None else "")
+                + (f" - {result.error}" if result.error else "")
+            )
+        return "\n".join(lines)
+
+
+class TokenBudget:
+    """Sliding one-minute window of estimated tokens; `acquire` waits until a job fits."""
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._spent = deque()  # (timestamp, tokens)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        # a single job larger than the whole budget is let through alone rather than never
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._spent and now - self._spent[0][0] >= 60:
+                    self._spent.popleft()
+                used = sum(spent for _, spent in self._spent)
+                if used + tokens <= self.tokens_per_minute:
+                    self._spent.append((now, tokens))
+                    return
+                await asyncio.sleep(60 - (now - self._spent[0][0]))
+
+
+class ExtractionScheduler:
+    """
+    Runs LLM extraction jobs with a concurrency cap and a tokens-per-minute budget. Longest inputs
+    start first (they bound wall-clock time; lazy inputs are sorted per `sort_window` jobs), rate-limit / transient errors are retried with
+    jittered exponential backoff, timeouts are retried, and every other error is recorded as a
+    failure instead of being dropped.
+    """
+    def __init__(self, max_concurrency: int = 8,
+                 tokens_per_minute: int = 200_000,
+                 max_retries: int = 5,
+                 timeout_seconds: float = 180,
+                 base_backoff_seconds: float = 2.0,
+                 max_backoff_seconds: float = 60.0,
+                 output_token_ratio: float = 1.0,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 sort_window: int = 32):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.timeout_seconds = timeout_seconds
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # distillation echoes the unit content back, so output is roughly as long as input
+        self.output_token_ratio = output_token_ratio
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4 + 1)
+        # how many jobs of a lazy input are read ahead and started longest-first: a larger window
+        # orders better but delays the first job until the window is read
+        self.sort_window = max(sort_window, 1)
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(self.count_tokens(text) * (1 + self.output_token_ratio))
+
+    async def run(self, inputs: Iterable[Any], worker: Callable[[Any], Awaitable[Any]],
+                  text: Optional[Callable[[Any], str]] = None) -> SchedulerSummary:
+        """
+        Calls `worker(job)` for every input. `summary.results[i]` belongs to the i-th input. Inputs are
+        prompt strings, or any job object if `text(job)` returns the prompt used for ordering and
+        token estimates. A list is started longest-first; any other iterable (e.g. a generator
+        reading the document) is consumed lazily, `sort_window` jobs at a time, and each window is
+        started longest-first.
+        """
+        text = text or (lambda job: job)
+        summary = SchedulerSummary()
+        budget = TokenBudget(self.tokens_per_minute)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+
+        async def run_job(job: Any, result: JobResult):
+            result.estimated_tokens = self.estimate_tokens(text(job))
+            job_start = time.perf_counter()
+            for attempt in range(self.max_retries + 1):
+                result.attempts = attempt + 1
+                await budget.acquire(result.estimated_tokens)
+                try:
+                    async with semaphore:
+                        result.output = await asyncio.wait_for(worker(job), timeout=self.timeout_seconds)
+                    result.error = None
+                    _record_usage(result)
+                    break
+                except asyncio.TimeoutError:
+                    result.error = f"timed out after {self.timeout_seconds}s"
+                    delay = backoff_delay(attempt, self.base_backoff_seconds, self.max_backoff_seconds)
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+                    if not is_retryable_error(e):
+                        break
+                    if is_rate_limit_error(e):
+                        summary.rate_limited += 1
+                    delay = retry_after_seconds(e) or backoff_delay(attempt, self.base_backoff_seconds,
+                                                                     self.max_backoff_seconds)
+                if attempt < self.max_retries:
+                    print(f"Job {result.index} attempt {attempt + 1} failed ({result.error}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            result.latency_seconds = time.perf_counter() - job_start
+
+        if isinstance(inputs, Sequence):
+            windows = [list(enumerate(inputs))]
+        else:
+            jobs = enumerate(inputs)
+            windows = iter(lambda: list(itertools.islice(jobs, self.sort_window)), [])
+
+        tasks = []
+        for window in windows:
+            summary.results.extend(JobResult(index=index) for index, _ in window)
+            for index, job in sorted(window, key=lambda item: len(text(item[1])), reverse=True):
+                tasks.append(asyncio.create_task(run_job(job, summary.results[index])))
+                # yield so jobs are admitted to the semaphore / budget in order, and started
+                # jobs make progress while a lazy input is still being read
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+        summary.wall_seconds = time.perf_counter() - start
+        return summary
+
+
+def _record_usage(result: JobResult):
+    """Picks token usage from pydantic-ai run results (`.usage()`), if the worker returned one."""
+    usage = getattr(result.output, "usage", None)
+    if callable(usage):
+        usage = usage()
+    if usage is None:
+        return
+    result.input_tokens = getattr(usage, "request_tokens", None) or getattr(usage, "input_tokens", None)
+    result.output_tokens = getattr(usage, "response_tokens", None) or getattr(usage, "output_tokens", None)
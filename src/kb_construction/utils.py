@@ -35,43 +35,129 @@ def split_into_units(content) -> list[str]:
     """
     Split content into units based on headings with numbers (e.g., 1.1, 1.2, 2.1)
     """
-    import re
+    from src.kb_construction.page_stream import iter_units
+
+    return list(iter_units(content.split('\n')))
+
 
-    # Pattern to match headings with unit numbers (e.g., ### 1.1, ## 2.3, # 1.1)
-    unit_pattern = r'^(#{1,6})\s+(\d+\.\d+)\s+(.+)$'
+def split_unit_into_chunks(unit_string: str, max_chars: int = 16_000) -> tuple[str, list[str]]:
+    """
+    Splits one unit string (as produced by `split_into_units`) on its ### / #### section headings
+    and packs consecutive sections into chunks of at most `max_chars`, so each distillation call
+    has a bounded input and output. A section that alone exceeds the limit is split further at
+    [BREAK_PAGE] boundaries. Every chunk is framed by the page_number marker that is current at
+    its start and end, so figure page numbers stay resolvable. Returns (unit title, chunks).
+    """
+    import re
 
-    lines = content.split('\n')
-    units = []
-    current_unit = None
+    header, _, body = unit_string.partition('\n')
+    unit_title = header.replace("Unit Title:", "").replace("+ '", "").strip()
 
-    for line in lines:
-        # check if this line is a unit heading
-        match = re.match(unit_pattern, line, re.MULTILINE)
+    # split into sections at the headings
+    sections = []
+    current = []
+    for line in body.split('\n'):
+        if re.match(r'^#{3,4}\s', line) and any(l.strip() and not l.startswith("page_number:") and l != "[BREAK_PAGE]"
+                                                for l in current):
+            sections.append(current)
+            current = []
+        current.append(line)
+    sections.append(current)
 
-        if match:
-            # save previous unit if exists
-            if current_unit:
-                units.append(current_unit)
-            line = line.replace("#","")
-            current_unit = f"Unit Title: {line} + '\n'"
-        else:
-            # Add line to the current unit
-            if current_unit:
-                current_unit += line + '\n'
-            elif line.strip():  # Only add non-empty lines
-                if units:
-                    units[-1] += line + '\n'
+    pieces = []
+    for section in sections:
+        text = '\n'.join(section)
+        if len(text) <= max_chars:
+            pieces.append(text)
+            continue
+        piece = ""
+        for page_text in text.split("\n[BREAK_PAGE]\n"):
+            if piece and len(piece) + len(page_text) > max_chars:
+                pieces.append(piece)
+                piece = ""
+            piece = f"{piece}\n[BREAK_PAGE]\n{page_text}" if piece else page_text
+        pieces.append(piece)
 
-    if current_unit:
-        units.append(current_unit)
+    chunks, chunk = [], ""
+    for piece in pieces:
+        if chunk and len(chunk) + len(piece) > max_chars:
+            chunks.append(chunk)
+            chunk = ""
+        chunk = f"{chunk}\n{piece}" if chunk else piece
+    if chunk.strip():
+        chunks.append(chunk)
 
-    return units
+    # frame each chunk with the page current at its start (the last marker of the chunks before
+    # it) and at its end
+    framed, page = [], None
+    for chunk in chunks:
+        markers = re.findall(r'^page_number: (\S+)$', chunk, re.MULTILINE)
+        if not chunk.lstrip().startswith("page_number:") and page is not None:
+            chunk = f"page_number: {page}\n{chunk}"
+        if markers:
+            page = markers[-1]
+        if not chunk.rstrip().endswith(f"page_number: {page}") and page is not None:
+            chunk = f"{chunk.rstrip()}\npage_number: {page}"
+        framed.append(f"Unit Title: {unit_title}\n{chunk}")
+    return unit_title, framed
 
 import openai
+from src.kb_construction.embedding_cache import get_embedding_cache
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+def get_embedding(text: str, use_cache: bool = True) -> list[float]:
+    cache = get_embedding_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
 
-def get_embedding(text: str) -> list[float]:
     response = openai.embeddings.create(
         input=text,
-        model="text-embedding-3-small"
+        model=EMBEDDING_MODEL
+    )
+    embedding = response.data[0].embedding
+    if cache is not None:
+        cache.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+_async_openai_clients = {}
+
+
+def get_async_openai_client():
+    """
+    One AsyncOpenAI client per event loop so its HTTP connection pool is reused. Clients of loops
+    that have since been closed are closed here instead of leaking their connections.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_openai_clients:
+        for old_loop in [old_loop for old_loop in _async_openai_clients if old_loop.is_closed()]:
+            loop.create_task(_close_quietly(_async_openai_clients.pop(old_loop)))
+        _async_openai_clients[loop] = openai.AsyncOpenAI()
+    return _async_openai_clients[loop]
+
+
+async def _close_quietly(client):
+    try:
+        await client.close()
+    except Exception as e:
+        print(f"Could not close stale OpenAI client cleanly: {e}")
+
+
+async def aget_embedding(text: str, use_cache: bool = True) -> list[float]:
+    cache = get_embedding_cache() if use_cache else None
+    if cache is not None:
+        cached = await cache.aget(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
+
+    response = await get_async_openai_client().embeddings.create(
+        input=text,
+        model=EMBEDDING_MODEL
     )
-    return response.data[0].embedding
+    embedding = response.data[0].embedding
+    if cache is not None:
+        await cache.aput(EMBEDDING_MODEL, text, embedding)
+    return embedding
@@ -0,0 +1,329 @@
+import os
+import json
+import hashlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+META_FILE = "ivfpq.json"
+# per insertion position: digest of (node id, vector) of the exported row, see `update_ann_for_export`
+ROWS_FILE = "rows.npy"
+
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantised residuals (IVF-PQ), in pure NumPy.
+
+    Vectors are assigned to the nearest of `nlist` coarse centroids; the residual to that centroid
+    is split into `m` sub-vectors, each stored as a 1-byte code into a 256-entry codebook. A query
+    scores only the `nprobe` closest lists, using per-query lookup tables, so `nprobe` trades
+    recall for latency at search time. `m=0` stores raw residuals instead (IVF-Flat).
+
+    If the original vectors are attached (`refine_vectors`, e.g. the memory-mapped export matrix),
+    the best `k * refine_factor` PQ candidates are re-scored exactly, which recovers most of the
+    recall lost to quantisation for the cost of a few row reads.
+
+    Scores are inner products, i.e. cosine similarities for normalised vectors, and the returned
+    indices are the insertion positions - the same contract as `ExactVectorIndex.search`.
+    """
+    def __init__(self, dim: int, nlist: int = 1024, m: int = 16, nprobe: int = 16, seed: int = 0,
+                 refine_factor: int = 10):
+        if m and dim % m:
+            raise ValueError(f"dim ({dim}) must be divisible by m ({m})")
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.seed = seed
+        self.refine_factor = refine_factor
+        self.refine_vectors: Optional[np.ndarray] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None   # (m, 256, dim // m)
+        self._codes: List[np.ndarray] = []            # per list: (n_i, m) uint8 or (n_i, dim) float32
+        self._ids: List[np.ndarray] = []              # per list: (n_i,) int64
+        self._count = 0
+        self.trained_count = 0                        # vectors in the index when it was trained
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, sample: np.ndarray, iterations: int = 20):
+        sample = np.asarray(sample, dtype=np.float32)
+        if not len(sample):
+            # an empty KB: a valid index that finds nothing
+            self.nlist = 0
+            self.centroids = np.empty((0, self.dim), dtype=np.float32)
+            if self.m:
+                self.codebooks = np.empty((self.m, 0, self.dim // self.m), dtype=np.float32)
+            self.reset()
+            return
+        rng = np.random.default_rng(self.seed)
+        self.nlist = min(self.nlist, len(sample))
+        self.centroids = _kmeans(sample, self.nlist, iterations, rng)
+
+        if self.m:
+            residuals = sample - self.centroids[_nearest(sample, self.centroids)]
+            sub_dim = self.dim // self.m
+            self.codebooks = np.stack([
+                _kmeans(residuals[:, j * sub_dim:(j + 1) * sub_dim], min(256, len(sample)), iterations, rng)
+                for j in range(self.m)
+            ])
+
+        self.reset()
+
+    def reset(self):
+        """Drops every vector but keeps the trained quantiser."""
+        self._codes = [self._empty_codes() for _ in range(self.nlist)]
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self._count = 0
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None):
+        """Encodes and appends `vectors`; ids default to consecutive insertion positions."""
+        if not self.is_trained:
+            raise RuntimeError("IVFPQIndex must be trained before vectors are added")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(self._count, self._count + len(vectors), dtype=np.int64)
+
+        assignments = _nearest(vectors, self.centroids)
+        residuals = vectors - self.centroids[assignments]
+        codes = self._encode(residuals) if self.m else residuals
+        self.add_encoded(assignments, codes, ids)
+
+    def add_encoded(self, assignments: np.ndarray, codes: np.ndarray, ids: np.ndarray):
+        """Appends rows that are already encoded with this quantiser (list ids, codes, ids)."""
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for list_id, start, end in zip(lists.tolist(), starts.tolist(), ends.tolist()):
+            rows = order[start:end]
+            self._codes[list_id] = np.concatenate([self._codes[list_id], codes[rows]])
+            self._ids[list_id] = np.concatenate([self._ids[list_id], ids[rows]])
+        self._count += len(ids)
+
+    def encoded_rows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(list ids, codes, ids) of every stored vector, in list order - the input of `add_encoded`."""
+        assignments = np.repeat(np.arange(self.nlist), [len(ids) for ids in self._ids])
+        return assignments, self._all_codes(), self._all_ids()
+
+    def search(self, query_vectors: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if not self._count or k <= 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        for qi, query in enumerate(queries):
+            if self.m:
+                sub_dim = self.dim // self.m
+                # (m, 256): inner product of each query sub-vector with every codeword
+                tables = np.einsum("jd,jcd->jc", query.reshape(self.m, sub_dim), self.codebooks)
+
+            candidate_ids, candidate_scores = [], []
+            for list_id in probes[qi].tolist():
+                codes = self._codes[list_id]
+                if not len(codes):
+                    continue
+                if self.m:
+                    residual_scores = tables[np.arange(self.m), codes].sum(axis=1)
+                else:
+                    residual_scores = codes @ query
+                candidate_scores.append(coarse[qi, list_id] + residual_scores)
+                candidate_ids.append(self._ids[list_id])
+            if not candidate_ids:
+                continue
+
+            candidate_ids = np.concatenate(candidate_ids)
+            candidate_scores = np.concatenate(candidate_scores)
+            if self.refine_vectors is not None and self.m:
+                shortlist = min(k * self.refine_factor, len(candidate_ids))
+                keep = np.argpartition(-candidate_scores, shortlist - 1)[:shortlist]
+                candidate_ids = candidate_ids[keep]
+                rows = np.sort(candidate_ids)
+                exact = np.asarray(self.refine_vectors[rows], dtype=np.float32) @ query
+                candidate_scores = exact[np.searchsorted(rows, candidate_ids)]
+            top = min(k, len(candidate_ids))
+            best = np.argpartition(-candidate_scores, top - 1)[:top]
+            best = best[np.argsort(-candidate_scores[best])]
+            indices[qi, :top] = candidate_ids[best]
+            scores[qi, :top] = candidate_scores[best]
+        return indices, scores
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        offsets = np.cumsum([0] + [len(ids) for ids in self._ids]).astype(np.int64)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        if self.m:
+            np.save(os.path.join(directory, "codebooks.npy"), self.codebooks)
+        np.save(os.path.join(directory, "codes.npy"), self._all_codes())
+        np.save(os.path.join(directory, "ids.npy"), self._all_ids())
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        with open(os.path.join(directory, META_FILE), "w") as f:
+            json.dump({"dim": self.dim, "nlist": self.nlist, "m": self.m, "nprobe": self.nprobe,
+                       "seed": self.seed, "refine_factor": self.refine_factor, "count": self._count,
+                       "trained_count": self.trained_count}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, nprobe: Optional[int] = None) -> "IVFPQIndex":
+        """Loads a saved index; with `mmap` the codes stay on disk and each list is a view into them."""
+        with open(os.path.join(directory, META_FILE), "r") as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], nlist=meta["nlist"], m=meta["m"], nprobe=nprobe or meta["nprobe"], seed=meta["seed"],
+                    refine_factor=meta.get("refine_factor", 10))
+        mmap_mode = "r" if mmap else None
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        if index.m:
+            index.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+        codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode=mmap_mode)
+        ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(directory, "offsets.npy"))
+        index._codes = [codes[offsets[i]:offsets[i + 1]] for i in range(index.nlist)]
+        index._ids = [ids[offsets[i]:offsets[i + 1]] for i in range(index.nlist)]
+        index._count = meta["count"]
+        index.trained_count = meta.get("trained_count", meta["count"])
+        return index
+
+    def _all_codes(self) -> np.ndarray:
+        return np.concatenate(self._codes) if self._codes else self._empty_codes()
+
+    def _all_ids(self) -> np.ndarray:
+        return np.concatenate(self._ids) if self._ids else np.empty(0, dtype=np.int64)
+
+    def _empty_codes(self) -> np.ndarray:
+        if self.m:
+            return np.empty((0, self.m), dtype=np.uint8)
+        return np.empty((0, self.dim), dtype=np.float32)
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        sub_dim = self.dim // self.m
+        return np.stack([
+            _nearest(residuals[:, j * sub_dim:(j + 1) * sub_dim], self.codebooks[j]).astype(np.uint8)
+            for j in range(self.m)
+        ], axis=1)
+
+
+def build_ivfpq_index(embeddings: np.ndarray, nlist: Optional[int] = None, m: int = 16, nprobe: int = 16,
+                      train_size: int = 100_000, chunk_size: int = 50_000) -> IVFPQIndex:
+    """Trains on a sample of `embeddings` (may be a memmap) and adds all rows chunk by chunk."""
+    count, dim = embeddings.shape
+    nlist = nlist or max(1, int(4 * np.sqrt(count)))
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(count, size=min(train_size, count), replace=False))
+
+    index = IVFPQIndex(dim, nlist=nlist, m=m, nprobe=nprobe)
+    index.train(np.asarray(embeddings[sample_rows]))
+    for start in range(0, count, chunk_size):
+        index.add(np.asarray(embeddings[start:start + chunk_size]))
+    index.trained_count = count
+    return index
+
+
+def build_ann_for_export(index_dir: str, nprobe: int = 16, m: int = 16) -> IVFPQIndex:
+    """Builds the IVF-PQ index for a `export_kb` directory and saves it under `<index_dir>/ann`."""
+    from src.kb_retrieval.local_vector_index import EMBEDDINGS_FILE
+
+    embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    index = build_ivfpq_index(embeddings, m=m, nprobe=nprobe)
+    index.save(os.path.join(index_dir, "ann"))
+    np.save(os.path.join(index_dir, "ann", ROWS_FILE), _row_digests(index_dir, embeddings))
+    return index
+
+
+def update_ann_for_export(index_dir: str, nprobe: int = 16, m: int = 16, chunk_size: int = 50_000,
+                          max_growth: float = 2.0) -> Tuple[IVFPQIndex, int]:
+    """
+    Incremental `build_ann_for_export`: keeps the trained quantiser of the existing
+    `<index_dir>/ann` and the codes of every exported row whose node id and vector are unchanged,
+    and only encodes the new or changed rows (removed rows are dropped). Falls back to a full
+    build when there is no usable index or the KB has grown more than `max_growth` times since the
+    quantiser was trained. Returns (index, number of rows encoded).
+    """
+    from src.kb_retrieval.local_vector_index import EMBEDDINGS_FILE
+
+    embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    ann_dir = os.path.join(index_dir, "ann")
+    try:
+        old = IVFPQIndex.load(ann_dir, mmap=False)
+        old_digests = np.load(os.path.join(ann_dir, ROWS_FILE))
+    except (OSError, ValueError, KeyError):
+        old = None
+    count, dim = embeddings.shape
+    if old is None or old.dim != dim or old.m != m or len(old_digests) != len(old) or \
+            count > max_growth * max(old.trained_count, 1):
+        return build_ann_for_export(index_dir, nprobe=nprobe, m=m), count
+
+    old_assignments, old_codes, old_ids = old.encoded_rows()
+    old_slot = np.empty(len(old), dtype=np.int64)
+    old_slot[old_ids] = np.arange(len(old_ids))
+    old_positions = {digest: position for position, digest in enumerate(old_digests.tolist())}
+
+    digests = _row_digests(index_dir, embeddings)
+    kept = np.array([old_positions.get(digest, -1) for digest in digests.tolist()], dtype=np.int64)
+    rows = np.flatnonzero(kept >= 0)
+    slots = old_slot[kept[rows]]
+
+    index = old
+    index.nprobe = nprobe
+    index.reset()
+    index.add_encoded(old_assignments[slots], old_codes[slots], rows)
+    added = np.flatnonzero(kept < 0)
+    for start in range(0, len(added), chunk_size):
+        chunk = added[start:start + chunk_size]
+        index.add(np.asarray(embeddings[chunk]), ids=chunk)
+    index.save(ann_dir)
+    np.save(os.path.join(ann_dir, ROWS_FILE), digests)
+    return index, len(added)
+
+
+def load_ann_for_export(index_dir: str, nprobe: Optional[int] = None) -> IVFPQIndex:
+    """Loads `<index_dir>/ann` memory-mapped, with the exported matrix attached for exact re-scoring."""
+    from src.kb_retrieval.local_vector_index import EMBEDDINGS_FILE
+
+    index = IVFPQIndex.load(os.path.join(index_dir, "ann"), nprobe=nprobe)
+    index.refine_vectors = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    return index
+
+
+def _row_digests(index_dir: str, embeddings: np.ndarray) -> np.ndarray:
+    from src.kb_retrieval.local_vector_index import METADATA_FILE
+
+    with open(os.path.join(index_dir, METADATA_FILE), "r") as f:
+        ids = json.load(f)["ids"]
+    return np.array([hashlib.blake2b(node_id.encode() + np.asarray(row).tobytes(), digest_size=16).digest()
+                     for node_id, row in zip(ids, embeddings)], dtype="S16")
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 16_384) -> np.ndarray:
+    """Index of the closest centroid (L2) for each row, computed in chunks to bound memory."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        distances = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+        assignments[start:start + chunk_size] = distances.argmin(axis=1)
+    return assignments
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(data, centroids)
+        order = np.argsort(assignments, kind="stable")
+        clusters, starts = np.unique(assignments[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[clusters] = np.add.reduceat(data[order], starts, axis=0)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # re-seed empty clusters with random points so every list stays usable
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids
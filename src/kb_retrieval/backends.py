@@ -0,0 +1,83 @@
+import os
+
+from src.kb_construction.kb_loader import Neo4jKBLoader
+from src.kb_retrieval.embedding_based_retriever import KBRetrieval
+
+
+def create_retriever(kb_loader: Neo4jKBLoader = None):
+    """
+    Builds the retriever selected by RETRIEVER_BACKEND:
+    - "neo4j" (default): vector search through `db.index.vector.queryNodes`
+    - "local": in-process exact search over the index exported to KB_INDEX_DIR
+    - "ann": in-process IVF-PQ search over KB_INDEX_DIR/ann (recall/latency knob: ANN_NPROBE);
+      KBs under ANN_MIN_VECTORS (50k) use exact search instead, which is faster there
+
+    When the build wrote a lexical index (KB_INDEX_DIR/lexical), the vector retriever is wrapped in
+    `HybridKBRetrieval` (BM25 + reciprocal rank fusion); HYBRID_RETRIEVAL=0 turns that off.
+
+    GRAPH_EXPANSION=1 adds up to GRAPH_EXPANSION_MAX_ADDED sections of other units that share
+    rare mentions with the hits (`GraphExpandedRetrieval`, over KB_INDEX_DIR/mention_graph;
+    GRAPH_EXPANSION_HOPS and GRAPH_EXPANSION_FANOUT bound the walk). Without RERANK they take the
+    last slots of the CONTEXT_SECTIONS window.
+
+    RERANK=1 adds the feature-based `Reranker` on top (needs KB_INDEX_DIR/rerank from the build):
+    it reorders RERANK_CANDIDATES sections within RERANK_BUDGET_MS, and callers then only need
+    the first few.
+    """
+    kb_loader = kb_loader or Neo4jKBLoader.shared()
+    retriever = _create_vector_retriever(kb_loader)
+
+    index_dir = os.getenv("KB_INDEX_DIR", "kb_index")
+    from src.kb_retrieval.lexical_index import LEXICAL_DIR, LexicalIndex, HybridKBRetrieval
+    if os.getenv("HYBRID_RETRIEVAL", "1") == "1" and os.path.isdir(os.path.join(index_dir, LEXICAL_DIR)):
+        retriever = HybridKBRetrieval(retriever, LexicalIndex.load(index_dir),
+                                      candidates=int(os.getenv("HYBRID_CANDIDATES", "20")),
+                                      rrf_k=int(os.getenv("HYBRID_RRF_K", "60")))
+
+    from src.kb_retrieval.reranker import RERANK_DIR, Reranker, RerankingRetrieval
+    rerank = os.getenv("RERANK", "0") == "1" and os.path.isdir(os.path.join(index_dir, RERANK_DIR))
+    from src.kb_retrieval.mention_graph import GRAPH_DIR, MentionGraph, GraphExpandedRetrieval
+    if os.getenv("GRAPH_EXPANSION", "0") == "1":
+        if os.path.isdir(os.path.join(index_dir, GRAPH_DIR)):
+            retriever = GraphExpandedRetrieval(
+                retriever, MentionGraph.load(index_dir),
+                max_added=int(os.getenv("GRAPH_EXPANSION_MAX_ADDED", "3")),
+                max_hops=int(os.getenv("GRAPH_EXPANSION_HOPS", "1")),
+                fanout=int(os.getenv("GRAPH_EXPANSION_FANOUT", "5")),
+                max_mention_sections=int(os.getenv("GRAPH_EXPANSION_MAX_MENTION_SECTIONS", "50")),
+                # without a reranker to sort them in, added sections must fit the prompt's window
+                max_sections=None if rerank else int(os.getenv("CONTEXT_SECTIONS", "10")),
+            )
+        else:
+            print(f"GRAPH_EXPANSION=1 but {os.path.join(index_dir, GRAPH_DIR)} does not exist; rebuild the KB to enable it")
+
+    if os.getenv("RERANK", "0") == "1":
+        if rerank:
+            reranker = Reranker.load(index_dir, budget_ms=float(os.getenv("RERANK_BUDGET_MS", "20")))
+            retriever = RerankingRetrieval(retriever, reranker,
+                                           candidates=int(os.getenv("RERANK_CANDIDATES", "15")),
+                                           default_top_k=int(os.getenv("RERANK_TOP_K", "4")))
+        else:
+            print(f"RERANK=1 but {os.path.join(index_dir, RERANK_DIR)} does not exist; rebuild the KB to enable it")
+    return retriever
+
+
+def _create_vector_retriever(kb_loader: Neo4jKBLoader):
+    backend = os.getenv("RETRIEVER_BACKEND", "neo4j").lower()
+
+    if backend == "neo4j":
+        return KBRetrieval(kb_loader)
+    if backend == "local":
+        from src.kb_retrieval.local_vector_index import LocalKBRetrieval
+        return LocalKBRetrieval(kb_loader, os.getenv("KB_INDEX_DIR", "kb_index"))
+    if backend == "ann":
+        from src.kb_retrieval.local_vector_index import ExactVectorIndex, LocalKBRetrieval
+        from src.kb_retrieval.ann_index import load_ann_for_export
+        index_dir = os.getenv("KB_INDEX_DIR", "kb_index")
+        # below ANN_MIN_VECTORS exact search is both faster and exact (see benchmarks/ann_index.py)
+        exact = ExactVectorIndex.load(index_dir)
+        if len(exact) < int(os.getenv("ANN_MIN_VECTORS", "50000")):
+            return LocalKBRetrieval(kb_loader, index_dir, index=exact)
+        index = load_ann_for_export(index_dir, nprobe=int(os.getenv("ANN_NPROBE", "16")))
+        return LocalKBRetrieval(kb_loader, index_dir, index=index)
+    raise ValueError(f"Unknown RETRIEVER_BACKEND: {backend!r}")
@@ -1,9 +1,38 @@
 from typing import List, Dict, Any
 
+QUERY_SECTIONS_CYPHER = """
+
+CALL db.index.vector.queryNodes('node_embedding_index', $topK, $embedding) YIELD node, score
+OPTIONAL MATCH (section:Section)-[:HAS_MENTION|HAS_FIGURE]->(node)
+WITH node, score, CASE WHEN section IS NOT NULL THEN section ELSE node END AS section_node
+ORDER BY score DESC 
+RETURN DISTINCT section_node, score
+ORDER BY score DESC
+LIMIT $topK
+
+"""
+
+# every question of a batch in one round trip; rows come back grouped by question index
+BATCH_QUERY_SECTIONS_CYPHER = """
+
+UNWIND range(0, size($embeddings) - 1) AS i
+CALL db.index.vector.queryNodes('node_embedding_index', $topK, $embeddings[i]) YIELD node, score
+OPTIONAL MATCH (section:Section)-[:HAS_MENTION|HAS_FIGURE]->(node)
+RETURN i, CASE WHEN section IS NOT NULL THEN section ELSE node END AS section_node, score
+ORDER BY i, score DESC
+
+"""
+
+
 class KBRetrieval:
     def __init__(self, kb_loader):
         self.kb_loader = kb_loader
 
+    def query_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Embeds `query` (through the shared embedding cache) and retrieves the top_k sections."""
+        from src.kb_construction.utils import get_embedding
+        return self.query_sections_by_embedding(query_embedding=get_embedding(query), top_k=top_k)
+
     def query_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Retrieve the top_k most relevant Section nodes, even if the closest match is a Mention or FigureRef,
@@ -23,36 +52,57 @@ class KBRetrieval:
         # ORDER BY score DESC
         # LIMIT $topK
         # """
-        cypher = """
+        with self.kb_loader.session() as session:
+            result = session.run(
+                QUERY_SECTIONS_CYPHER,
+                embedding=query_embedding,
+                topK=top_k
+            )
+            return _collect_sections(result)
 
-        CALL db.index.vector.queryNodes('node_embedding_index', $topK, $embedding) YIELD node, score
-        OPTIONAL MATCH (section:Section)-[:HAS_MENTION|HAS_FIGURE]->(node)
-        WITH node, score, CASE WHEN section IS NOT NULL THEN section ELSE node END AS section_node
-        ORDER BY score DESC 
-        RETURN DISTINCT section_node, score
-        ORDER BY score DESC
-        LIMIT $topK
+    async def aquery_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        from src.kb_construction.utils import aget_embedding
+        return await self.aquery_sections_by_embedding(query_embedding=await aget_embedding(query), top_k=top_k)
 
-        """
-        with self.kb_loader.driver.session() as session:
-            result = session.run(
-                cypher,
+    async def aquery_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """Same as `query_sections_by_embedding`, on the async driver."""
+        async with self.kb_loader.async_session() as session:
+            result = await session.run(
+                QUERY_SECTIONS_CYPHER,
                 embedding=query_embedding,
                 topK=top_k
             )
-            found_sections = set()
-            output = []
-            for record in result:
-                section_node = record["section_node"]
-                score = record["score"]
-                section_dict = dict(section_node)
-                # Avoid duplicates
-                section_id = section_dict.get("id")
-                if section_id not in found_sections:
-                    found_sections.add(section_id)
-                    section_dict["similarity_score"] = score
-                    output.append(section_dict)
-            return output
+            return _collect_sections([record async for record in result])
+
+    async def aquery_sections_batch(self, queries: List[str], query_embeddings: List[List[float]],
+                                    top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """`aquery_sections_by_embedding` for many questions in one UNWIND query."""
+        async with self.kb_loader.async_session() as session:
+            result = await session.run(
+                BATCH_QUERY_SECTIONS_CYPHER,
+                embeddings=query_embeddings,
+                topK=top_k
+            )
+            records = [[] for _ in query_embeddings]
+            async for record in result:
+                records[record["i"]].append(record)
+        return [_collect_sections(rows)[:top_k] for rows in records]
+
+
+def _collect_sections(records) -> List[Dict[str, Any]]:
+    found_sections = set()
+    output = []
+    for record in records:
+        section_node = record["section_node"]
+        score = record["score"]
+        section_dict = dict(section_node)
+        # Avoid duplicates
+        section_id = section_dict.get("id")
+        if section_id not in found_sections:
+            found_sections.add(section_id)
+            section_dict["similarity_score"] = score
+            output.append(section_dict)
+    return output
 
 if __name__ == "__main__":
     from src.kb_construction.kb_loader import Neo4jKBLoader
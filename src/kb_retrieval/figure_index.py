@@ -0,0 +1,120 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.kb_construction.build_version import read_build_version
+
+FIGURE_INDEX_FILE = "figure_index.json"
+
+
+def figure_index_path() -> str:
+    return os.path.join(os.getenv("KB_INDEX_DIR", "kb_index"), FIGURE_INDEX_FILE)
+
+
+def write_figure_index(units, page_image_urls: Dict[Tuple[Optional[str], int], str], path: Optional[str] = None) -> int:
+    """
+    Writes {label: [{doc_id, caption, page_number, url, section_id}]} for every FigureRef of
+    `units`, one entry per document ("Figure 1.26" exists in every book, and page numbers are per
+    book). `page_image_urls` is keyed by (doc_id, page_number); single-document builds use None.
+    A label referenced from several sections of a document keeps its first owner. Returns the
+    number of entries.
+    """
+    path = path or figure_index_path()
+    index: Dict[str, List[Dict]] = {}
+    seen = set()
+    for unit in units:
+        for section in unit.sections:
+            for fig in section.fig_refs:
+                doc_id = fig.doc_id or section.doc_id
+                if (doc_id, fig.label) in seen:
+                    continue
+                seen.add((doc_id, fig.label))
+                index.setdefault(fig.label, []).append({
+                    "doc_id": doc_id,
+                    "caption": fig.caption or "",
+                    "page_number": fig.page_number,
+                    "url": page_image_urls.get((doc_id, fig.page_number)),
+                    "section_id": section.id,
+                })
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return len(seen)
+
+
+def pick_document(entries: List[Dict], doc_ids: Optional[List[str]]) -> Optional[Dict]:
+    """
+    The entry of the first document in `doc_ids` (the documents of the retrieved sections, best
+    first) that has one; without `doc_ids` (single-document KB) the first entry.
+    """
+    if not doc_ids:
+        return entries[0] if entries else None
+    by_doc = {entry.get("doc_id"): entry for entry in reversed(entries)}
+    return next((by_doc[doc_id] for doc_id in doc_ids if doc_id in by_doc), None)
+
+
+class FigureIndex:
+    """
+    In-memory figure label -> page image table, loaded from the file written at build time.
+    Reloads itself when the KB build version changes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.version: Optional[str] = None
+        self.figures: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            version = read_build_version()
+            with open(self.path, "r") as f:
+                figures = json.load(f)
+            # files written before figures were kept per document hold one entry per label
+            self.figures = {label: entries if isinstance(entries, list) else [dict(entries, doc_id=None)]
+                            for label, entries in figures.items()}
+            self.version = version
+
+    def maybe_reload(self):
+        if read_build_version() != self.version:
+            self.reload()
+
+    def covers(self, labels: List[str], doc_ids: Optional[List[str]] = None) -> bool:
+        return all(pick_document(self.figures.get(label, []), doc_ids) is not None for label in labels)
+
+    def resolve(self, labels: List[str], doc_ids: Optional[List[str]] = None
+                ) -> Tuple[List[Dict], Dict[Tuple[Optional[str], int], str]]:
+        """
+        Same shape as the Cypher lookup: ([{label, caption, page_number, doc_id}],
+        {(doc_id, page_number): url}), each label taken from the first of `doc_ids` that has it.
+        """
+        figures, page_images = [], {}
+        for label in labels:
+            entry = pick_document(self.figures.get(label, []), doc_ids)
+            if entry is None:
+                continue
+            figures.append({"label": label, "caption": entry["caption"], "page_number": entry["page_number"],
+                            "doc_id": entry["doc_id"]})
+            if entry["url"]:
+                page_images[(entry["doc_id"], entry["page_number"])] = entry["url"]
+        return figures, page_images
+
+
+_index: Optional[FigureIndex] = None
+
+
+def get_figure_index() -> Optional[FigureIndex]:
+    """The shared index, or None if no build has written one yet (callers fall back to Neo4j)."""
+    global _index
+    if _index is None:
+        path = figure_index_path()
+        if not os.path.exists(path):
+            return None
+        _index = FigureIndex(path)
+    else:
+        _index.maybe_reload()
+    return _index
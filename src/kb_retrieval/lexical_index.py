@@ -0,0 +1,217 @@
+import os
+import re
+import json
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.kb_construction.mention_registry import singularize
+
+LEXICAL_DIR = "lexical"
+VOCAB_FILE = "vocab.json"
+DOCS_FILE = "docs.json"
+POSTING_DOCS_FILE = "posting_docs.npy"
+POSTING_WEIGHTS_FILE = "posting_weights.npy"
+
+# keeps figure / activity numbers such as "1.26" or "2.2" as one token
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)+|[^\W_]+")
+STOPWORDS = set("""
+a an and are as at be been but by can do does did for from has have how i if in into is it its
+of on or our so than that the their them then there these they this to was we were what when
+where which while who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS or (len(token) == 1 and not token.isdigit()):
+            continue
+        tokens.append(singularize(token))
+    return tokens
+
+
+def section_document(section) -> Tuple[Dict[str, Any], List[str]]:
+    """Properties returned for a hit, and the tokens indexed for it (title counted twice)."""
+    captions = " ".join(f"{fig.label} {fig.caption or ''}" for fig in section.fig_refs)
+    props = section.to_dict()
+    props.pop("embedding", None)
+    tokens = tokenize(section.section_title) * 2 + tokenize(section.content) + tokenize(captions)
+    return props, tokens
+
+
+def build_lexical_index(units, directory: str, k1: float = 1.2, b: float = 0.75) -> int:
+    """
+    Builds a BM25 inverted index over every Section of `units` (title, content and FigureRef
+    captions) into `<directory>/lexical`. Term statistics are folded into one precomputed BM25
+    weight per posting, so a query is a sum of memory-mapped weight slices. Returns the number
+    of indexed sections.
+    """
+    docs, doc_tokens = [], []
+    for unit in units:
+        for section in unit.sections:
+            props, tokens = section_document(section)
+            docs.append(props)
+            doc_tokens.append(tokens)
+    return write_lexical_index(docs, doc_tokens, directory, k1=k1, b=b)
+
+
+def write_lexical_index(docs: List[Dict[str, Any]], doc_tokens: List[List[str]], directory: str,
+                        k1: float = 1.2, b: float = 0.75) -> int:
+    num_docs = len(docs)
+    lengths = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+    avg_length = float(lengths.mean()) if num_docs else 0.0
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc, tokens in enumerate(doc_tokens):
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append((doc, tf))
+
+    vocab, posting_docs, posting_weights = {}, [], []
+    offset = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        docs_of_term = np.array([doc for doc, _ in entries], dtype=np.int32)
+        tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+        idf = float(np.log(1.0 + (num_docs - len(entries) + 0.5) / (len(entries) + 0.5)))
+        norm = k1 * (1.0 - b + b * lengths[docs_of_term] / (avg_length or 1.0))
+        posting_docs.append(docs_of_term)
+        posting_weights.append((idf * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32))
+        vocab[term] = [offset, offset + len(entries)]
+        offset += len(entries)
+
+    path = os.path.join(directory, LEXICAL_DIR)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, POSTING_DOCS_FILE),
+            np.concatenate(posting_docs) if posting_docs else np.empty(0, dtype=np.int32))
+    np.save(os.path.join(path, POSTING_WEIGHTS_FILE),
+            np.concatenate(posting_weights) if posting_weights else np.empty(0, dtype=np.float32))
+    with open(os.path.join(path, VOCAB_FILE), "w") as f:
+        json.dump({"k1": k1, "b": b, "terms": vocab}, f)
+    with open(os.path.join(path, DOCS_FILE), "w") as f:
+        json.dump(docs, f)
+    return num_docs
+
+
+class LexicalIndex:
+    """BM25 search over an index written by `build_lexical_index`; postings stay memory-mapped."""
+    def __init__(self, vocab: Dict[str, List[int]], docs: List[Dict[str, Any]],
+                 posting_docs: np.ndarray, posting_weights: np.ndarray):
+        self.vocab = vocab
+        self.docs = docs
+        self.posting_docs = posting_docs
+        self.posting_weights = posting_weights
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "LexicalIndex":
+        path = os.path.join(directory, LEXICAL_DIR)
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, VOCAB_FILE), "r") as f:
+            vocab = json.load(f)["terms"]
+        with open(os.path.join(path, DOCS_FILE), "r") as f:
+            docs = json.load(f)
+        return cls(vocab, docs,
+                   np.load(os.path.join(path, POSTING_DOCS_FILE), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, POSTING_WEIGHTS_FILE), mmap_mode=mmap_mode))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """[(doc position, BM25 score)], best first; documents sharing no term are not returned."""
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for term in set(tokenize(query)):
+            span = self.vocab.get(term)
+            if span is None:
+                continue
+            start, end = span
+            # a document appears once per term, so plain fancy-index accumulation is exact
+            scores[self.posting_docs[start:end]] += self.posting_weights[start:end]
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(doc), float(scores[doc])) for doc in top]
+
+    def search_sections(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
+        return [dict(self.docs[doc], lexical_score=score) for doc, score in self.search(query, k)]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, weights: List[float] = None) -> List[Tuple[str, float]]:
+    """Fuses ranked id lists: score(id) = sum_i weight_i / (k + rank_i(id)), rank starting at 1."""
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridKBRetrieval:
+    """
+    Wraps a vector retriever (`KBRetrieval` / `LocalKBRetrieval`) and fuses its ranking with BM25
+    over the lexical index using reciprocal rank fusion. Each side contributes `candidates`
+    results; sections only found lexically are returned from the index's own copy of their
+    properties. Exact-term questions ("Figure 1.26", "Let's Investigate 1.2") get their section
+    to the top, so fewer sections are needed in the prompt.
+    """
+    def __init__(self, retriever, lexical_index: LexicalIndex, candidates: int = 20, rrf_k: int = 60,
+                 lexical_weight: float = 1.0):
+        self.retriever = retriever
+        self.kb_loader = retriever.kb_loader
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.lexical_weight = lexical_weight
+
+    def query_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        from src.kb_construction.utils import get_embedding
+        vector_hits = self.retriever.query_sections_by_embedding(get_embedding(query), top_k=max(top_k, self.candidates))
+        return self.fuse(query, vector_hits, top_k)
+
+    async def aquery_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        from src.kb_construction.utils import aget_embedding
+        vector_hits = await self.retriever.aquery_sections_by_embedding(
+            await aget_embedding(query), top_k=max(top_k, self.candidates))
+        return self.fuse(query, vector_hits, top_k)
+
+    async def aquery_sections_batch(self, queries: List[str], query_embeddings: List[List[float]],
+                                    top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        batch_hits = await self.retriever.aquery_sections_batch(queries, query_embeddings,
+                                                                top_k=max(top_k, self.candidates))
+        return [self.fuse(query, vector_hits, top_k) for query, vector_hits in zip(queries, batch_hits)]
+
+    def query_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        # no query text, nothing to match lexically
+        return self.retriever.query_sections_by_embedding(query_embedding, top_k=top_k)
+
+    async def aquery_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        return await self.retriever.aquery_sections_by_embedding(query_embedding, top_k=top_k)
+
+    def fuse(self, query: str, vector_hits: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        lexical_hits = self.lexical_index.search_sections(query, k=max(top_k, self.candidates))
+        by_id = {hit["id"]: hit for hit in lexical_hits}
+        by_id.update({hit["id"]: hit for hit in vector_hits})
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in vector_hits], [hit["id"] for hit in lexical_hits]],
+            k=self.rrf_k, weights=[1.0, self.lexical_weight],
+        )
+        output = []
+        for section_id, score in fused[:top_k]:
+            section = dict(by_id[section_id])
+            section.pop("lexical_score", None)
+            section.setdefault("similarity_score", None)
+            section["rrf_score"] = score
+            output.append(section)
+        return output
+
+
+if __name__ == "__main__":
+    import sys
+
+    index = LexicalIndex.load(os.getenv("KB_INDEX_DIR", "kb_index"))
+    for hit in index.search_sections(" ".join(sys.argv[1:]) or "Figure 1.26", k=5):
+        print(f"{hit['lexical_score']:.2f}  {hit.get('unit_title')} / {hit.get('section_title')}")
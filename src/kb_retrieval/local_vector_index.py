@@ -0,0 +1,163 @@
+import os
+import json
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.json"
+
+# Mention / FigureRef hits are rolled up to their parent Section, same as the Cypher retriever
+ROLLED_UP_LABELS = {"Mention", "FigureRef"}
+
+
+class ExactVectorIndex:
+    """Brute-force cosine search over a (memory-mapped) float32 matrix of L2-normalised rows."""
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def search(self, query_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        query_vectors: (d,) or (n, d). Returns (indices, cosine similarities), each (n, k),
+        best first.
+        """
+        queries = _normalise(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        scores = queries @ self.embeddings.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ExactVectorIndex":
+        return cls(np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None))
+
+
+def export_kb(kb_loader, directory: str) -> int:
+    """
+    Dumps every embedded node into `directory`: a float32 matrix (one normalised row per node)
+    and a metadata sidecar with ids, labels, parent Section ids and the properties of the
+    nodes that can be returned as results. Returns the number of exported nodes.
+    """
+    cypher = """
+    MATCH (n:Node) WHERE n.embedding IS NOT NULL
+    OPTIONAL MATCH (section:Section)-[:HAS_MENTION|HAS_FIGURE]->(n)
+    RETURN n.id AS id, labels(n) AS labels, n.embedding AS embedding,
+           collect(section.id) AS section_ids, n {.*, embedding: null} AS props
+    """
+    ids, labels, section_ids, vectors, nodes = [], [], [], [], {}
+    with kb_loader.session() as session:
+        for record in session.run(cypher):
+            label = next((l for l in record["labels"] if l != "Node"), "Node")
+            ids.append(record["id"])
+            labels.append(label)
+            section_ids.append(record["section_ids"] if label in ROLLED_UP_LABELS else [])
+            vectors.append(record["embedding"])
+            props = dict(record["props"])
+            props.pop("embedding", None)
+            nodes[record["id"]] = props
+
+    returned = {sid for parents in section_ids for sid in parents}
+    returned |= {node_id for node_id, parents, label in zip(ids, section_ids, labels)
+                 if label not in ROLLED_UP_LABELS or not parents}
+
+    os.makedirs(directory, exist_ok=True)
+    # (0, 0) rather than (0,) for an empty KB, so every index sees a 2-D matrix
+    matrix = _normalise(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1) if vectors
+                        else np.empty((0, 0), dtype=np.float32))
+    np.save(os.path.join(directory, EMBEDDINGS_FILE), matrix)
+    with open(os.path.join(directory, METADATA_FILE), "w") as f:
+        json.dump({
+            "dim": int(matrix.shape[1]) if len(matrix) else 0,
+            "ids": ids,
+            "labels": labels,
+            "section_ids": section_ids,
+            "nodes": {node_id: props for node_id, props in nodes.items() if node_id in returned},
+        }, f)
+    return len(ids)
+
+
+class LocalKBRetrieval:
+    """
+    In-process drop-in for `KBRetrieval`: answers top-k cosine queries from an index exported by
+    `export_kb` instead of calling `db.index.vector.queryNodes`. `index` can be any object with a
+    `search(query_vectors, k)` method (exact by default).
+    """
+    def __init__(self, kb_loader, index_dir: str, index=None):
+        self.kb_loader = kb_loader
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, METADATA_FILE), "r") as f:
+            metadata = json.load(f)
+        self.ids: List[str] = metadata["ids"]
+        self.labels: List[str] = metadata["labels"]
+        self.section_ids: List[List[str]] = metadata["section_ids"]
+        self.nodes: Dict[str, Dict[str, Any]] = metadata["nodes"]
+        self.index = index if index is not None else ExactVectorIndex.load(index_dir)
+
+    def query_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        from src.kb_construction.utils import get_embedding
+        return self.query_sections_by_embedding(query_embedding=get_embedding(query), top_k=top_k)
+
+    def query_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        indices, scores = self.index.search(np.asarray(query_embedding, dtype=np.float32), top_k)
+        return self._roll_up(indices[0], scores[0], top_k)
+
+    async def aquery_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        from src.kb_construction.utils import aget_embedding
+        return self.query_sections_by_embedding(query_embedding=await aget_embedding(query), top_k=top_k)
+
+    async def aquery_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        # in-memory search takes microseconds, no need to leave the event loop
+        return self.query_sections_by_embedding(query_embedding, top_k)
+
+    async def aquery_sections_batch(self, queries: List[str], query_embeddings: List[List[float]],
+                                    top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        # one (n, d) x (d, N) product instead of n searches
+        indices, scores = self.index.search(np.asarray(query_embeddings, dtype=np.float32), top_k)
+        return [self._roll_up(row_indices, row_scores, top_k) for row_indices, row_scores in zip(indices, scores)]
+
+    def _roll_up(self, indices: np.ndarray, scores: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        rows = []
+        for idx, cosine in zip(indices.tolist(), scores.tolist()):
+            if idx < 0:
+                continue
+            # same score scale as Neo4j's cosine vector index
+            score = (1.0 + cosine) / 2.0
+            parents = self.section_ids[idx] if self.labels[idx] in ROLLED_UP_LABELS else []
+            for section_id in parents or [self.ids[idx]]:
+                rows.append((section_id, score))
+        rows.sort(key=lambda row: row[1], reverse=True)
+
+        found_sections = set()
+        output = []
+        for section_id, score in rows[:top_k]:
+            if section_id not in found_sections and section_id in self.nodes:
+                found_sections.add(section_id)
+                section_dict = dict(self.nodes[section_id])
+                section_dict["similarity_score"] = score
+                output.append(section_dict)
+        return output
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+if __name__ == "__main__":
+    from src.kb_construction.kb_loader import Neo4jKBLoader
+
+    loader = Neo4jKBLoader.shared()
+    directory = os.getenv("KB_INDEX_DIR", "kb_index")
+    count = export_kb(loader, directory)
+    loader.close()
+    print(f"Exported {count} node embeddings to {directory}")
@@ -0,0 +1,241 @@
+import os
+import json
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+GRAPH_DIR = "mention_graph"
+GRAPH_FILE = "graph.json"
+SECTION_INDPTR_FILE = "section_indptr.npy"
+SECTION_MENTIONS_FILE = "section_mentions.npy"
+MENTION_INDPTR_FILE = "mention_indptr.npy"
+MENTION_SECTIONS_FILE = "mention_sections.npy"
+MENTION_IDF_FILE = "mention_idf.npy"
+
+
+def build_mention_graph(units, directory: str) -> int:
+    """
+    Exports the Section -[:HAS_MENTION]-> Mention graph of `units` into `<directory>/mention_graph`
+    as two CSR adjacency arrays (section -> mentions, mention -> sections), the IDF of every
+    mention and the properties of the sections, so retrieval can follow shared mentions without
+    querying Neo4j. Returns the number of sections.
+    """
+    sections, section_mentions, mention_strings = [], [], {}
+    for unit in units:
+        for section in unit.sections:
+            props = section.to_dict()
+            props.pop("embedding", None)
+            sections.append(props)
+            section_mentions.append([mention.id for mention in section.mentions])
+            for mention in section.mentions:
+                mention_strings.setdefault(mention.id, mention.string)
+    return write_mention_graph(sections, section_mentions, mention_strings, directory)
+
+
+def write_mention_graph(sections: List[Dict[str, Any]], section_mentions: List[List[str]],
+                        mention_strings: Dict[str, str], directory: str) -> int:
+    mention_ids = sorted(mention_strings)
+    mention_pos = {mention_id: i for i, mention_id in enumerate(mention_ids)}
+
+    # section -> mentions (each mention once per section)
+    rows = [sorted({mention_pos[mention_id] for mention_id in mentions}) for mentions in section_mentions]
+    section_indptr = np.zeros(len(sections) + 1, dtype=np.int64)
+    section_indptr[1:] = np.cumsum([len(row) for row in rows])
+    section_edges = np.fromiter((m for row in rows for m in row), dtype=np.int32, count=int(section_indptr[-1]))
+
+    # mention -> sections is the transpose: stable sort of the edges by mention
+    edge_sections = np.repeat(np.arange(len(sections), dtype=np.int32), np.diff(section_indptr))
+    order = np.argsort(section_edges, kind="stable")
+    degree = np.bincount(section_edges, minlength=len(mention_ids))
+    mention_indptr = np.zeros(len(mention_ids) + 1, dtype=np.int64)
+    mention_indptr[1:] = np.cumsum(degree)
+    mention_idf = np.log(max(len(sections), 1) / np.maximum(degree, 1)).astype(np.float32)
+
+    path = os.path.join(directory, GRAPH_DIR)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, SECTION_INDPTR_FILE), section_indptr)
+    np.save(os.path.join(path, SECTION_MENTIONS_FILE), section_edges)
+    np.save(os.path.join(path, MENTION_INDPTR_FILE), mention_indptr)
+    np.save(os.path.join(path, MENTION_SECTIONS_FILE), edge_sections[order])
+    np.save(os.path.join(path, MENTION_IDF_FILE), mention_idf)
+    with open(os.path.join(path, GRAPH_FILE), "w") as f:
+        json.dump({"mention_ids": mention_ids, "mention_strings": [mention_strings[m] for m in mention_ids],
+                   "sections": sections}, f)
+    return len(sections)
+
+
+class MentionGraph:
+    """
+    In-memory Section <-> Mention adjacency written by `build_mention_graph`.
+
+    `expand` walks from seed sections through the mentions they share with other sections:
+    every hop follows at most `fanout` mentions per section (the rarest, i.e. highest IDF) and
+    keeps the best `fanout` neighbours per section, mentions found in more than
+    `max_mention_sections` sections are never followed, and the walk stops after `max_hops`.
+    A neighbour scores the IDF of the shared mentions times the weight of the section it was
+    reached from, divided by the square root of its own mention count (so a section listing
+    every concept of the book does not win by default), and halves with every further hop.
+    """
+    def __init__(self, sections: List[Dict[str, Any]], mention_strings: List[str],
+                 section_indptr: np.ndarray, section_mentions: np.ndarray,
+                 mention_indptr: np.ndarray, mention_sections: np.ndarray, mention_idf: np.ndarray):
+        self.sections = sections
+        self.mention_strings = mention_strings
+        self.section_indptr = section_indptr
+        self.section_mentions = section_mentions
+        self.mention_indptr = mention_indptr
+        self.mention_sections = mention_sections
+        self.mention_idf = mention_idf
+        self.position = {section["id"]: i for i, section in enumerate(sections)}
+        self.mention_degree = np.diff(mention_indptr)
+        self.section_norm = np.sqrt(np.maximum(np.diff(section_indptr), 1)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.sections)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "MentionGraph":
+        path = os.path.join(directory, GRAPH_DIR)
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, GRAPH_FILE), "r") as f:
+            graph = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode=mmap_mode) for name in (
+            SECTION_INDPTR_FILE, SECTION_MENTIONS_FILE, MENTION_INDPTR_FILE, MENTION_SECTIONS_FILE, MENTION_IDF_FILE)]
+        return cls(graph["sections"], graph["mention_strings"], *arrays)
+
+    def expand(self, seed_ids: List[str], seed_weights: Optional[List[float]] = None, max_hops: int = 1,
+               fanout: int = 5, max_mention_sections: int = 50, cross_unit_only: bool = True) -> List[Dict[str, Any]]:
+        """
+        Sections related to the seeds through shared mentions, best first, as
+        [{"id", "expansion_score", "hops", "via_mentions"}]; seeds themselves are never returned.
+        Seeds not in the graph (e.g. Unit hits) are ignored.
+        """
+        seed_weights = seed_weights or [1.0] * len(seed_ids)
+        frontier = {}
+        for section_id, weight in zip(seed_ids, seed_weights):
+            position = self.position.get(section_id)
+            if position is not None:
+                frontier[position] = max(frontier.get(position, 0.0), weight)
+        visited = set(frontier)
+        seed_units = {self.sections[position].get("unit_title") for position in frontier}
+
+        found: Dict[int, Dict[str, Any]] = {}
+        for hop in range(1, max_hops + 1):
+            decay = 0.5 ** (hop - 1)
+            next_frontier: Dict[int, float] = {}
+            for position, weight in frontier.items():
+                mentions = self.section_mentions[self.section_indptr[position]:self.section_indptr[position + 1]]
+                # a mention only this section has leads nowhere; one shared by half the book says nothing
+                degree = self.mention_degree[mentions]
+                mentions = mentions[(degree > 1) & (degree <= max_mention_sections)]
+                if not len(mentions):
+                    continue
+                mentions = mentions[np.argsort(-self.mention_idf[mentions], kind="stable")[:fanout]]
+
+                scores: Dict[int, float] = {}
+                via: Dict[int, List[int]] = {}
+                for mention in mentions.tolist():
+                    idf = float(self.mention_idf[mention])
+                    neighbours = self.mention_sections[self.mention_indptr[mention]:self.mention_indptr[mention + 1]]
+                    for neighbour in neighbours.tolist():
+                        if neighbour in visited:
+                            continue
+                        scores[neighbour] = scores.get(neighbour, 0.0) + idf
+                        via.setdefault(neighbour, []).append(mention)
+
+                ranked = sorted(((weight * decay * score / float(self.section_norm[neighbour]), neighbour)
+                                 for neighbour, score in scores.items()), reverse=True)[:fanout]
+                for score, neighbour in ranked:
+                    next_frontier[neighbour] = max(next_frontier.get(neighbour, 0.0), score)
+                    entry = found.setdefault(neighbour, {"score": 0.0, "hops": hop, "via": set()})
+                    entry["score"] += score
+                    entry["via"].update(via[neighbour])
+
+            visited.update(next_frontier)
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        output = []
+        for position, entry in sorted(found.items(), key=lambda item: item[1]["score"], reverse=True):
+            if cross_unit_only and self.sections[position].get("unit_title") in seed_units:
+                continue
+            output.append({
+                "id": self.sections[position]["id"],
+                "expansion_score": entry["score"],
+                "hops": entry["hops"],
+                "via_mentions": [self.mention_strings[mention] for mention in sorted(entry["via"])],
+            })
+        return output
+
+
+class GraphExpandedRetrieval:
+    """
+    Wraps any retriever and appends up to `max_added` sections from other units that share rare
+    mentions with the retrieved ones (the cross-unit links a plain top-k over chunks misses).
+    Expansion runs on the in-memory `MentionGraph`, so it costs no extra database round trip.
+
+    With `max_sections` (the number of sections the caller keeps, e.g. CONTEXT_SECTIONS) the added
+    sections take the last slots of that window instead of landing after it: the hits are cut to
+    `max_sections - max_added` seeds before their neighbours are appended. Added sections get a
+    score just below the weakest seed (in expansion order), so later stages can sort on it.
+    """
+    def __init__(self, retriever, graph: MentionGraph, max_added: int = 3, max_hops: int = 1, fanout: int = 5,
+                 max_mention_sections: int = 50, cross_unit_only: bool = True, max_sections: Optional[int] = None):
+        self.retriever = retriever
+        self.kb_loader = retriever.kb_loader
+        self.graph = graph
+        self.max_added = max_added
+        self.max_hops = max_hops
+        self.fanout = fanout
+        self.max_mention_sections = max_mention_sections
+        self.cross_unit_only = cross_unit_only
+        self.max_sections = max_sections
+
+    def query_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.expand(self.retriever.query_sections(query, top_k=top_k))
+
+    async def aquery_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.expand(await self.retriever.aquery_sections(query, top_k=top_k))
+
+    def query_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.expand(self.retriever.query_sections_by_embedding(query_embedding, top_k=top_k))
+
+    async def aquery_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.expand(await self.retriever.aquery_sections_by_embedding(query_embedding, top_k=top_k))
+
+    async def aquery_sections_batch(self, queries: List[str], query_embeddings: List[List[float]],
+                                    top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        batch_hits = await self.retriever.aquery_sections_batch(queries, query_embeddings, top_k=top_k)
+        return [self.expand(hits) for hits in batch_hits]
+
+    def expand(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not hits or not self.max_added:
+            return hits
+        seeds = hits
+        if self.max_sections is not None:
+            seeds = hits[:max(self.max_sections - self.max_added, 1)]
+        # rank-based seed weights, so the scale does not depend on the retriever's scores
+        seed_weights = [1.0 / math.log2(rank + 2) for rank in range(len(seeds))]
+        neighbours = self.graph.expand([hit.get("id") for hit in seeds], seed_weights, max_hops=self.max_hops,
+                                       fanout=self.fanout, max_mention_sections=self.max_mention_sections,
+                                       cross_unit_only=self.cross_unit_only)
+        seen = {hit.get("id") for hit in hits}
+        neighbours = [neighbour for neighbour in neighbours if neighbour["id"] not in seen][:self.max_added]
+        if self.max_sections is not None:
+            # seeds the neighbours did not need keep their slots
+            seeds = hits[:max(self.max_sections - len(neighbours), 1)]
+
+        output = list(seeds)
+        score_key = "similarity_score" if any(hit.get("similarity_score") is not None for hit in seeds) else "rrf_score"
+        floor = min((hit[score_key] for hit in seeds if hit.get(score_key) is not None), default=None)
+        for rank, neighbour in enumerate(neighbours):
+            section = dict(self.graph.sections[self.graph.position[neighbour["id"]]])
+            section.update(neighbour)
+            section["similarity_score"] = None
+            if floor is not None:
+                # just below every seed, in expansion order
+                section[score_key] = floor - 1e-3 * (rank + 1)
+            output.append(section)
+        return output
@@ -0,0 +1,204 @@
+import os
+import base64
+import asyncio
+import hashlib
+from io import BytesIO
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+_http_clients = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Shared async HTTP client (one per event loop), so image downloads reuse connections. Clients
+    of loops that have since been closed are closed here instead of leaking their connections.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _http_clients:
+        for old_loop in [old_loop for old_loop in _http_clients if old_loop.is_closed()]:
+            loop.create_task(_close_quietly(_http_clients.pop(old_loop)))
+        _http_clients[loop] = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))),
+            follow_redirects=True,
+        )
+    return _http_clients[loop]
+
+
+async def _close_quietly(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception as e:
+        print(f"Could not close stale HTTP client cleanly: {e}")
+
+
+class PageImageStore:
+    """
+    Local store of ready-to-send page images. Each page is downloaded once, optionally downscaled
+    to `max_resolution` (longest side) and re-encoded as JPEG/WebP/PNG, then written to
+    `cache_dir`. The base64 data URIs of recently used pages are kept in a bounded LRU, so the
+    hot path is a dict lookup instead of download -> decode -> encode.
+    """
+    def __init__(self, cache_dir: str = ".cache/page_images",
+                 max_resolution: Optional[int] = 1600,
+                 image_format: str = "JPEG",
+                 quality: int = 85,
+                 max_memory_items: int = 128,
+                 max_concurrency: int = 8):
+        self.cache_dir = cache_dir
+        self.max_resolution = max_resolution
+        self.image_format = image_format.upper()
+        if self.image_format not in _MIME_TYPES:
+            raise ValueError(f"Unsupported page image format: {image_format!r}")
+        self.quality = quality
+        self.max_memory_items = max_memory_items
+        self.max_concurrency = max_concurrency
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    async def get_data_uri(self, url: str) -> str:
+        if url in self._memory:
+            self._memory.move_to_end(url)
+            self.hits += 1
+            return self._memory[url]
+        self.misses += 1
+
+        # concurrent requests for the same page share one download
+        task = self._in_flight.get(url)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._load(url))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda done: self._finish_load(url, done))
+        # shielded: a cancelled caller (e.g. a dropped figure prefetch) must not cancel the
+        # download other requests are waiting on
+        data_uri = await asyncio.shield(task)
+        self._remember(url, data_uri)
+        return data_uri
+
+    async def get_many(self, urls: List[str], return_exceptions: bool = False) -> List[str]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def get(url):
+            async with semaphore:
+                return await self.get_data_uri(url)
+
+        return await asyncio.gather(*[get(url) for url in urls], return_exceptions=return_exceptions)
+
+    async def prefetch(self, urls: List[str]) -> int:
+        """
+        Makes sure every page is processed on disk (and warm in memory, up to the LRU size).
+        Best effort: a page that fails is logged and loaded on first use instead. Returns the
+        number of pages that are ready.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = await self.get_many(urls, return_exceptions=True)
+        failed = [(url, result) for url, result in zip(urls, results) if isinstance(result, Exception)]
+        for url, e in failed[:5]:
+            print(f"Page image prefetch failed for {url}: {type(e).__name__}: {e}")
+        if failed:
+            print(f"{len(failed)} of {len(urls)} page images could not be prefetched; they will be loaded on first use")
+        return len(urls) - len(failed)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(f"{url}|{self.max_resolution}|{self.image_format}|{self.quality}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{_EXTENSIONS[self.image_format]}")
+
+    async def _load(self, url: str) -> str:
+        path = self._path(url)
+        if os.path.exists(path):
+            data = await asyncio.to_thread(_read_file, path)
+        else:
+            if url.startswith(("http://", "https://")):
+                response = await get_http_client().get(url)
+                response.raise_for_status()
+                content = response.content
+            else:
+                # local page renders (see document_parser.rasterizer)
+                content = await asyncio.to_thread(_read_file, url.removeprefix("file://"))
+            data = await asyncio.to_thread(self._process, content)
+            await asyncio.to_thread(_write_file, path, data)
+        return f"data:{_MIME_TYPES[self.image_format]};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    def _process(self, content: bytes) -> bytes:
+        image = Image.open(BytesIO(content))
+        if self.max_resolution:
+            image.thumbnail((self.max_resolution, self.max_resolution))
+        if self.image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        save_kwargs = {} if self.image_format == "PNG" else {"quality": self.quality}
+        image.save(buffered, format=self.image_format, **save_kwargs)
+        return buffered.getvalue()
+
+    def _finish_load(self, url: str, task: asyncio.Task):
+        self._in_flight.pop(url, None)
+        if not task.cancelled() and task.exception() is None:
+            # every waiter may have been cancelled meanwhile; the page is still worth keeping
+            self._remember(url, task.result())
+
+    def _remember(self, url: str, data_uri: str):
+        self._memory[url] = data_uri
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_store: Optional[PageImageStore] = None
+
+
+def get_page_image_store() -> PageImageStore:
+    """
+    Process-wide store configured from PAGE_IMAGE_CACHE_DIR, PAGE_IMAGE_MAX_RESOLUTION (0 keeps the
+    original size), PAGE_IMAGE_FORMAT, PAGE_IMAGE_QUALITY and PAGE_IMAGE_MEMORY_ITEMS.
+    """
+    global _store
+    if _store is None:
+        _store = PageImageStore(
+            os.getenv("PAGE_IMAGE_CACHE_DIR", ".cache/page_images"),
+            max_resolution=int(os.getenv("PAGE_IMAGE_MAX_RESOLUTION", "1600")) or None,
+            image_format=os.getenv("PAGE_IMAGE_FORMAT", "JPEG"),
+            quality=int(os.getenv("PAGE_IMAGE_QUALITY", "85")),
+            max_memory_items=int(os.getenv("PAGE_IMAGE_MEMORY_ITEMS", "128")),
+        )
+    return _store
+
+
+def load_image_urls(image_dict_path: str) -> List[str]:
+    import json
+    with open(image_dict_path, "r") as f:
+        return list(json.load(f).values())
+
+
+if __name__ == "__main__":
+    import sys
+
+    urls = load_image_urls(sys.argv[1] if len(sys.argv) > 1 else "data/image_dict.json")
+    store = get_page_image_store()
+    count = asyncio.run(store.prefetch(urls))
+    print(f"Prefetched {count} of {len(set(urls))} page images into {store.cache_dir}")
@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import math
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.kb_construction.mention_registry import normalise_mention
+from src.kb_retrieval.lexical_index import tokenize
+
+RERANK_DIR = "rerank"
+FEATURES_FILE = "features.json"
+
+FIGURE_LABEL_PATTERN = re.compile(r"\bfigure\s+\d+(?:\.\d+)*")
+FEATURES = ["prior", "coverage", "title", "mention", "mention_terms", "figure", "unit_summary"]
+DEFAULT_WEIGHTS = {
+    "prior": 1.0,          # 1 / log2(rank + 2) of the first-stage ranking
+    "coverage": 1.0,       # IDF-weighted share of the query terms found in the section
+    "title": 0.5,          # ... found in the section title
+    "mention": 1.0,        # IDF of the section's Mentions that occur verbatim in the query
+    "mention_terms": 0.5,  # IDF-weighted share of the query terms found in the section's Mentions
+    "figure": 1.0,         # the query names a figure of the section
+    "unit_summary": -0.3,  # Unit hit (summary only) rather than a Section
+}
+
+
+def section_features(title: str, content: str, mentions: List[str], figure_labels: List[str]) -> Dict[str, List[str]]:
+    """What the reranker needs to know about one section, computed once at build time."""
+    return {
+        "title_terms": sorted(set(tokenize(title))),
+        "terms": sorted(set(tokenize(title)) | set(tokenize(content))),
+        "mentions": sorted({normalise_mention(mention) for mention in mentions} - {""}),
+        "figures": sorted({label.lower() for label in figure_labels}),
+    }
+
+
+def build_rerank_features(units, directory: str) -> int:
+    """
+    Writes the per-section reranking features of every Section of `units` (query-independent
+    term sets, normalised HAS_MENTION mention keys, figure labels) and the document frequencies
+    they are weighted with into `<directory>/rerank`. Returns the number of sections.
+    """
+    features = {}
+    for unit in units:
+        for section in unit.sections:
+            features[section.id] = section_features(
+                section.section_title, section.content,
+                [mention.string for mention in section.mentions],
+                [fig.label for fig in section.fig_refs],
+            )
+    return write_rerank_features(features, directory)
+
+
+def write_rerank_features(features: Dict[str, Dict[str, List[str]]], directory: str) -> int:
+    term_df = Counter(term for entry in features.values() for term in entry["terms"])
+    mention_df = Counter(mention for entry in features.values() for mention in entry["mentions"])
+    path = os.path.join(directory, RERANK_DIR)
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, f"{FEATURES_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"num_sections": len(features), "term_df": term_df, "mention_df": mention_df,
+                   "sections": features}, f)
+    os.replace(tmp_path, os.path.join(path, FEATURES_FILE))
+    return len(features)
+
+
+class Reranker:
+    """
+    CPU-only, feature-based reranker for retrieved sections.
+
+    Every candidate is scored as a weighted sum of cheap features (see DEFAULT_WEIGHTS), most of
+    them read from the per-section cache written at build time, so a query costs a tokenisation
+    and a few set intersections per candidate. Candidates are scored in batches of `batch_size`;
+    once `budget_ms` is spent the remaining candidates keep their first-stage order behind the
+    scored ones, so a slow call degrades to the plain retrieval ranking instead of stalling.
+    """
+    def __init__(self, features: Dict[str, Any], weights: Optional[Dict[str, float]] = None,
+                 budget_ms: float = 20.0, batch_size: int = 32):
+        self.num_sections = max(features["num_sections"], 1)
+        self.term_df: Dict[str, int] = features["term_df"]
+        self.mention_df: Dict[str, int] = features["mention_df"]
+        self.weights = np.array([(weights or DEFAULT_WEIGHTS).get(name, 0.0) for name in FEATURES], dtype=np.float32)
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.sections = {
+            section_id: {
+                "title_terms": set(entry["title_terms"]),
+                "terms": set(entry["terms"]),
+                "mentions": entry["mentions"],
+                "mention_terms": {term for mention in entry["mentions"] for term in tokenize(mention)},
+                "figures": set(entry["figures"]),
+            }
+            for section_id, entry in features["sections"].items()
+        }
+        self.calls = 0
+        self.over_budget = 0
+        self.cache_misses = 0
+        self.total_ms = 0.0
+
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> "Reranker":
+        with open(os.path.join(directory, RERANK_DIR, FEATURES_FILE), "r") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _idf(self, df: int) -> float:
+        return math.log(1.0 + self.num_sections / max(df, 1))
+
+    def _section(self, hit: Dict[str, Any]) -> Dict[str, Any]:
+        cached = self.sections.get(hit.get("id"))
+        if cached is not None:
+            return cached
+        # not in the build's cache (e.g. a Unit hit): the text features can still be computed
+        self.cache_misses += 1
+        title = hit.get("section_title") or hit.get("unit_title") or ""
+        body = hit.get("content") or hit.get("summary") or ""
+        return {"title_terms": set(tokenize(title)), "terms": set(tokenize(title)) | set(tokenize(body)),
+                "mentions": [], "mention_terms": set(), "figures": set()}
+
+    def features(self, query: str, hits: List[Dict[str, Any]], start_rank: int = 0) -> np.ndarray:
+        """(len(hits), len(FEATURES)) feature matrix of a batch of candidates."""
+        query_terms = {term: self._idf(self.term_df.get(term, 0)) for term in set(tokenize(query))}
+        query_weight = sum(query_terms.values()) or 1.0
+        query_key = f" {normalise_mention(query)} "
+        query_figures = set(FIGURE_LABEL_PATTERN.findall(query.lower()))
+        max_idf = self._idf(1)
+
+        matrix = np.zeros((len(hits), len(FEATURES)), dtype=np.float32)
+        for row, hit in enumerate(hits):
+            section = self._section(hit)
+            mention_score = sum(self._idf(self.mention_df.get(mention, 0)) for mention in section["mentions"]
+                                if f" {mention} " in query_key)
+            matrix[row] = (
+                1.0 / math.log2(start_rank + row + 2),
+                sum(w for term, w in query_terms.items() if term in section["terms"]) / query_weight,
+                sum(w for term, w in query_terms.items() if term in section["title_terms"]) / query_weight,
+                min(mention_score / max_idf, 1.0),
+                sum(w for term, w in query_terms.items() if term in section["mention_terms"]) / query_weight,
+                1.0 if query_figures & section["figures"] else 0.0,
+                0.0 if "section_title" in hit else 1.0,
+            )
+        return matrix
+
+    def rerank(self, query: str, hits: List[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """`hits` (first-stage order) reordered by score; each gets a `rerank_score`."""
+        start = time.perf_counter()
+        self.calls += 1
+        scores = []
+        for batch_start in range(0, len(hits), self.batch_size):
+            if (time.perf_counter() - start) * 1e3 > self.budget_ms:
+                self.over_budget += 1
+                break
+            batch = hits[batch_start:batch_start + self.batch_size]
+            scores.extend((self.features(query, batch, start_rank=batch_start) @ self.weights).tolist())
+
+        order = sorted(range(len(scores)), key=lambda i: -scores[i]) + list(range(len(scores), len(hits)))
+        output = []
+        for i in order[:top_k]:
+            hit = dict(hits[i])
+            hit["rerank_score"] = scores[i] if i < len(scores) else None
+            output.append(hit)
+        self.total_ms += (time.perf_counter() - start) * 1e3
+        return output
+
+
+class RerankingRetrieval:
+    """
+    Wraps any retriever: fetches `candidates` sections, reranks them with `Reranker` and returns
+    the requested top_k. `default_top_k` is what callers should ask for when they have no
+    setting of their own; reranked, the first few sections are precise enough for the prompt.
+    """
+    def __init__(self, retriever, reranker: Reranker, candidates: int = 15, default_top_k: int = 4):
+        self.retriever = retriever
+        self.kb_loader = retriever.kb_loader
+        self.reranker = reranker
+        self.candidates = candidates
+        self.default_top_k = default_top_k
+
+    def query_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        hits = self.retriever.query_sections(query, top_k=max(top_k, self.candidates))
+        return self.reranker.rerank(query, hits, top_k)
+
+    async def aquery_sections(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        hits = await self.retriever.aquery_sections(query, top_k=max(top_k, self.candidates))
+        return self.reranker.rerank(query, hits, top_k)
+
+    async def aquery_sections_batch(self, queries: List[str], query_embeddings: List[List[float]],
+                                    top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        batch_hits = await self.retriever.aquery_sections_batch(queries, query_embeddings,
+                                                                top_k=max(top_k, self.candidates))
+        return [self.reranker.rerank(query, hits, top_k) for query, hits in zip(queries, batch_hits)]
+
+    def query_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        # the features need the query text
+        return self.retriever.query_sections_by_embedding(query_embedding, top_k=top_k)
+
+    async def aquery_sections_by_embedding(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        return await self.retriever.aquery_sections_by_embedding(query_embedding, top_k=top_k)
@@ -1,196 +1,427 @@
 from src.kb_construction.kb_loader import Neo4jKBLoader
 import os
+import re
+import asyncio
 from dotenv import load_dotenv
 
-from src.kb_construction.utils import get_embedding
+from src.kb_construction.utils import aget_embedding, get_async_openai_client
+from src.kb_construction.build_version import read_build_version
+from src.answer_generation.answer_cache import SemanticAnswerCache
+from src.answer_generation.context_builder import get_context_builder
+from src.batch_query import BatchQueryRunner
+from src.kb_construction.embedding_cache import get_embedding_cache
+from src.kb_construction.embedding_pipeline import EmbeddingPipeline
 from src.kb_retrieval.embedding_based_retriever import KBRetrieval
-from src.answer_generation.response_agent import generate_response, FinalAnswer, RequireFigureResponse, OutOfScope
+from src.kb_retrieval.backends import create_retriever
+from src.kb_retrieval.page_image_store import get_page_image_store
+from src.kb_retrieval.figure_index import get_figure_index, pick_document
+from src.answer_generation.response_agent import generate_response, stream_response, FinalAnswer, RequireFigureResponse, OutOfScope
 
 load_dotenv()
 
-def get_figures_by_labels(loader, figure_labels: str):
+_kb_retrieval = None
+_answer_cache = None
 
-    # figure_query_embedding = get_embedding(figure_query)
 
-    query = f"""
+def get_loader() -> Neo4jKBLoader:
+    """The loader shared by every request; all of them borrow sessions from one pooled driver."""
+    return get_kb_retrieval().kb_loader
+
+
+def get_kb_retrieval() -> KBRetrieval:
+    global _kb_retrieval
+    if _kb_retrieval is None:
+        _kb_retrieval = create_retriever(Neo4jKBLoader.shared())
+    return _kb_retrieval
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+        )
+    return _answer_cache
+
+
+async def get_figures_by_labels(loader, figure_labels: list[str], doc_ids: list[str] = None):
+    """FigureRefs by label, one per label: from the first of `doc_ids` that has it (any, without doc_ids)."""
+    query = """
     MATCH (node:FigureRef)
-    WHERE node.label IN {figure_labels}
-    RETURN node.label AS label, node.caption AS caption, node.page_number AS page_number
-    
+    WHERE node.label IN $labels AND ($doc_ids IS NULL OR node.doc_id IN $doc_ids)
+    RETURN node.label AS label, node.caption AS caption, node.page_number AS page_number, node.doc_id AS doc_id
     """
-    with loader.driver.session() as session:
-        result = session.run(
+    async with loader.async_session() as session:
+        result = await session.run(
             query,
+            labels=list(figure_labels),
+            doc_ids=list(doc_ids) if doc_ids else None,
         )
-        return [
-            {
+        by_label = {}
+        async for record in result:
+            by_label.setdefault(record["label"], []).append({
                 "label": record["label"],
                 "caption": record["caption"],
                 "page_number": record["page_number"],
-            }
-            for record in result
-        ]
-
+                "doc_id": record["doc_id"],
+            })
+    figures = [pick_document(by_label.get(label, []), doc_ids) for label in dict.fromkeys(figure_labels)]
+    return [fig for fig in figures if fig is not None]
 
 
-def get_page_images_by_numbers(loader, page_numbers):
-    query = f'''
+async def get_page_images_by_numbers(loader, pages):
+    """`pages`: (doc_id, page_number) pairs (doc_id None in a single-document KB) -> {pair: url}."""
+    query = '''
+    UNWIND $pages AS page
     MATCH (p:PageImage)
-    WHERE p.page_number IN {page_numbers}
-    RETURN p.page_number AS page_number, p.url AS url
+    WHERE p.page_number = page.page_number AND coalesce(p.doc_id, '') = coalesce(page.doc_id, '')
+    RETURN p.doc_id AS doc_id, p.page_number AS page_number, p.url AS url
     '''
-    with loader.driver.session() as session:
-        result = session.run(query, {"page_numbers": page_numbers})
-        return {record["page_number"]: record["url"] for record in result}
+    async with loader.async_session() as session:
+        result = await session.run(query, {"pages": [{"doc_id": doc_id, "page_number": page_number}
+                                                     for doc_id, page_number in pages]})
+        return {(record["doc_id"], record["page_number"]): record["url"] async for record in result}
 
 
-import requests
-from PIL import Image
-from io import BytesIO
-import base64
+def section_doc_ids(sections: list) -> list[str]:
+    """Documents of the retrieved sections, best first; figures and pages are resolved within them."""
+    return list(dict.fromkeys(section["doc_id"] for section in sections if section.get("doc_id")))
 
-def load_image_from_url(url: str) -> Image.Image:
-    """
-    Downloads an image from a web URL and returns a PIL Image object.
-    """
-    response = requests.get(url)
-    response.raise_for_status()
-    return Image.open(BytesIO(response.content))
 
-def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
+async def resolve_figure_pages(loader, figure_labels, doc_ids=None):
     """
-    Converts a PIL Image object to a base64 encoded string.
+    Figure labels -> (figures, {(doc_id, page_number): url}), from the build-time figure index when
+    it has them. With several books, each label is taken from the first of `doc_ids` that has it.
     """
-    buffered = BytesIO()
-    image.save(buffered, format=format)
-    img_bytes = buffered.getvalue()
-    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-    return img_b64
+    figure_index = get_figure_index()
+    if figure_index is not None and figure_index.covers(figure_labels, doc_ids):
+        return figure_index.resolve(figure_labels, doc_ids)
+
+    figures = await get_figures_by_labels(loader, figure_labels, doc_ids)
+    if not figures:
+        return [], {}
 
+    pages = list({(fig['doc_id'], fig['page_number']) for fig in figures})  # Unique
+    page_images = await get_page_images_by_numbers(loader, pages)
+    return figures, page_images
 
 
-def get_images_for_figures(loader, figure_query):
-    figures = get_figures_by_labels(loader, figure_query)
+async def get_images_for_figures(loader, figure_query, resolved=None, doc_ids=None):
+    figures, page_images = resolved if resolved is not None else await resolve_figure_pages(loader, figure_query, doc_ids)
     if not figures:
         return {}
 
-    page_numbers = list({fig['page_number'] for fig in figures})  # Unique
-    page_images = get_page_images_by_numbers(loader, page_numbers)
+    if resolved is not None:
+        # resolved speculatively for a superset of labels, keep only the requested figures' pages
+        wanted_pages = {(fig['doc_id'], fig['page_number']) for fig in figures if fig['label'] in set(figure_query)}
+        page_images = {page: url for page, url in page_images.items() if page in wanted_pages}
+
+    urls = [url for url in page_images.values() if url]
+    data_uris = await get_page_image_store().get_many(urls)
 
     images_info = []
-    for page_number, url in page_images.items():
+    for data_uri in data_uris:
     # for fig in figures:
     #     url = page_images.get(fig['page_number'])
-        if url:
-            image = load_image_from_url(url)
-            image_b64 = image_to_base64(image)
-            images_info.append({
-                # 'figure_label': fig['label'],
-                # 'caption': fig.get('caption', ''),
-                # 'page_number': fig['page_number'],
-                'image': image_b64
-            })
+        images_info.append({
+            # 'figure_label': fig['label'],
+            # 'caption': fig.get('caption', ''),
+            # 'page_number': fig['page_number'],
+            'data_uri': data_uri
+        })
     return images_info
 
 
-async def query(query: str):
-    loader = Neo4jKBLoader(os.getenv("NEO4J_URI"), os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD"))
+FIGURE_LABEL_PATTERN = re.compile(r"\bFigure\s+(\d+(?:\.\d+)?)", re.IGNORECASE)
 
-    kb_retrieval = KBRetrieval(loader)
+_prefetch_stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0}
 
-    query_embedding = get_embedding(query)
 
-    output = kb_retrieval.query_sections_by_embedding(query_embedding=query_embedding, top_k=15)[:10]
+def extract_figure_labels(text: str) -> list[str]:
+    """'... see figure 1.26 and Figure 1.4' -> ['Figure 1.26', 'Figure 1.4'] (normalised, in order)."""
+    return list(dict.fromkeys(f"Figure {number}" for number in FIGURE_LABEL_PATTERN.findall(text)))
 
-    def build_context(list_node_dict: list):
-        context = ""
-        for node in list_node_dict:
-            if 'unit_title' in node:
-                context += f"Unit Title: {node['unit_title']}\n"
-            if 'section_title' in node:
-                context += f"Section Title: {node['section_title']}\n"
 
-            if "content" in node:
-                context += f"Content: {node['content']}\n"
-            elif "summary" in node:
-                context += f"Summary: {node['summary']}\n"
-            context += "\n================\n"
+def get_prefetch_stats() -> dict:
+    resolved = _prefetch_stats["hits"] + _prefetch_stats["misses"]
+    return {**_prefetch_stats, "hit_rate": _prefetch_stats["hits"] / resolved if resolved else 0.0}
 
-        return context
-
-    context = build_context(output)
-
-    # print(context)
 
+class FigurePrefetch:
+    """
+    Speculatively resolves and warms the page images of figures that the answer is likely to need
+    (labels from the question first, then from the retrieved sections), concurrently with the
+    response agent. `take` uses the result when it covers the agent's labels, `cancel` drops it.
+    """
+    def __init__(self, loader, question: str, sections: list, max_figures: int = 8):
+        labels = extract_figure_labels(question)
+        for section in sections:
+            labels += extract_figure_labels(section.get("content", ""))
+        self.labels = list(dict.fromkeys(labels))[:max_figures]
+        self.doc_ids = section_doc_ids(sections)
+        self.loader = loader
+        self.task = None
+        if self.labels:
+            self.task = asyncio.create_task(self._run())
+            _prefetch_stats["started"] += 1
+
+    async def _run(self):
+        resolved = await resolve_figure_pages(self.loader, self.labels, self.doc_ids)
+        await get_page_image_store().get_many([url for url in resolved[1].values() if url])
+        return resolved
+
+    async def take(self, figure_labels: list[str]):
+        """Images for `figure_labels`, reusing the speculative work when it covers them."""
+        if self.task is not None and set(figure_labels) <= set(self.labels):
+            try:
+                resolved = await self.task
+            except Exception as e:
+                print(f"Figure prefetch failed: {e}")
+            else:
+                _prefetch_stats["hits"] += 1
+                return await get_images_for_figures(self.loader, figure_labels, resolved=resolved)
+        _prefetch_stats["misses"] += 1
+        return await get_images_for_figures(self.loader, figure_labels, doc_ids=self.doc_ids)
+
+    def cancel(self):
+        if self.task is None:
+            return
+        if not self.task.done():
+            self.task.cancel()
+            _prefetch_stats["cancelled"] += 1
+        elif not self.task.cancelled():
+            self.task.exception()  # mark a failed prefetch as seen, it is not needed anyway
+        self.task = None
+
+
+def build_figure_messages(context: str, query: str, images_info: list) -> list:
+    messages = []
+
+    # Add context and user query as text
+    if context:
+        messages.append(
+            {"role": "system", "content": "Answer user query based on the given context and the figures mentioned in the user query. Answer the question straightforward. The language you use must be: - Simple and clear - Friendly and suitable for young learners - Encouraging curiosity and understanding. Also if you use the figures information in the images, please note reference (figure label) also."}
+        )
+    messages.append(
+        {"role": "user", "content": f"Context: {context}\nUser Query: {query}"}
+    )
 
-    response = await generate_response(context, query)
+    for img in images_info:
+        # content = f"{img['figure_label']}: {img['caption']}" if img['caption'] else img['figure_label']
+        messages.append(
+            {
+                "role": "user",
+                "content": [
+                    # {"type": "text", "text": content},
+                    {"type": "image_url", "image_url": {"url": img['data_uri']}}
+                ]
+            }
+        )
+    return messages
+
+
+def retrieval_top_k(kb_retrieval) -> int:
+    # a reranking retriever needs only its first few sections (RERANK_TOP_K)
+    return int(os.getenv("RETRIEVAL_TOP_K", getattr(kb_retrieval, "default_top_k", 15)))
+
+
+class _QueryState:
+    """What `query` and `query_stream` share before generation starts."""
+    def __init__(self, query: str, bypass_cache: bool):
+        self.query = query
+        self.kb_retrieval = get_kb_retrieval()
+        self.loader = self.kb_retrieval.kb_loader
+        self.answer_cache = get_answer_cache()
+        self.kb_version = read_build_version()
+        self.use_answer_cache = not bypass_cache and os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+        self.query_embedding = None
+        self.cached = None
+        self.sections = []
+        self.context = ""
+
+    async def prepare(self):
+        """Embeds the question; returns a cached (answer, context) or retrieves the context."""
+        self.query_embedding = await aget_embedding(self.query)
+        cached = self.lookup_cache()
+        if cached is not None:
+            return cached
+
+        # by text, so a hybrid retriever can match it lexically; the embedding comes from the cache
+        sections = await self.kb_retrieval.aquery_sections(self.query, top_k=retrieval_top_k(self.kb_retrieval))
+        stats = self.use_sections(sections)
+        # prompt tokens per request; LOG_CONTEXT_STATS=0 turns it off
+        if os.getenv("LOG_CONTEXT_STATS", "1") == "1":
+            print(f"Context: {stats}")
+        return None
+
+    def lookup_cache(self):
+        if not self.use_answer_cache:
+            self.answer_cache.record_bypass()
+            return None
+        return self.answer_cache.lookup(self.query_embedding, self.kb_version)
+
+    def use_sections(self, sections: list):
+        self.sections = sections[:int(os.getenv("CONTEXT_SECTIONS", "10"))]
+        self.context, stats = get_context_builder().build(self.query, self.sections)
+        return stats
+
+    def start_figure_prefetch(self) -> FigurePrefetch:
+        return FigurePrefetch(self.loader, self.query, self.sections,
+                              max_figures=int(os.getenv("SPECULATIVE_MAX_FIGURES", "8")))
+
+    def remember(self, answer: str):
+        if self.use_answer_cache:
+            self.answer_cache.store(self.query, self.query_embedding, answer, self.context, self.kb_version)
+
+
+async def query(query: str, bypass_cache: bool = False):
+    state = _QueryState(query, bypass_cache)
+    cached = await state.prepare()
+    if cached is not None:
+        return cached
+    return await _answer(state), state.context
+
+
+async def _answer(state: _QueryState) -> str:
+    """Generates (and caches) the answer of a prepared, uncached question."""
+    query, context = state.query, state.context
+
+    prefetch = state.start_figure_prefetch()
+    try:
+        response = await generate_response(context, query)
+    except BaseException:
+        prefetch.cancel()
+        raise
+
+    if not isinstance(response, RequireFigureResponse):
+        prefetch.cancel()
 
     if isinstance(response, FinalAnswer):
-        return response.answer, context
+        response = response.answer
     elif isinstance(response, OutOfScope):
-        return response.message, context
+        response = response.message
     elif isinstance(response, RequireFigureResponse):
         figures_labels = response.figures_labels
-        images_info = get_images_for_figures(loader, figures_labels)
-
-        messages = []
+        images_info = await prefetch.take(figures_labels)
 
-        # Add context and user query as text
-        if context:
-            messages.append(
-                {"role": "system", "content": "Answer user query based on the given context and the figures mentioned in the user query. Answer the question straightforward. The language you use must be: - Simple and clear - Friendly and suitable for young learners - Encouraging curiosity and understanding. Also if you use the figures information in the images, please note reference (figure label) also."}
-            )
-        messages.append(
-            {"role": "user", "content": f"Context: {context}\nUser Query: {query}"}
+        client = get_async_openai_client()
+        response = await client.chat.completions.create(
+            model="gpt-4.1",
+            messages=build_figure_messages(context, query, images_info),
         )
+        response = response.choices[0].message.content
+
+    state.remember(response)
+    return response
+
 
-        for img in images_info:
-            # content = f"{img['figure_label']}: {img['caption']}" if img['caption'] else img['figure_label']
-            messages.append(
-                {
-                    "role": "user",
-                    "content": [
-                        # {"type": "text", "text": content},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img['image']}"}}
-                    ]
-                }
-            )
-        from openai import OpenAI
-        client = OpenAI()
-        response = client.chat.completions.create(
+async def query_stream(query: str, bypass_cache: bool = False):
+    """
+    Streaming variant of `query`: yields (answer so far, context) as tokens arrive, from the
+    response agent for `FinalAnswer` and from the vision model for `RequireFigureResponse`.
+    The last item holds the complete answer.
+    """
+    state = _QueryState(query, bypass_cache)
+    cached = await state.prepare()
+    if cached is not None:
+        yield cached
+        return
+    context = state.context
+
+    prefetch = state.start_figure_prefetch()
+    response = None
+    try:
+        async for response, is_final in stream_response(context, query):
+            if isinstance(response, FinalAnswer) and response.answer and not is_final:
+                # the agent has committed to a text answer, the figures will not be needed
+                prefetch.cancel()
+                yield response.answer, context
+    except BaseException:
+        prefetch.cancel()
+        raise
+
+    if response is None:
+        # the agent produced no output at all; nothing worth caching
+        prefetch.cancel()
+        answer = OutOfScope().message
+        yield answer, context
+        return
+    if isinstance(response, FinalAnswer):
+        # also when the answer only arrived as the final item
+        prefetch.cancel()
+        answer = response.answer
+    elif isinstance(response, OutOfScope):
+        prefetch.cancel()
+        answer = response.message
+    else:
+        images_info = await prefetch.take(response.figures_labels)
+
+        client = get_async_openai_client()
+        stream = await client.chat.completions.create(
             model="gpt-4.1",
-            messages=messages,
+            messages=build_figure_messages(context, query, images_info),
+            stream=True,
         )
-        response = response.choices[0].message.content
+        answer = ""
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                answer += chunk.choices[0].delta.content
+                yield answer, context
+
+    state.remember(answer)
+    yield answer, context
+
+async def query_batch(questions: list[str], indices: list[int] = None, concurrency: int = None,
+                      bypass_cache: bool = True):
+    """
+    Answers many questions with a `BatchQueryRunner`: the questions are embedded in batched
+    requests, retrieved `BATCH_RETRIEVAL_SIZE` at a time through the retriever's
+    `aquery_sections_batch` (one UNWIND query on Neo4j), and answered with at most `concurrency`
+    (BATCH_QUERY_CONCURRENCY) generations in flight. Yields a `BatchAnswer` per question as it
+    finishes. The answer cache is bypassed by default so evaluations measure the pipeline.
+    """
+    kb_retrieval = get_kb_retrieval()
+    pipeline = EmbeddingPipeline(cache=get_embedding_cache(),
+                                 max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "8")))
+
+    async def prepare(batch: list[str], embeddings: list) -> list:
+        states, pending = [], []
+        for question, embedding in zip(batch, embeddings):
+            state = _QueryState(question, bypass_cache)
+            state.query_embedding = embedding
+            state.cached = state.lookup_cache()
+            if state.cached is None:
+                pending.append(state)
+            states.append(state)
+        if pending:
+            batch_sections = await kb_retrieval.aquery_sections_batch(
+                [state.query for state in pending], [state.query_embedding for state in pending],
+                top_k=retrieval_top_k(kb_retrieval))
+            for state, sections in zip(pending, batch_sections):
+                state.use_sections(sections)
+        return states
+
+    async def answer(state: _QueryState):
+        if state.cached is not None:
+            return state.cached
+        return await _answer(state), state.context
+
+    runner = BatchQueryRunner(
+        pipeline.embed, prepare, answer,
+        concurrency=concurrency or int(os.getenv("BATCH_QUERY_CONCURRENCY", "8")),
+        retrieval_batch_size=int(os.getenv("BATCH_RETRIEVAL_SIZE", "64")),
+    )
+    async for result in runner.run(questions, indices):
+        yield result
 
-    return response, context
 
 if __name__ == "__main__":
-    import asyncio
     res = asyncio.run(query(
         """
 Figure 1.26 shows a typical plant cell. Which of the numbered structures are partially permeable?        """
     ))
 
     print(res)
-    #
-    # import pandas as pd
-    #
-    # df = pd.read_csv("/home/ju/PycharmProjects/heyhi/data/testset.csv")
-    #
-    # queries = df['user_input'].to_list()
-    #
-    # res_buffer = []
-    # context_buffer = []
-    # for query_string in queries:
-    #     print(query_string)
-    #     print("=====================")
-    #     res, context = asyncio.run(query(query_string))
-    #     print(res)
-    #     res_buffer.append(res)
-    #     context_buffer.append(context)
-    #     print("=====================")
-    #
-    # df['answer'] = res_buffer
-    # df['contexts'] = context_buffer
-    # df.to_csv("/home/ju/PycharmProjects/heyhi/data/test_data_with_answer.csv", index=False)
+    # for many questions (e.g. the RAGAS set): python -m src.batch_query data/evaluation_data.csv
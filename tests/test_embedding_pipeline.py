@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from src.kb_construction.embedding_cache import EmbeddingCache
+from src.kb_construction.embedding_pipeline import EmbeddingPipeline, FakeEmbeddingBackend
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: str = None):
+        super().__init__(message)
+        if retry_after is not None:
+            self.response = type("Response", (), {"headers": {"retry-after": retry_after}})()
+
+
+class RecordingBackend(FakeEmbeddingBackend):
+    """Fake backend that remembers every batch it was sent and answers 429 to the first few."""
+    def __init__(self, rate_limit_first: int = 0, retry_after: str = None, error: Exception = None):
+        super().__init__(dim=8)
+        self.rate_limit_first = rate_limit_first
+        self.retry_after = retry_after
+        self.error = error
+        self.batches = []
+
+    async def embed_batch(self, texts):
+        self.batches.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        if len(self.batches) <= self.rate_limit_first:
+            raise RateLimitError("429 Too Many Requests", self.retry_after)
+        return await super().embed_batch(texts)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records backoff delays instead of waiting them out."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, result=None):
+        delays.append(delay)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def test_batches_respect_size_and_token_limits():
+    backend = RecordingBackend()
+    pipeline = EmbeddingPipeline(backend, max_batch_size=3, max_batch_tokens=1_000)
+    texts = [f"text {i}" for i in range(10)]
+
+    vectors = asyncio.run(pipeline.embed(texts))
+
+    assert [len(batch) for batch in backend.batches] == [3, 3, 3, 1]
+    assert vectors == [backend.embed_one(text) for text in texts]
+    assert pipeline.stats.requests == 4
+
+    # 300 tokens each: three fit under 1000, the fourth starts a new batch
+    pipeline.count_tokens = lambda text: 300
+    assert [len(batch) for batch in pipeline.make_batches(texts[:4])] == [3, 1]
+
+
+def test_duplicates_and_cached_texts_are_sent_once(tmp_path):
+    backend = RecordingBackend()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    pipeline = EmbeddingPipeline(backend, cache=cache)
+    texts = ["alpha", "beta", "alpha", "gamma", "beta"]
+
+    vectors = asyncio.run(pipeline.embed(texts))
+
+    assert backend.batches == [["alpha", "beta", "gamma"]]
+    assert vectors[0] == vectors[2] and vectors[1] == vectors[4]
+    assert pipeline.stats.texts == 5 and pipeline.stats.unique_texts == 3
+
+    vectors_again = asyncio.run(pipeline.embed(["gamma", "delta", "alpha"]))
+
+    assert backend.batches[1:] == [["delta"]]
+    assert pipeline.stats.cached_texts == 2
+    assert vectors_again == [vectors[3], backend.embed_one("delta"), vectors[0]]
+    cache.close()
+
+
+def test_rate_limit_is_retried_with_backoff(sleeps):
+    backend = RecordingBackend(rate_limit_first=3)
+    pipeline = EmbeddingPipeline(backend, base_backoff_seconds=1.0)
+
+    vectors = asyncio.run(pipeline.embed(["alpha", "beta"]))
+
+    assert vectors == [backend.embed_one("alpha"), backend.embed_one("beta")]
+    assert len(backend.batches) == 4 and pipeline.stats.retries == 3
+    # base * 2^attempt, jittered by a factor in [0.5, 1.5)
+    backoffs = [delay for delay in sleeps if delay > 0]
+    for attempt, delay in enumerate(backoffs):
+        assert 0.5 * 2 ** attempt <= delay < 1.5 * 2 ** attempt
+    assert len(backoffs) == 3
+
+
+def test_retry_after_header_is_honoured(sleeps):
+    backend = RecordingBackend(rate_limit_first=1, retry_after="7")
+    pipeline = EmbeddingPipeline(backend, base_backoff_seconds=1.0)
+
+    asyncio.run(pipeline.embed(["alpha"]))
+
+    assert [delay for delay in sleeps if delay > 0] == [7.0]
+
+
+def test_gives_up_after_max_retries_and_on_other_errors(sleeps):
+    backend = RecordingBackend(rate_limit_first=10)
+    pipeline = EmbeddingPipeline(backend, max_retries=2, base_backoff_seconds=0.01)
+    with pytest.raises(RateLimitError):
+        asyncio.run(pipeline.embed(["alpha"]))
+    assert len(backend.batches) == 3
+
+    backend = RecordingBackend(error=ValueError("bad input"))
+    pipeline = EmbeddingPipeline(backend)
+    with pytest.raises(ValueError):
+        asyncio.run(pipeline.embed(["alpha"]))
+    assert len(backend.batches) == 1
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from src.kb_construction import scheduler as scheduler_module
+from src.kb_construction.scheduler import ExtractionScheduler
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeAgent:
+    """Records how many calls are in flight and when (on `clock`) each call starts."""
+    def __init__(self, seconds: float = 0.01, rate_limit_first: int = 0, clock=None):
+        self.seconds = seconds
+        self.rate_limit_first = rate_limit_first
+        self.clock = clock
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def run(self, text: str):
+        self.calls.append((self.clock.monotonic() if self.clock else None, text))
+        if len(self.calls) <= self.rate_limit_first:
+            raise RateLimitError("429 Too Many Requests")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.seconds)
+        finally:
+            self.in_flight -= 1
+        return text.upper()
+
+
+class FakeClock:
+    """Virtual time for the token budget: sleeping advances the clock instead of waiting."""
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, result=None):
+        clock.now += max(delay, 0)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(scheduler_module, "time", clock)
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return clock
+
+
+def test_concurrency_cap():
+    agent = FakeAgent(seconds=0.01)
+    scheduler = ExtractionScheduler(max_concurrency=3, tokens_per_minute=10_000_000)
+    texts = [f"unit {i} " + "x" * (i * 10) for i in range(20)]
+
+    summary = asyncio.run(scheduler.run(texts, agent.run))
+
+    assert agent.max_in_flight == 3
+    assert [result.output for result in summary.results] == [text.upper() for text in texts]
+
+
+def test_token_budget_paces_jobs(clock):
+    # answers instantly, so each call starts when the budget admits it
+    agent = FakeAgent(seconds=0.0, clock=clock)
+    scheduler = ExtractionScheduler(max_concurrency=8, tokens_per_minute=1_000)
+    texts = ["x" * 796 for _ in range(6)]  # 200 input + 200 output tokens each: two fit a minute
+
+    summary = asyncio.run(scheduler.run(texts, agent.run))
+
+    assert all(result.ok for result in summary.results)
+    starts = sorted(start for start, _ in agent.calls)
+    for start in starts:
+        in_window = [other for other in starts if start <= other < start + 60]
+        assert sum(scheduler.estimate_tokens(texts[0]) for _ in in_window) <= 1_000
+    assert starts[-1] >= 120
+
+
+def test_rate_limit_is_retried(clock):
+    agent = FakeAgent(rate_limit_first=2, clock=clock)
+    scheduler = ExtractionScheduler(max_concurrency=1, tokens_per_minute=10_000_000)
+
+    summary = asyncio.run(scheduler.run(["only unit"], agent.run))
+
+    assert summary.results[0].ok and summary.results[0].attempts == 3
+    assert summary.rate_limited == 2
+
+
+def test_generator_is_sorted_per_window():
+    agent = FakeAgent(seconds=0.0)
+    scheduler = ExtractionScheduler(max_concurrency=1, tokens_per_minute=10_000_000, sort_window=3)
+    texts = ["a", "bbb", "cc", "dddd", "e", "ffffff"]
+
+    summary = asyncio.run(scheduler.run(iter(texts), agent.run))
+
+    assert [text for _, text in agent.calls] == ["bbb", "cc", "a", "ffffff", "dddd", "e"]
+    assert [result.output for result in summary.results] == [text.upper() for text in texts]